@@ -0,0 +1,618 @@
+# -*- coding: utf-8 -*-
+"""
+小志总数据 / 标签数据统计内核
+
+对列式表只遍历一次，按 pkgName 分组同时更新各平台初始数据和用户数据的统计量：
+使用人数（去重设备）、给出指令次数、有帮助/无帮助次数、有图片无文字数量和无指令总数，
+以及标签数据的问题/标签出现次数。
+每个单元格的 str(...).strip() 只计算一次；字典编码列对每个不同的值只计算一次。
+
+统计量（StatsAccumulator、LabelAccumulator）可以合并，追加增量数据时只统计新增的行再合并到原来的统计量。
+DeviceRollup 按 (pkgName, deviceId) 预聚合，修改需要去除的设备 ID 时不用重新遍历所有行；
+精确计数时统计量也由它得到（compute_device_rollup），导入时只遍历一次。
+"""
+import hashlib
+import operator
+from array import array
+from collections import Counter
+from itertools import compress, count, repeat
+
+from columnar import DictColumn, TableView
+from hyperloglog import HyperLogLog
+
+# directives 单元格分类
+DIRECTIVES_MISSING = 0   # 没有该列（行字典中没有 directives 键）
+DIRECTIVES_EMPTY = 1     # 有该列但为空
+DIRECTIVES_PRESENT = 2   # 有指令
+
+# userContent 单元格分类（按位组合）
+CONTENT_BLANK = 1        # 有该列但为空
+CONTENT_EXCLUDED = 2     # 在需去除的数据中
+
+
+def _column_iter(table, name, indices, transform=None):
+    """按 indices 顺序迭代列值；字典编码列对每个不同的值只调用一次 transform，缺失的列按 None 处理"""
+    column = table.column(name)
+    if column is None:
+        return repeat(transform(None) if transform else None, len(indices))
+    if isinstance(column, DictColumn):
+        values = column.dictionary if transform is None else [transform(v) for v in column.dictionary]
+        return map(values.__getitem__, map(column.codes.__getitem__, indices))
+    cells = map(column.values.__getitem__, indices)
+    return cells if transform is None else map(transform, cells)
+
+
+def _is_blank(value):
+    return str(value).strip() == ''
+
+
+def _classify_directives(value):
+    if value is None:
+        return DIRECTIVES_MISSING
+    return DIRECTIVES_EMPTY if _is_blank(value) else DIRECTIVES_PRESENT
+
+
+def _has_image(value):
+    return value is not None and not _is_blank(value)
+
+
+def _content_classifier(filter_user_contents):
+    def classify(value):
+        if value is None:
+            return 0
+        flags = CONTENT_BLANK if _is_blank(value) else 0
+        if filter_user_contents is not None and str(value) in filter_user_contents:
+            flags |= CONTENT_EXCLUDED
+        return flags
+    return classify
+
+
+# 使用人数的计算方式：精确（保存所有 deviceId）或近似（HyperLogLog，内存固定）
+COUNT_EXACT = 'exact'
+COUNT_APPROXIMATE = 'approximate'
+COUNT_MODES = (COUNT_EXACT, COUNT_APPROXIMATE)
+
+
+class StatsAccumulator:
+    """一组数据（初始数据或用户数据）的统计量，approximate 为 True 时使用人数用 HyperLogLog 近似计数"""
+
+    def __init__(self, approximate=False):
+        self.rows = 0
+        self.device_ids = HyperLogLog() if approximate else set()
+        self.directives_count = 0
+        self.helpful_count = 0
+        self.unhelpful_count = 0
+        # 初始数据为有图片无文字数量，用户数据为无指令总数
+        self.extra_count = 0
+
+    def add(self, device_id, directives, avail):
+        self.rows += 1
+        if device_id:
+            self.device_ids.add(device_id)
+        if directives == DIRECTIVES_PRESENT:
+            self.directives_count += 1
+        if avail == '有帮助':
+            self.helpful_count += 1
+        elif avail == '无帮助':
+            self.unhelpful_count += 1
+
+    def merge(self, other):
+        """合并另一组数据的统计量"""
+        self.rows += other.rows
+        self.device_ids |= other.device_ids
+        self.directives_count += other.directives_count
+        self.helpful_count += other.helpful_count
+        self.unhelpful_count += other.unhelpful_count
+        self.extra_count += other.extra_count
+
+    def to_stats(self):
+        return _stats_dict(self.rows, len(self.device_ids), self.directives_count, self.helpful_count,
+                           self.unhelpful_count, self.extra_count)
+
+
+def _stats_dict(rows, devices, directives_count, helpful_count, unhelpful_count, extra_count):
+    return {
+        '总数据量': rows,
+        '使用人数': devices,
+        '给出指令次数': directives_count,
+        '有帮助次数': helpful_count,
+        '无帮助次数': unhelpful_count,
+        '有图片无文字数量/无指令总数': f"{extra_count}"
+    }
+
+
+class LabelAccumulator:
+    """一个平台的标签统计量：问题/标签出现次数（按首次出现顺序）和「功能使用」问题对应的 userContent"""
+
+    def __init__(self, question_counts=None, function_contents=None):
+        self.question_counts = question_counts if question_counts is not None else {}
+        self.function_contents = function_contents if function_contents is not None else []
+
+    def merge(self, other):
+        """合并另一组数据的统计量，新出现的标签排在后面"""
+        for question, count in other.question_counts.items():
+            self.question_counts[question] = self.question_counts.get(question, 0) + count
+        self.function_contents.extend(other.function_contents)
+
+
+def compute_analyze_accumulators(table, pkg_names, device_id_list, filter_user_contents=None, view=None,
+                                 approximate=False):
+    """
+    与 compute_analyze_stats 相同，返回可合并的统计量 {pkg_name: (initial, user)} 和用户数据视图
+
+    view 为要统计的行（追加数据时为去重后的新增行），默认为整个表；approximate 见 StatsAccumulator。
+    """
+    excluded_devices = frozenset(device_id_list)
+    accumulators = {pkg_name: (StatsAccumulator(approximate), StatsAccumulator(approximate))
+                    for pkg_name in pkg_names}
+    user_indices = array('l')
+
+    # 先按 pkgName 的字典编码选出这些平台的行，其余单元格只对这些行读取一次
+    indices = (view if view is not None else table.view()).where('pkgName', lambda v: v in accumulators).indices
+    rows = zip(
+        indices,
+        _column_iter(table, 'pkgName', indices, accumulators.get),
+        _column_iter(table, 'deviceId', indices),
+        _column_iter(table, 'directives', indices, _classify_directives),
+        _column_iter(table, 'avail', indices),
+        _column_iter(table, 'imageUrls', indices, _has_image),
+        _column_iter(table, 'userContent', indices, _content_classifier(filter_user_contents)),
+    )
+
+    for i, (initial, user), device_id, directives, avail, has_image, content in rows:
+        if content & CONTENT_EXCLUDED:
+            continue
+
+        image_without_text = has_image and content & CONTENT_BLANK
+        in_user = not excluded_devices or (device_id is not None and device_id not in excluded_devices)
+
+        if image_without_text:
+            initial.extra_count += 1
+        else:
+            initial.add(device_id, directives, avail)
+
+        if in_user:
+            if directives == DIRECTIVES_EMPTY:
+                user.extra_count += 1
+            if not image_without_text:
+                user.add(device_id, directives, avail)
+                user_indices.append(i)
+
+    return accumulators, TableView(table, user_indices)
+
+
+def compute_analyze_stats(table, pkg_names, device_id_list, filter_user_contents=None):
+    """
+    单次遍历计算小志总数据统计，pkg_names 中的每个平台分别累计
+
+    返回 (stats_by_pkg, user_data)：stats_by_pkg[pkg_name] 为 (initial_stats, user_stats)，
+    user_data 为所有平台用户数据（剔除后）的行视图，供 SQL 查询加载使用。
+    """
+    accumulators, user_data = compute_analyze_accumulators(table, pkg_names, device_id_list, filter_user_contents)
+    stats_by_pkg = {pkg_name: (initial.to_stats(), user.to_stats())
+                    for pkg_name, (initial, user) in accumulators.items()}
+    return stats_by_pkg, user_data
+
+
+def compute_label_counts(table, pkg_names, device_id_list, filter_user_contents=None, view=None):
+    """
+    单次遍历统计每个平台的问题/标签出现次数
+
+    返回 (counts_by_pkg, filtered_by_pkg, filtered_data)：counts_by_pkg[pkg_name] 为
+    {标签: 数量}（按首次出现顺序），filtered_by_pkg[pkg_name] 为该平台过滤后的行视图，
+    filtered_data 为所有平台过滤后的行视图。view 为要统计的行，默认为整个表。
+    """
+    excluded_devices = frozenset(device_id_list)
+    counts_by_pkg = {pkg_name: {} for pkg_name in pkg_names}
+    indices_by_pkg = {pkg_name: array('l') for pkg_name in pkg_names}
+    filtered_indices = array('l')
+
+    indices = (view if view is not None else table.view()).where('pkgName', lambda v: v in counts_by_pkg).indices
+    rows = zip(
+        indices,
+        _column_iter(table, 'pkgName', indices),
+        _column_iter(table, 'deviceId', indices),
+        _column_iter(table, 'question', indices, lambda v: str(v) if v else None),
+        _column_iter(table, 'imageUrls', indices, _has_image),
+        _column_iter(table, 'userContent', indices, _content_classifier(filter_user_contents)),
+    )
+
+    for i, pkg_name, device_id, question, has_image, content in rows:
+        if content & CONTENT_EXCLUDED or (has_image and content & CONTENT_BLANK):
+            continue
+        if excluded_devices and (device_id is None or device_id in excluded_devices):
+            continue
+
+        if question is not None:
+            question_counts = counts_by_pkg[pkg_name]
+            question_counts[question] = question_counts.get(question, 0) + 1
+        indices_by_pkg[pkg_name].append(i)
+        filtered_indices.append(i)
+
+    filtered_by_pkg = {pkg_name: TableView(table, pkg_indices)
+                       for pkg_name, pkg_indices in indices_by_pkg.items()}
+    return counts_by_pkg, filtered_by_pkg, TableView(table, filtered_indices)
+
+
+def collect_function_contents(view):
+    """question 为「功能使用」的行中非空的 userContent，按行的顺序"""
+    rows = view.where('question', lambda v: (v if v is not None else '').strip() == '功能使用')
+    return [user_content for user_content in rows.values('userContent') if user_content]
+
+
+def compute_label_accumulators(table, pkg_names, device_id_list, filter_user_contents=None, view=None):
+    """与 compute_label_counts 相同，返回可合并的统计量 {pkg_name: LabelAccumulator} 和所有平台过滤后的行视图"""
+    counts_by_pkg, filtered_by_pkg, filtered_data = compute_label_counts(
+        table, pkg_names, device_id_list, filter_user_contents, view)
+    accumulators = {pkg_name: LabelAccumulator(counts_by_pkg[pkg_name],
+                                               collect_function_contents(filtered_by_pkg[pkg_name]))
+                    for pkg_name in pkg_names}
+    return accumulators, filtered_data
+
+
+# DeviceRollup 中每个设备部分统计量的下标
+ROLLUP_ROWS = 0                 # 行数（不含有图片无文字的行）
+ROLLUP_DIRECTIVES = 1           # 给出指令次数
+ROLLUP_HELPFUL = 2              # 有帮助次数
+ROLLUP_UNHELPFUL = 3            # 无帮助次数
+ROLLUP_IMAGE_WITHOUT_TEXT = 4   # 有图片无文字数量
+ROLLUP_NO_DIRECTIVES = 5        # 无指令总数（含有图片无文字的行）
+ROLLUP_FIELDS = 6
+
+
+def _is_function_question(value):
+    return isinstance(value, str) and value.strip() == '功能使用'
+
+
+def _rollup_accumulator(counts, extra_field, device_ids):
+    accumulator = StatsAccumulator()
+    accumulator.rows = counts[ROLLUP_ROWS]
+    accumulator.device_ids = device_ids
+    accumulator.directives_count = counts[ROLLUP_DIRECTIVES]
+    accumulator.helpful_count = counts[ROLLUP_HELPFUL]
+    accumulator.unhelpful_count = counts[ROLLUP_UNHELPFUL]
+    accumulator.extra_count = counts[extra_field]
+    return accumulator
+
+
+class DeviceRollup:
+    """
+    按 (pkgName, deviceId) 预聚合的统计量：每个设备的部分统计量和标签数量，以及每个平台的合计
+
+    去除设备后的用户数据为合计减去被去除设备（和没有 deviceId 的行）的部分统计量，
+    计算量与去除的设备数成正比，结果与逐行统计（compute_analyze_accumulators、compute_label_accumulators）完全一致。
+    标签按首次出现的顺序排列：label_heads 记录每个标签首次出现的行和设备，该设备被去除时
+    再从 label_firsts（每个标签在每个设备中首次出现的行号）中查找。
+    """
+
+    def __init__(self, pkg_names):
+        # 已统计的行号范围，合并时另一组统计量的行号排在后面
+        self.span = 0
+        self.totals = {pkg_name: [0] * ROLLUP_FIELDS for pkg_name in pkg_names}
+        # 有数据行（不含有图片无文字的行）的非空设备数
+        self.device_counts = dict.fromkeys(pkg_names, 0)
+        self.partials = {pkg_name: {} for pkg_name in pkg_names}
+        # {pkgName: {标签: 数量}}，按首次出现的顺序
+        self.label_totals = {pkg_name: {} for pkg_name in pkg_names}
+        # {(pkgName, 标签): (首次出现的行号, 设备)}
+        self.label_heads = {}
+        # {(pkgName, 设备, 标签): 数量} 和 {(pkgName, 设备, 标签): 首次出现的行号}
+        self.label_counts = {}
+        self.label_firsts = {}
+        # 「功能使用」问题的 (设备, userContent)，按行的顺序
+        self.function_rows = {pkg_name: [] for pkg_name in pkg_names}
+
+    def __contains__(self, pkg_name):
+        return pkg_name in self.totals
+
+    def _add_partial(self, pkg_name, device_id, counts):
+        partial = self.partials[pkg_name].get(device_id)
+        if partial is None:
+            partial = self.partials[pkg_name][device_id] = [0] * ROLLUP_FIELDS
+        if device_id and not partial[ROLLUP_ROWS] and counts[ROLLUP_ROWS]:
+            self.device_counts[pkg_name] += 1
+        totals = self.totals[pkg_name]
+        for field, count in enumerate(counts):
+            partial[field] += count
+            totals[field] += count
+
+    def merge(self, other):
+        """合并另一组统计量（行号在已统计的行之后）"""
+        for pkg_name in other.totals:
+            for device_id, counts in other.partials[pkg_name].items():
+                self._add_partial(pkg_name, device_id, counts)
+            # 另一组中的标签按首次出现的顺序排列，新出现的标签排在后面
+            label_totals = self.label_totals[pkg_name]
+            for label, count in other.label_totals[pkg_name].items():
+                label_totals[label] = label_totals.get(label, 0) + count
+            self.function_rows[pkg_name].extend(other.function_rows[pkg_name])
+        for key, (i, device_id) in other.label_heads.items():
+            self.label_heads.setdefault(key, (self.span + i, device_id))
+        for key, count in other.label_counts.items():
+            self.label_counts[key] = self.label_counts.get(key, 0) + count
+        for key, i in other.label_firsts.items():
+            self.label_firsts.setdefault(key, self.span + i)
+        self.span += other.span
+
+    def _removed(self, pkg_name, excluded_devices):
+        """被去除的设备的部分统计量：列表中的设备和没有 deviceId 的行"""
+        partials = self.partials[pkg_name]
+        for device_id in (*excluded_devices, None):
+            partial = partials.get(device_id)
+            if partial is not None:
+                yield device_id, partial
+
+    def analyze_stats(self, pkg_name, device_id_list):
+        """与 compute_analyze_stats 相同的 (initial_stats, user_stats)"""
+        excluded_devices = frozenset(device_id_list)
+        totals = self.totals[pkg_name]
+        devices = self.device_counts[pkg_name]
+        initial_stats = _stats_dict(totals[ROLLUP_ROWS], devices, totals[ROLLUP_DIRECTIVES], totals[ROLLUP_HELPFUL],
+                                    totals[ROLLUP_UNHELPFUL], totals[ROLLUP_IMAGE_WITHOUT_TEXT])
+        user = list(totals)
+        if excluded_devices:
+            for device_id, partial in self._removed(pkg_name, excluded_devices):
+                if device_id and partial[ROLLUP_ROWS]:
+                    devices -= 1
+                for field, count in enumerate(partial):
+                    user[field] -= count
+        user_stats = _stats_dict(user[ROLLUP_ROWS], devices, user[ROLLUP_DIRECTIVES], user[ROLLUP_HELPFUL],
+                                 user[ROLLUP_UNHELPFUL], user[ROLLUP_NO_DIRECTIVES])
+        return initial_stats, user_stats
+
+    def stats_accumulators(self, pkg_name, device_id_list):
+        """与 compute_analyze_accumulators（精确计数）相同的 (initial, user) StatsAccumulator"""
+        excluded_devices = frozenset(device_id_list)
+        totals = self.totals[pkg_name]
+        user = list(totals)
+        if excluded_devices:
+            for _, partial in self._removed(pkg_name, excluded_devices):
+                for field, count in enumerate(partial):
+                    user[field] -= count
+        device_ids = {device_id for device_id, partial in self.partials[pkg_name].items()
+                      if device_id and partial[ROLLUP_ROWS]}
+        return (_rollup_accumulator(totals, ROLLUP_IMAGE_WITHOUT_TEXT, device_ids),
+                _rollup_accumulator(user, ROLLUP_NO_DIRECTIVES, device_ids - excluded_devices))
+
+    def label_accumulator(self, pkg_name, device_id_list):
+        """与 compute_label_accumulators 相同的 LabelAccumulator（问题/标签出现次数和「功能使用」的 userContent）"""
+        excluded_devices = frozenset(device_id_list)
+        label_totals = self.label_totals[pkg_name]
+        function_rows = self.function_rows[pkg_name]
+        if not excluded_devices:
+            return LabelAccumulator(dict(label_totals), [content for _, content in function_rows])
+
+        counts = dict(label_totals)
+        removed = excluded_devices | {None}
+        for device_id in removed:
+            for label in label_totals:
+                count = self.label_counts.get((pkg_name, device_id, label))
+                if count:
+                    counts[label] -= count
+
+        # 在没有被去除的设备中首次出现的行号：首次出现的设备被去除时再查找所有设备
+        firsts = {}
+        for label, count in counts.items():
+            i, device_id = self.label_heads[pkg_name, label]
+            if count > 0 and device_id is not None and device_id not in excluded_devices:
+                firsts[label] = i
+        if len(firsts) < sum(count > 0 for count in counts.values()):
+            for (key_pkg_name, device_id, label), i in self.label_firsts.items():
+                if (key_pkg_name == pkg_name and counts[label] > 0 and device_id not in removed
+                        and i < firsts.get(label, self.span)):
+                    firsts[label] = i
+
+        kept = sorted((i, label) for label, i in firsts.items())
+        function_contents = [content for device_id, content in function_rows
+                             if device_id is not None and device_id not in excluded_devices]
+        return LabelAccumulator({label: counts[label] for _, label in kept}, function_contents)
+
+
+def build_device_rollup(table, pkg_names, filter_user_contents=None, view=None):
+    """构建 pkg_names 中各平台的 DeviceRollup（部分统计量和标签），view 为要统计的行，默认为整个表"""
+    return compute_device_rollup(table, pkg_names, (), filter_user_contents, view)[0]
+
+
+# avail 单元格分类
+AVAIL_OTHER = 0
+AVAIL_HELPFUL = 1
+AVAIL_UNHELPFUL = 2
+
+
+def _classify_avail(value):
+    if value == '有帮助':
+        return AVAIL_HELPFUL
+    return AVAIL_UNHELPFUL if value == '无帮助' else AVAIL_OTHER
+
+
+def _label(value):
+    return str(value) if value else None
+
+
+def _row_states(table, indices, filter_user_contents):
+    """
+    每行的 userContent 分类只保留影响统计的位：CONTENT_EXCLUDED，以及有图片时的 CONTENT_BLANK（有图片无文字）
+
+    只用 operator 组合 map，不经过逐行的 Python 代码
+    """
+    has_image = _column_iter(table, 'imageUrls', indices, _has_image)
+    content = _column_iter(table, 'userContent', indices, _content_classifier(filter_user_contents))
+    # CONTENT_BLANK 为 1，True | CONTENT_EXCLUDED 即 CONTENT_BLANK | CONTENT_EXCLUDED
+    return map(operator.and_, content, map(operator.or_, has_image, repeat(CONTENT_EXCLUDED)))
+
+
+def compute_device_rollup(table, pkg_names, device_id_list, filter_user_contents=None, view=None, selected=None,
+                          stats=True, labels=True):
+    """
+    构建 pkg_names 中各平台的 DeviceRollup，同时选出 selected 中平台（默认为 pkg_names）去除设备和过滤数据后的行
+
+    stats、labels 为是否预聚合部分统计量（小志总数据使用）和标签（小志标签数据使用），不需要的列不读取。
+    返回 (DeviceRollup, 视图)，视图与 compute_analyze_accumulators 的用户数据视图、
+    compute_label_accumulators 过滤后的视图相同，统计量由 DeviceRollup.stats_accumulators、label_accumulator 得到。
+
+    每列只做一次分类，之后用 operator、compress 组合出每个统计量对应的行，再用 Counter 按设备计数，
+    都不经过逐行的 Python 代码；只有每个设备（和「功能使用」的行）需要 Python 代码处理。
+    """
+    rollup = DeviceRollup(pkg_names)
+    rollup.span = table.nrows
+    excluded_devices = frozenset(device_id_list)
+    selected = frozenset(selected if selected is not None else pkg_names)
+
+    indices = (view if view is not None else table.view()).where('pkgName', lambda v: v in rollup).indices
+    pkgs = list(_column_iter(table, 'pkgName', indices))
+    devices = list(_column_iter(table, 'deviceId', indices))
+    # 每个 (平台, 设备) 的编号（首次出现的位置），按整数计数比按元组快
+    pair_ids = {}
+    row_pairs = list(map(pair_ids.setdefault, zip(pkgs, devices), count()))
+    states = list(_row_states(table, indices, filter_user_contents))
+    # 统计的行：没有剔除、也不是有图片无文字的行
+    normal = list(map(operator.not_, states))
+
+    if stats:
+        directives = list(_column_iter(table, 'directives', indices, _classify_directives))
+        avail = list(_column_iter(table, 'avail', indices, _classify_avail))
+        not_excluded = list(map(operator.lt, states, repeat(CONTENT_EXCLUDED)))
+
+        def where(mask, column, value):
+            return map(operator.and_, mask, map(operator.eq, column, repeat(value)))
+
+        masks = [None] * ROLLUP_FIELDS
+        masks[ROLLUP_ROWS] = normal
+        masks[ROLLUP_DIRECTIVES] = where(normal, directives, DIRECTIVES_PRESENT)
+        masks[ROLLUP_HELPFUL] = where(normal, avail, AVAIL_HELPFUL)
+        masks[ROLLUP_UNHELPFUL] = where(normal, avail, AVAIL_UNHELPFUL)
+        masks[ROLLUP_IMAGE_WITHOUT_TEXT] = map(operator.eq, states, repeat(CONTENT_BLANK))
+        masks[ROLLUP_NO_DIRECTIVES] = where(not_excluded, directives, DIRECTIVES_EMPTY)
+        fields = [Counter(compress(row_pairs, mask)) for mask in masks]
+
+        # 没有剔除的行不是有数据的行就是有图片无文字的行
+        rows, images_without_text = fields[ROLLUP_ROWS], fields[ROLLUP_IMAGE_WITHOUT_TEXT]
+        for (pkg_name, device_id), pair in pair_ids.items():
+            if pair in rows or pair in images_without_text:
+                partial = rollup.partials[pkg_name][device_id] = [field.get(pair, 0) for field in fields]
+                if device_id and partial[ROLLUP_ROWS]:
+                    rollup.device_counts[pkg_name] += 1
+        for pkg_name, partials in rollup.partials.items():
+            rollup.totals[pkg_name] = [sum(column) for column in zip(*partials.values())] or [0] * ROLLUP_FIELDS
+
+    if labels:
+        questions = list(_column_iter(table, 'question', indices, _label))
+        # 有标签的行，标签数据同样剔除有图片无文字的行
+        labeled = list(map(operator.and_, normal, map(operator.is_not, questions, repeat(None))))
+        label_rows = list(compress(indices, labeled))
+        label_keys = list(compress(zip(pkgs, devices, questions), labeled))
+        pkg_labels = list(compress(zip(pkgs, questions), labeled))
+        rollup.label_counts = dict(Counter(label_keys))
+        # 首次出现的行号：反向构建字典，靠前的行后写入
+        rollup.label_firsts = dict(zip(reversed(label_keys), reversed(label_rows)))
+        rollup.label_heads = dict(zip(reversed(pkg_labels),
+                                      reversed(list(zip(label_rows, compress(devices, labeled))))))
+        # Counter 按首次出现的顺序排列
+        for (pkg_name, label), total in Counter(pkg_labels).items():
+            rollup.label_totals[pkg_name][label] = total
+
+        function_labels = {label for _, label in rollup.label_heads if _is_function_question(label)}
+        if function_labels:
+            function_rows = compress(zip(pkgs, devices, _column_iter(table, 'userContent', indices)),
+                                     map(operator.and_, labeled, map(function_labels.__contains__, questions)))
+            for pkg_name, device_id, user_content in function_rows:
+                if user_content:
+                    rollup.function_rows[pkg_name].append((device_id, user_content))
+
+    kept = {pair for (pkg_name, device_id), pair in pair_ids.items()
+            if pkg_name in selected and (not excluded_devices
+                                         or (device_id is not None and device_id not in excluded_devices))}
+    kept_indices = array('l', compress(indices, map(operator.and_, normal, map(kept.__contains__, row_pairs))))
+    return rollup, TableView(table, kept_indices)
+
+
+def row_key_hashes(table, columns):
+    """
+    每行去重键的 64 位哈希（有符号整数，可以直接保存为 SQLite INTEGER）
+
+    去重键为 columns 中各列的文本值，不同文件格式读出的 123 和 '123' 视为相同。
+    """
+    def text(value):
+        return '' if value is None else str(value)
+
+    indices = range(table.nrows)
+    values = zip(*[_column_iter(table, name, indices, text) for name in columns])
+    return [int.from_bytes(hashlib.blake2b('\x1f'.join(key).encode('utf-8'), digest_size=8).digest(),
+                           'big', signed=True)
+            for key in values]
+
+
+# 默认分析中数量低于该值的标签合并为「其他」
+OTHER_THRESHOLD = 10
+# 低量标签的数量范围 [LOW_VOLUME_MIN, LOW_VOLUME_MAX)
+LOW_VOLUME_MIN = 5
+LOW_VOLUME_MAX = 10
+
+# 标签的排序方式：数量、标签名称、首次出现的顺序
+LABEL_SORTS = ('count', 'label', 'first')
+
+
+def _sort_labels(items, sort, descending):
+    """items 为按首次出现顺序的 [(标签, 数量)]，数量相同时保持首次出现的顺序"""
+    if sort == 'count':
+        items.sort(key=lambda item: item[1], reverse=descending)
+    elif sort == 'label':
+        items.sort(key=lambda item: item[0], reverse=descending)
+    elif descending:
+        items.reverse()
+    return items
+
+
+def render_labels(question_counts, function_contents, analysis_type, other_threshold=OTHER_THRESHOLD,
+                  low_volume_min=LOW_VOLUME_MIN, low_volume_max=LOW_VOLUME_MAX, top=None, sort='count',
+                  descending=None):
+    """
+    根据分析类型生成标签统计结果，function_contents 为「功能使用」的 userContent（collect_function_contents）
+
+    只改变已统计的 question_counts 的展示方式：other_threshold、low_volume_min/low_volume_max 为阈值，
+    top 为最多返回的标签数（默认分析中其余标签也合并为「其他」），sort 为 LABEL_SORTS 之一，
+    descending 为 None 时按数量逆序、按名称和首次出现的顺序正序。
+    """
+    if descending is None:
+        descending = sort == 'count'
+    if analysis_type == 'function':
+        # 功能使用：仅展示 question 为功能使用的 userContent 内容
+        results = [{'label': user_content, 'count': ''} for user_content in function_contents]
+    elif analysis_type == 'lowVolume':
+        # 低量标签：仅展示数量在 [low_volume_min, low_volume_max) 范围内的标签名称，但需要展示数量
+        items = [(k, v) for k, v in question_counts.items() if low_volume_min <= v < low_volume_max]
+        items = _sort_labels(items, sort, descending)[:top]
+        results = [{'label': label, 'count': count} for label, count in items]
+    else:  # 默认分析
+        # 默认分析：标签数低于 other_threshold 的统称为其他，数量为这些标签的数量之和
+        other_count = 0
+        other_labels = []
+        items = []
+
+        for label, count in question_counts.items():
+            if count < other_threshold:
+                other_count += count
+                other_labels.append(label)
+            else:
+                items.append((label, count))
+
+        # 只保留数量最多的 top 个标签，其余的也合并到其他
+        if top is not None and len(items) > top:
+            kept = {label for label, _ in sorted(items, key=lambda item: item[1], reverse=True)[:top]}
+            for label, count in items:
+                if label not in kept:
+                    other_count += count
+                    other_labels.append(label)
+            items = [item for item in items if item[0] in kept]
+
+        final_counts = dict(items)
+        if other_labels:
+            final_counts['其他'] = other_count
+
+        # 按数量排序，其他项放在末尾
+        other = final_counts.pop('其他', None)
+        results = [{'label': label, 'count': count}
+                   for label, count in _sort_labels(list(final_counts.items()), sort, descending)]
+        if other is not None:
+            results.append({'label': '其他', 'count': other})
+    return results
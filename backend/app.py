@@ -1,5 +1,5 @@
 # -*- coding: utf-8 -*-
-from flask import Flask, request, jsonify
+from flask import Flask, Request, request, jsonify, Response
 from flask_cors import CORS
 import sqlite3
 import os
@@ -7,11 +7,51 @@ from werkzeug.utils import secure_filename
 import json
 import sys
 import csv
-from io import StringIO
+from io import StringIO, BytesIO
+import shutil
+import tempfile
+import threading
 import time
+import re
+import uuid
+import zipfile
+from collections import OrderedDict
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from workbook_cache import WorkbookCache, file_sha256
+from columnar import TableBuilder, TableView
+from xlsx_reader import XlsxReader, UnsupportedWorkbook
+import csv_reader
+from dataset_store import DatasetStore, DatasetAppendError
+import query_results
+from query_results import PageTokenError
+from result_cache import ResultCache, is_cacheable, make_key
+from job_store import JobStore
+from chunked_uploads import ChunkedUploadStore, ChunkedUploadError
+from query_guard import QueryGuard, QuerySlots, QueryAborted, QueryBusy, request_cancel, cleanup_cancel_markers
+from analysis import (compute_analyze_accumulators, compute_label_accumulators, render_labels, row_key_hashes,
+                      compute_device_rollup, DeviceRollup, StatsAccumulator, LabelAccumulator, LABEL_SORTS,
+                      COUNT_APPROXIMATE, COUNT_EXACT, COUNT_MODES)
+import vectorized
+from exclusion_library import ExclusionLibrary, LIST_NAME_PATTERN, union
+
+
+
+class UploadRequest(Request):
+    """
+    上传文件较小时保存在内存中，较大时保存在匿名临时文件中，解析时直接读取，不再另存到 uploads 目录
+
+    werkzeug 默认的 SpooledTemporaryFile 在 Python 3.11 之前没有 seekable()，zipfile 不能直接读取。
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if total_content_length is not None and total_content_length <= app.config['UPLOAD_MEMORY_BYTES']:
+            return BytesIO()
+        return tempfile.TemporaryFile('w+b')
+
 
 app = Flask(__name__)
+app.request_class = UploadRequest
 CORS(app)
 
 # 配置上传文件夹
@@ -21,20 +61,138 @@ if not os.path.exists(UPLOAD_FOLDER):
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+app.config['UPLOAD_MEMORY_BYTES'] = 4 * 1024 * 1024  # 不超过该大小的上传请求保存在内存中
+app.config['JANITOR_INTERVAL'] = 600  # 后台清理过期上传文件、任务状态和取消标记的间隔（秒）
+
+# 配置分片上传（超过单个请求大小限制的文件由前端分片上传）
+CHUNKED_UPLOAD_FOLDER = 'chunked_uploads'
+app.config['UPLOAD_CHUNK_BYTES'] = 8 * 1024 * 1024  # 每个分片 8MB，需小于 MAX_CONTENT_LENGTH 和 nginx 的 client_max_body_size
+app.config['UPLOAD_MAX_BYTES'] = 512 * 1024 * 1024  # 分片上传的文件最大 512MB
+app.config['CHUNKED_UPLOAD_MAX_AGE'] = 6 * 3600  # 超过 6 小时没有活动的分片上传被清理
+chunked_upload_store = ChunkedUploadStore(CHUNKED_UPLOAD_FOLDER, app.config['UPLOAD_CHUNK_BYTES'],
+                                          app.config['CHUNKED_UPLOAD_MAX_AGE'])
+
+# 配置解析缓存（按文件内容哈希缓存已解析的工作簿）
+CACHE_FOLDER = 'cache'
+app.config['CACHE_FOLDER'] = CACHE_FOLDER
+app.config['CACHE_MAX_BYTES'] = 512 * 1024 * 1024  # 512MB 缓存上限
+workbook_cache = WorkbookCache(CACHE_FOLDER, app.config['CACHE_MAX_BYTES'])
 
-# 全局数据存储
-data_store = {
-    'page1_data': None,
-    'page2_data': None,
-    'conn': None
+# 配置过滤集存储（需去除的 userContent 集合，按过滤文件内容哈希保存，通过 filterSetId 引用）
+FILTER_SET_FOLDER = 'filter_sets'
+app.config['FILTER_SET_FOLDER'] = FILTER_SET_FOLDER
+app.config['FILTER_SET_MAX_BYTES'] = 64 * 1024 * 1024  # 64MB 上限
+filter_set_store = WorkbookCache(FILTER_SET_FOLDER, app.config['FILTER_SET_MAX_BYTES'])
+
+# 配置排除列表库（有名称、可追加的需去除 userContent 列表，长期保存，导入时通过 exclusionLists 按名称引用）
+EXCLUSION_LIST_FOLDER = 'exclusion_lists'
+app.config['EXCLUSION_LIST_FOLDER'] = EXCLUSION_LIST_FOLDER
+exclusion_library = ExclusionLibrary(EXCLUSION_LIST_FOLDER)
+
+# 平台与 pkgName 的对应关系，可通过环境变量 PLATFORM_PACKAGES（JSON 对象）覆盖
+app.config['PLATFORM_PACKAGES'] = json.loads(os.environ.get('PLATFORM_PACKAGES', 'null')) or {
+    '安卓': 'com.helloxj.xlook',
+    'iOS': 'cs.zero.waterCamera',
+    '鸿蒙': 'com.helloxj.xlookohos'
 }
+# 未配置的平台名称按此平台处理
+app.config['DEFAULT_PLATFORM'] = '鸿蒙'
+# 一次返回所有平台统计结果的 platform 参数值
+ALL_PLATFORMS = 'all'
+
+# 统计使用的列：小志总数据和小志标签数据只统计这些列
+app.config['PROJECTED_COLUMNS'] = ('deviceId', 'pkgName', 'directives', 'avail', 'userContent', 'imageUrls', 'question')
+# SQL 查询页 data 表保存的列：为 None 时保存文件中的所有列（SQL 可以查询导出文件的任意列）；
+# 设置为列名元组时解析只读取这些列和 PROJECTED_COLUMNS 中的列，其余列在解析时跳过，解析更快、数据集更小
+app.config['DATASET_COLUMNS'] = None
+
+# 配置数据集存储（每次加载的数据保存为独立的 SQLite 文件，所有 worker 共享）
+DATA_FOLDER = 'datasets'
+app.config['DATA_FOLDER'] = DATA_FOLDER
+app.config['DATASET_MAX_BYTES'] = 1024 * 1024 * 1024  # 所有数据集最多占用 1GB 磁盘，超出后按最久未访问淘汰
+app.config['DATASET_MAX_AGE'] = 24 * 3600  # 数据集保留 24 小时
+dataset_store = DatasetStore(DATA_FOLDER, app.config['DATASET_MAX_BYTES'], app.config['DATASET_MAX_AGE'])
+
+# 追加增量数据时识别行的去重键，例如 ('sessionId', 'createTime')：增量中键已经导入过的行跳过
+# （键相同的多行按已导入的行数跳过，其余保留）；为 None 时使用文件中的所有列，
+# 此时 DATASET_COLUMNS 不减少解析的列。导入数据集时记录使用的列，之后的追加沿用
+app.config['DEDUP_KEY_COLUMNS'] = None
+
+# 小志总数据使用人数的默认计算方式（请求参数 countMode 可以覆盖）：exact 精确去重，
+# approximate 用 HyperLogLog 近似（每个平台固定约 16KB，标准误差约 0.81%，
+# 没有系统偏差，约 95% 的结果误差在 ±1.6% 以内，适合合并多个月或多个地区的数据）
+app.config['DISTINCT_COUNT_MODE'] = 'exact'
+
+# 统计内核：python 为逐行实现，numpy 为向量化实现（结果相同，需要安装 numpy，没有安装时使用逐行实现）；
+# 精确计数时导入的统计量由设备预聚合得到，设备预聚合同样由该配置选择内核
+app.config['ANALYSIS_BACKEND'] = 'python'
+
+# SQL 查询结果分页：默认每页行数和每页最大行数（流式导出不受限制）
+app.config['SQL_PAGE_SIZE'] = 1000
+app.config['SQL_MAX_PAGE_SIZE'] = 10000
+
+# 按数据集重新生成小志标签数据时，功能使用的 userContent 每页默认行数
+app.config['LABEL_PAGE_SIZE'] = 500
+
+# 用户 SQL 的资源限制
+QUERY_FOLDER = 'queries'  # 查询槽锁文件和取消标记
+app.config['SQL_TIME_LIMIT'] = 30  # 普通查询的时间限制（秒）
+app.config['SQL_EXPORT_TIME_LIMIT'] = 100  # 流式导出的时间限制（秒），需小于 gunicorn 的 timeout
+app.config['SQL_EXPORT_MAX_ROWS'] = 1000000  # 流式导出的最大行数
+app.config['SQL_QUERY_SLOTS'] = max(1, os.cpu_count() or 1)  # 所有 worker 同时执行的用户 SQL 数量上限
+app.config['SQL_SLOT_WAIT'] = 10  # 等待空闲查询槽的最长时间（秒）
+query_slots = QuerySlots(QUERY_FOLDER, app.config['SQL_QUERY_SLOTS'])
+
+# SQL 查询结果缓存（所有 worker 共享），键包含数据集 ID，重新加载数据后旧结果自动失效
+app.config['SQL_RESULT_CACHE_MAX_BYTES'] = 64 * 1024 * 1024  # 64MB，设为 0 关闭缓存
+result_cache_enabled = app.config['SQL_RESULT_CACHE_MAX_BYTES'] > 0
+result_cache = ResultCache(os.path.join(QUERY_FOLDER, 'result_cache.db'), app.config['SQL_RESULT_CACHE_MAX_BYTES'])
+
+# 异步导入任务：上传后立即返回任务 ID，由进程池解析、统计并加载数据集
+JOB_FOLDER = 'jobs'
+app.config['INGEST_PROCESSES'] = 1  # 每个 worker 的导入进程数
+app.config['INGEST_SLOTS'] = max(1, (os.cpu_count() or 1) // 2)  # 所有 worker 同时执行的导入任务数量上限
+app.config['INGEST_SLOT_WAIT'] = 600  # 导入任务排队的最长时间（秒）
+app.config['JOB_MAX_AGE'] = 3600  # 任务状态和结果保留 1 小时
+job_store = JobStore(JOB_FOLDER, app.config['JOB_MAX_AGE'])
+ingest_slots = QuerySlots(os.path.join(JOB_FOLDER, 'slots'), app.config['INGEST_SLOTS'])
+
+# 导入任务需要的请求参数
+INGEST_FORM_FIELDS = ('deviceIds', 'dataTypes', 'platform', 'analysisType', 'filterSetId', 'datasetId', 'countMode',
+                      'exclusionLists')
+
+# 会话 ID 由前端生成，通过 X-Session-Id 请求头传递，用于区分不同用户的数据集
+SESSION_ID_PATTERN = re.compile(r'[0-9A-Za-z_-]{1,64}')
+
+
+# 解析时每读取多少行报告一次进度
+PROGRESS_ROWS = 10000
+
+
+# 支持的上传文件格式
+SUPPORTED_FORMATS = ('.xlsx', '.xls', '.xlsm', '.xltx', '.xltm', '.csv', '.csv.gz', '.parquet')
+
+# 批量导入可以上传包含多个文件的 zip 压缩包
+ARCHIVE_FORMAT = '.zip'
+
+# 批量导入：同时解析的文件数（进程数）和每次最多的文件数（包括压缩包中的文件）
+app.config['BATCH_PROCESSES'] = os.cpu_count() or 1
+app.config['BATCH_MAX_FILES'] = 50
+
+
+def file_format(filename):
+    """按扩展名判断文件格式，返回小写的扩展名（.csv.gz 作为一种格式），没有扩展名时返回空字符串"""
+    name = os.path.basename(filename).lower()
+    if not '.' in name:
+        return ''
+    if name.endswith('.csv.gz'):
+        return '.csv.gz'
+    return '.' + name.rsplit('.', 1)[1]
 
 
 def allowed_file(filename):
-    if not '.' in filename:
-        return False  # 没有扩展名的文件不被允许
-    ext = filename.rsplit('.', 1)[1].lower()
-    return ext in {'xlsx', 'xls', 'xlsm', 'xltx', 'xltm'}
+    # 没有扩展名的文件不被允许
+    return file_format(filename) in SUPPORTED_FORMATS
 
 
 def cleanup_old_files():
@@ -51,732 +209,1713 @@ def cleanup_old_files():
                     pass  # 如果文件被占用，跳过删除
 
 
-def read_excel_with_python_libs(filepath):
-    """使用 openpyxl 或 xlrd 读取 Excel 文件，支持 .xlsx 和 .xls 格式"""
-    import os
-    file_ext = os.path.splitext(filepath)[1].lower()
-    
-    # 检查扩展名是否为空或无效
-    if not file_ext:
-        raise ValueError("文件没有扩展名，请确保上传的文件有正确的 Excel 扩展名 (.xlsx, .xls, .xlsm, .xltx, .xltm)")
-    
-    if file_ext == '.xlsx' or file_ext == '.xlsm' or file_ext == '.xltx' or file_ext == '.xltm':
-        # 使用 openpyxl 处理 .xlsx, .xlsm, .xltx, .xltm 格式
-        from openpyxl import load_workbook
-        
-        wb = None
-        try:
-            # 使用只读模式确保文件被正确处理
-            wb = load_workbook(filepath, read_only=True)
-            ws = wb.active
-            
-            # 读取所有数据
-            data = []
-            headers = []
-            
-            for row_idx, row in enumerate(ws.iter_rows(values_only=True)):
-                if row_idx == 0:
-                    # 第一行作为列名
-                    headers = [str(cell) if cell is not None else f'Column_{i}' for i, cell in enumerate(row)]
-                else:
-                    # 数据行
-                    data.append({headers[i]: (cell if cell is not None else '') for i, cell in enumerate(row)})
-            
-            return data, headers
-        except Exception as e:
-            raise ValueError(f"无法使用 openpyxl 读取文件: {str(e)}")
-        finally:
-            # 确保工作簿被关闭
-            if wb is not None:
-                try:
-                    wb.close()
-                except:
-                    pass
-    elif file_ext == '.xls':
-        # 使用 xlrd 处理 .xls 格式
-        import xlrd
-        
-        wb = None
+def run_janitor_once():
+    """清理过期的上传文件（未执行的导入任务遗留）、分片上传、任务状态和查询取消标记"""
+    for task in (cleanup_old_files, chunked_upload_store.cleanup, job_store.cleanup,
+                 lambda: cleanup_cancel_markers(QUERY_FOLDER)):
         try:
-            # 打开工作簿
-            wb = xlrd.open_workbook(filepath)
-            ws = wb.sheet_by_index(0)  # 使用第一个工作表
-            
-            # 读取所有数据
-            data = []
-            headers = []
-            
-            for row_idx in range(ws.nrows):
-                row_values = ws.row_values(row_idx)
-                if row_idx == 0:
-                    # 第一行作为列名
-                    headers = [str(cell) if cell != '' else f'Column_{i}' for i, cell in enumerate(row_values)]
-                else:
-                    # 数据行
-                    data.append({headers[i]: (cell if cell != '' else '') for i, cell in enumerate(row_values)})
-            
-            return data, headers
+            task()
         except Exception as e:
-            raise ValueError(f"无法使用 xlrd 读取文件: {str(e)}")
-        finally:
-            # xlrd 通常不需要显式关闭文件，但这里保持一致
-            pass
-    else:
-        # 尝试检测文件的实际格式，但首先检查 magic 库是否可用
-        try:
-            import magic
+            app.logger.warning('后台清理失败: %s', e)
+
+
+def _janitor_loop():
+    while True:
+        run_janitor_once()
+        time.sleep(app.config['JANITOR_INTERVAL'])
+
+
+_janitor_pid = None
+_janitor_lock = threading.Lock()
+
+
+@app.before_request
+def start_janitor():
+    """在当前 worker 中启动后台清理线程（gunicorn 预加载应用后 fork，线程在每个 worker 中单独启动）"""
+    global _janitor_pid
+    if _janitor_pid == os.getpid():
+        return
+    with _janitor_lock:
+        if _janitor_pid != os.getpid():
+            threading.Thread(target=_janitor_loop, name='janitor', daemon=True).start()
+            _janitor_pid = os.getpid()
+
+
+def _append_sheet_rows(ws, builder, progress=None):
+    """读取第一行作为列名，数据行逐行写入 builder；ws 为 openpyxl 只读工作表或 XlsxReader"""
+    # 第一行作为列名
+    header_row = next(ws.iter_rows(max_row=1, values_only=True), None)
+    if header_row is None:
+        return builder.build()
+    builder.set_headers([str(cell) if cell is not None else f'Column_{i}' for i, cell in enumerate(header_row)])
+
+    # 工作表有尺寸信息时每行都补齐到相同列数，可以只取到需要的最后一列
+    max_col = None
+    if builder.projection is not None and ws.max_column is not None:
+        max_col = max(builder.max_position + 1, 1)
+
+    # 数据行
+    rows = ws.iter_rows(min_row=2, max_col=max_col, values_only=True)
+    for count, row in enumerate(rows, 1):
+        builder.append(row)
+        if progress is not None and count % PROGRESS_ROWS == 0:
+            progress(count)
+
+    return builder.build()
+
+
+def _rewind(source):
+    """source 为上传文件的流时回到开头，路径不需要处理"""
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    return source
+
+
+def _read_xlsx_rows(source, builder, progress=None):
+    """流式读取 .xlsx 活动工作表（不构造 openpyxl 单元格）"""
+    with XlsxReader(_rewind(source)) as reader:
+        return _append_sheet_rows(reader, builder, progress)
+
+
+def _read_openpyxl_rows(source, builder, progress=None):
+    """使用 openpyxl 只读模式读取活动工作表，逐行写入 builder"""
+    from openpyxl import load_workbook
+
+    wb = None
+    try:
+        # 使用只读模式确保文件被正确处理
+        wb = load_workbook(_rewind(source), read_only=True)
+        return _append_sheet_rows(wb.active, builder, progress)
+    finally:
+        # 确保工作簿被关闭
+        if wb is not None:
             try:
-                mime = magic.from_file(filepath, mime=True)
-                if mime in ['application/vnd.ms-excel', 'application/xls']:
-                    # 如果是 .xls 格式但扩展名不对，尝试用 xlrd 读取
-                    import xlrd
-                    wb = xlrd.open_workbook(filepath)
-                    ws = wb.sheet_by_index(0)
-                    
-                    # 读取所有数据
-                    data = []
-                    headers = []
-                    
-                    for row_idx in range(ws.nrows):
-                        row_values = ws.row_values(row_idx)
-                        if row_idx == 0:
-                            # 第一行作为列名
-                            headers = [str(cell) if cell != '' else f'Column_{i}' for i, cell in enumerate(row_values)]
-                        else:
-                            # 数据行
-                            data.append({headers[i]: (cell if cell != '' else '') for i, cell in enumerate(row_values)})
-                    
-                    return data, headers
-                elif mime in ['application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 
-                              'application/vnd.ms-excel.sheet.macroEnabled.12', 
-                              'application/vnd.openxmlformats-officedocument.spreadsheetml.template',
-                              'application/vnd.ms-excel.template.macroEnabled.12']:
-                    # 如果是 .xlsx 格式但扩展名不对，尝试用 openpyxl 读取
-                    from openpyxl import load_workbook
-                    wb = None
-                    try:
-                        wb = load_workbook(filepath, read_only=True)
-                        ws = wb.active
-                        
-                        # 读取所有数据
-                        data = []
-                        headers = []
-                        
-                        for row_idx, row in enumerate(ws.iter_rows(values_only=True)):
-                            if row_idx == 0:
-                                # 第一行作为列名
-                                headers = [str(cell) if cell is not None else f'Column_{i}' for i, cell in enumerate(row)]
-                            else:
-                                # 数据行
-                                data.append({headers[i]: (cell if cell is not None else '') for i, cell in enumerate(row)})
-                        
-                        return data, headers
-                    finally:
-                        if wb is not None:
-                            try:
-                                wb.close()
-                            except:
-                                pass
-                else:
-                    raise ValueError(f"不支持的文件格式: {file_ext}，MIME类型: {mime}")
-            except ImportError:
-                # 如果没有安装 python-magic，使用扩展名检测
-                raise ValueError(f"不支持的文件格式: {file_ext}。请确保文件是 Excel 格式 (.xlsx, .xls, .xlsm, .xltx, .xltm)")
-        except ImportError:
-            # 如果 magic 模块不可用，直接使用扩展名检测
-            raise ValueError(f"不支持的文件格式: {file_ext}。请确保文件是 Excel 格式 (.xlsx, .xls, .xlsm, .xltx, .xltm)")
+                wb.close()
+            except:
+                pass
+
 
+def _read_xlrd_rows(source, builder, progress=None):
+    """使用 xlrd 读取 .xls 第一个工作表，逐行写入 builder"""
+    import xlrd
 
-def read_excel_with_python_libs_for_filter(filepath):
-    """使用 openpyxl 或 xlrd 读取用于过滤的 Excel 文件，返回 userContent 列的值集合，支持 .xlsx 和 .xls 格式"""
-    import os
-    file_ext = os.path.splitext(filepath)[1].lower()
+    # 打开工作簿（上传文件的流直接读取内容）
+    if hasattr(source, 'read'):
+        wb = xlrd.open_workbook(file_contents=_rewind(source).read())
+    else:
+        wb = xlrd.open_workbook(source)
+    ws = wb.sheet_by_index(0)  # 使用第一个工作表
+
+    end_colx = None
+    for row_idx in range(ws.nrows):
+        if row_idx == 0:
+            # 第一行作为列名
+            row_values = ws.row_values(row_idx)
+            builder.set_headers([str(cell) if cell != '' else f'Column_{i}' for i, cell in enumerate(row_values)])
+            if builder.projection is not None:
+                # 只取到需要的最后一列
+                end_colx = builder.max_position + 1
+        else:
+            # 数据行
+            builder.append(ws.row_values(row_idx, 0, end_colx))
+            if progress is not None and row_idx % PROGRESS_ROWS == 0:
+                progress(row_idx)
+
+    return builder.build()
+
+
+def _read_csv_rows(source, builder, progress=None, gzipped=False, encoding=None):
+    """流式读取 CSV（gzipped 为 True 时边解压边读取），第一行作为列名，逐行写入 builder"""
+    rows = csv_reader.iter_rows(source, gzipped, encoding)
+    header_row = next(rows, None)
+    if header_row is None:
+        return builder.build()
+    builder.set_headers([cell if cell != '' else f'Column_{i}' for i, cell in enumerate(header_row)])
+
+    for count, row in enumerate(rows, 1):
+        builder.append(row)
+        if progress is not None and count % PROGRESS_ROWS == 0:
+            progress(count)
+
+    return builder.build()
+
+
+def _read_parquet_rows(source, builder, progress=None):
+    """使用 pyarrow 读取 Parquet 文件，只读取列投影中的列，按批次逐列写入 builder"""
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ValueError("读取 Parquet 文件需要安装 pyarrow")
+
+    parquet_file = pq.ParquetFile(_rewind(source))
+    names = parquet_file.schema_arrow.names
+    builder.set_headers(names)
+    read_names = [name for name in names if builder.projection is None or name in builder.projection]
+    if not read_names:
+        # 没有需要的列时仍然要得到行数
+        builder.append_columns({}, parquet_file.metadata.num_rows)
+        return builder.build()
+
+    for batch in parquet_file.iter_batches(columns=read_names):
+        builder.append_columns(
+            {name: batch.column(i).to_pylist() for i, name in enumerate(batch.schema.names)}, batch.num_rows)
+        if progress is not None:
+            progress(builder.nrows)
+
+    return builder.build()
+
+
+def read_excel_table(source, columns=None, progress=None, filename=None):
+    """
+    读取 Excel、CSV（.csv、.csv.gz）或 Parquet 文件，返回列式表 ColumnTable，空单元格为 ''
+
+    source 为文件路径或可 seek 的二进制流（上传文件），filename 用于按扩展名判断格式，默认为 source。
+    columns 为需要读取的列名，其余列在读取时跳过；为 None 时读取所有列。
+    progress(rows) 每读取 PROGRESS_ROWS 行调用一次。
+    """
+    builder = TableBuilder(columns=columns)
+    file_ext = file_format(filename or source)
     
     # 检查扩展名是否为空或无效
     if not file_ext:
-        raise ValueError("文件没有扩展名，请确保上传的文件有正确的 Excel 扩展名 (.xlsx, .xls, .xlsm, .xltx, .xltm)")
+        raise ValueError("文件没有扩展名，请确保上传的文件有正确的扩展名 (.xlsx, .xls, .xlsm, .xltx, .xltm, .csv, .csv.gz, .parquet)")
     
     if file_ext == '.xlsx' or file_ext == '.xlsm' or file_ext == '.xltx' or file_ext == '.xltm':
         # 使用 openpyxl 处理 .xlsx, .xlsm, .xltx, .xltm 格式
-        from openpyxl import load_workbook
-        
-        wb = None
         try:
-            # 使用只读模式确保文件被正确处理
-            wb = load_workbook(filepath, read_only=True)
-            ws = wb.active
-            
-            # 获取所有 userContent 值
-            user_content_values = set()
-            headers = []
-            
-            for row_idx, row in enumerate(ws.iter_rows(values_only=True)):
-                if row_idx == 0:
-                    # 第一行作为列名
-                    headers = [str(cell) if cell is not None else f'Column_{i}' for i, cell in enumerate(row)]
-                else:
-                    # 数据行
-                    row_dict = {headers[i]: (cell if cell is not None else '') for i, cell in enumerate(row)}
-                    if 'userContent' in row_dict and row_dict['userContent']:
-                        user_content_values.add(str(row_dict['userContent']))
-            
-            return user_content_values
+            try:
+                return _read_xlsx_rows(source, builder, progress)
+            except UnsupportedWorkbook:
+                # 流式读取不支持的格式（如公式）时使用 openpyxl 重新读取
+                return _read_openpyxl_rows(source, TableBuilder(columns=columns), progress)
         except Exception as e:
             raise ValueError(f"无法使用 openpyxl 读取文件: {str(e)}")
-        finally:
-            # 确保工作簿被关闭
-            if wb is not None:
-                try:
-                    wb.close()
-                except:
-                    pass
     elif file_ext == '.xls':
         # 使用 xlrd 处理 .xls 格式
-        import xlrd
-        
-        wb = None
         try:
-            # 打开工作簿
-            wb = xlrd.open_workbook(filepath)
-            ws = wb.sheet_by_index(0)  # 使用第一个工作表
-            
-            # 获取所有 userContent 值
-            user_content_values = set()
-            headers = []
-            
-            for row_idx in range(ws.nrows):
-                row_values = ws.row_values(row_idx)
-                if row_idx == 0:
-                    # 第一行作为列名
-                    headers = [str(cell) if cell != '' else f'Column_{i}' for i, cell in enumerate(row_values)]
-                else:
-                    # 数据行
-                    row_dict = {headers[i]: (cell if cell != '' else '') for i, cell in enumerate(row_values)}
-                    if 'userContent' in row_dict and row_dict['userContent']:
-                        user_content_values.add(str(row_dict['userContent']))
-            
-            return user_content_values
+            return _read_xlrd_rows(source, builder, progress)
         except Exception as e:
             raise ValueError(f"无法使用 xlrd 读取文件: {str(e)}")
-        finally:
-            # xlrd 通常不需要显式关闭文件，但这里保持一致
-            pass
+    elif file_ext == '.csv' or file_ext == '.csv.gz':
+        gzipped = file_ext == '.csv.gz'
+        try:
+            encoding = csv_reader.detect_encoding(source, gzipped)
+            try:
+                return _read_csv_rows(source, builder, progress, gzipped, encoding)
+            except UnicodeDecodeError:
+                if encoding == csv_reader.GBK_ENCODING:
+                    raise
+                # 开头是合法的 UTF-8，后面不是，按 GBK 重新读取
+                return _read_csv_rows(source, TableBuilder(columns=columns), progress, gzipped,
+                                      csv_reader.GBK_ENCODING)
+        except Exception as e:
+            raise ValueError(f"无法读取 CSV 文件: {str(e)}")
+    elif file_ext == '.parquet':
+        try:
+            return _read_parquet_rows(source, builder, progress)
+        except Exception as e:
+            raise ValueError(f"无法读取 Parquet 文件: {str(e)}")
     else:
         # 尝试检测文件的实际格式，但首先检查 magic 库是否可用
         try:
             import magic
             try:
-                mime = magic.from_file(filepath, mime=True)
+                if hasattr(source, 'read'):
+                    mime = magic.from_buffer(_rewind(source).read(2048), mime=True)
+                else:
+                    mime = magic.from_file(source, mime=True)
                 if mime in ['application/vnd.ms-excel', 'application/xls']:
                     # 如果是 .xls 格式但扩展名不对，尝试用 xlrd 读取
-                    import xlrd
-                    wb = xlrd.open_workbook(filepath)
-                    ws = wb.sheet_by_index(0)
-                    
-                    # 获取所有 userContent 值
-                    user_content_values = set()
-                    headers = []
-                    
-                    for row_idx in range(ws.nrows):
-                        row_values = ws.row_values(row_idx)
-                        if row_idx == 0:
-                            # 第一行作为列名
-                            headers = [str(cell) if cell != '' else f'Column_{i}' for i, cell in enumerate(row_values)]
-                        else:
-                            # 数据行
-                            row_dict = {headers[i]: (cell if cell != '' else '') for i, cell in enumerate(row_values)}
-                            if 'userContent' in row_dict and row_dict['userContent']:
-                                user_content_values.add(str(row_dict['userContent']))
-                    
-                    return user_content_values
+                    return _read_xlrd_rows(source, builder, progress)
                 elif mime in ['application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 
                               'application/vnd.ms-excel.sheet.macroEnabled.12', 
                               'application/vnd.openxmlformats-officedocument.spreadsheetml.template',
                               'application/vnd.ms-excel.template.macroEnabled.12']:
                     # 如果是 .xlsx 格式但扩展名不对，尝试用 openpyxl 读取
-                    from openpyxl import load_workbook
-                    wb = None
-                    try:
-                        wb = load_workbook(filepath, read_only=True)
-                        ws = wb.active
-                        
-                        # 获取所有 userContent 值
-                        user_content_values = set()
-                        headers = []
-                        
-                        for row_idx, row in enumerate(ws.iter_rows(values_only=True)):
-                            if row_idx == 0:
-                                # 第一行作为列名
-                                headers = [str(cell) if cell is not None else f'Column_{i}' for i, cell in enumerate(row)]
-                            else:
-                                # 数据行
-                                row_dict = {headers[i]: (cell if cell is not None else '') for i, cell in enumerate(row)}
-                                if 'userContent' in row_dict and row_dict['userContent']:
-                                    user_content_values.add(str(row_dict['userContent']))
-                        
-                        return user_content_values
-                    finally:
-                        if wb is not None:
-                            try:
-                                wb.close()
-                            except:
-                                pass
+                    return _read_openpyxl_rows(source, builder, progress)
                 else:
                     raise ValueError(f"不支持的文件格式: {file_ext}，MIME类型: {mime}")
             except ImportError:
                 # 如果没有安装 python-magic，使用扩展名检测
-                raise ValueError(f"不支持的文件格式: {file_ext}。请确保文件是 Excel 格式 (.xlsx, .xls, .xlsm, .xltx, .xltm)")
+                raise ValueError(f"不支持的文件格式: {file_ext}。请确保文件是 Excel、CSV 或 Parquet 格式 (.xlsx, .xls, .xlsm, .xltx, .xltm, .csv, .csv.gz, .parquet)")
         except ImportError:
             # 如果 magic 模块不可用，直接使用扩展名检测
-            raise ValueError(f"不支持的文件格式: {file_ext}。请确保文件是 Excel 格式 (.xlsx, .xls, .xlsm, .xltx, .xltm)")
+            raise ValueError(f"不支持的文件格式: {file_ext}。请确保文件是 Excel、CSV 或 Parquet 格式 (.xlsx, .xls, .xlsm, .xltx, .xltm, .csv, .csv.gz, .parquet)")
 
 
-@app.route('/api/analyze', methods=['POST'])
-def analyze_data():
-    """小志总数据接口"""
-    try:
-        # 清理旧文件
-        cleanup_old_files()
-        
-        # 获取上传的文件
-        if 'file' not in request.files:
-            return jsonify({'error': '没有上传文件'}), 400
-        
-        file = request.files['file']
-        if file.filename == '':
-            return jsonify({'error': '文件名为空'}), 400
-        
-        if not allowed_file(file.filename):
-            return jsonify({'error': '不支持的文件格式'}), 400
-        
-        # 保存主文件 - 确保扩展名保留
-        filename = secure_filename(file.filename)
-        # 确保文件名有扩展名
-        if not '.' in filename:
-            # 如果 secure_filename 移除了扩展名，手动添加
-            original_ext = os.path.splitext(file.filename)[1]
-            if original_ext:
-                filename += original_ext
-            else:
-                return jsonify({'error': '文件名没有扩展名'}), 400
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
-        
-        # 检查是否有用于过滤的文件
-        filter_file = None
-        filter_filepath = None
-        if 'filterFile' in request.files:
-            filter_file = request.files['filterFile']
-            if filter_file.filename != '':
-                if not allowed_file(filter_file.filename):
-                    return jsonify({'error': '过滤文件格式不支持'}), 400
-                filter_filename = secure_filename(filter_file.filename)
-                # 确保过滤文件名有扩展名
-                if not '.' in filter_filename:
-                    # 如果 secure_filename 移除了扩展名，手动添加
-                    original_ext = os.path.splitext(filter_file.filename)[1]
-                    if original_ext:
-                        filter_filename += original_ext
-                    else:
-                        return jsonify({'error': '过滤文件名没有扩展名'}), 400
-                filter_filepath = os.path.join(app.config['UPLOAD_FOLDER'], f"filter_{filter_filename}")
-                filter_file.save(filter_filepath)
-        
-        # 读取主 Excel 文件
-        data, headers = read_excel_with_python_libs(filepath)
-        
-        # 获取参数
-        device_ids = request.form.get('deviceIds', '')
-        data_types = json.loads(request.form.get('dataTypes', '[]'))
-        platform = request.form.get('platform', '安卓')
-        
-        # 处理设备ID过滤
-        device_id_list = [id.strip() for id in device_ids.split(',')] if device_ids else []
-        
-        # 根据平台过滤
-        if platform == '安卓':
-            pkg_name = 'com.helloxj.xlook'
-        elif platform == 'iOS':
-            pkg_name = 'cs.zero.waterCamera'
-        else:
-            pkg_name = 'com.helloxj.xlookohos'
-        
-        # 1. 保存原始数据（用于有图片无文字数量/无指令总数统计）
-        original_initial_data = [row for row in data if 'pkgName' in row and row['pkgName'] == pkg_name]
-        if device_id_list:
-            original_user_data = [row for row in data 
-                                if 'pkgName' in row and row['pkgName'] == pkg_name and 
-                                'deviceId' in row and row['deviceId'] not in device_id_list]
-        else:
-            original_user_data = [row for row in data if 'pkgName' in row and row['pkgName'] == pkg_name]
-        
-        # 2. 剔除有图片无文字的内容
-        def filter_data(data_list):
-            return [row for row in data_list if not (
-                ('imageUrls' in row and row['imageUrls'] is not None and str(row['imageUrls']).strip() != '') and
-                ('userContent' in row and (row['userContent'] is None or str(row['userContent']).strip() == ''))
-            )]
-        
-        # 初始数据（剔除后）
-        initial_data = filter_data(original_initial_data)
-        
-        # 用户数据（剔除后）
-        user_data = filter_data(original_user_data)
-        
-        # 3. 如果有用于过滤的文件，过滤 userContent 相同的数据
-        if filter_filepath:
-            filter_user_contents = read_excel_with_python_libs_for_filter(filter_filepath)
-            initial_data = [row for row in initial_data 
-                           if 'userContent' not in row or str(row['userContent']) not in filter_user_contents]
-            user_data = [row for row in user_data 
-                        if 'userContent' not in row or str(row['userContent']) not in filter_user_contents]
-            # 同时过滤原始数据
-            original_initial_data = [row for row in original_initial_data 
-                                   if 'userContent' not in row or str(row['userContent']) not in filter_user_contents]
-            original_user_data = [row for row in original_user_data 
-                                if 'userContent' not in row or str(row['userContent']) not in filter_user_contents]
-        
-        # 4. 统计数据
-        # 初始数据统计（使用剔除后的数据）
-        initial_device_ids = set()
-        initial_directives_count = 0
-        initial_helpful_count = 0
-        initial_unhelpful_count = 0
-        
-        for row in initial_data:
-            if 'deviceId' in row and row['deviceId']:
-                initial_device_ids.add(row['deviceId'])
-            if 'directives' in row and row['directives'] is not None and str(row['directives']).strip() != '':
-                initial_directives_count += 1
-            if 'avail' in row and row['avail'] == '有帮助':
-                initial_helpful_count += 1
-            elif 'avail' in row and row['avail'] == '无帮助':
-                initial_unhelpful_count += 1
-        
-        # 用户数据统计（使用剔除后的数据）
-        user_device_ids = set()
-        user_directives_count = 0
-        user_helpful_count = 0
-        user_unhelpful_count = 0
-        
-        for row in user_data:
-            if 'deviceId' in row and row['deviceId']:
-                user_device_ids.add(row['deviceId'])
-            if 'directives' in row and row['directives'] is not None and str(row['directives']).strip() != '':
-                user_directives_count += 1
-            if 'avail' in row and row['avail'] == '有帮助':
-                user_helpful_count += 1
-            elif 'avail' in row and row['avail'] == '无帮助':
-                user_unhelpful_count += 1
-        
-        # 5. 使用原始数据统计有图片无文字数量/无指令总数
-        initial_image_no_text_count = 0  # 有图片无文字数量
-        for row in original_initial_data:
-            # 计算有图片无文字数量：userContent为空且imageUrls不为空
-            if ('userContent' in row and (row['userContent'] is None or str(row['userContent']).strip() == '')) and \
-               ('imageUrls' in row and row['imageUrls'] is not None and str(row['imageUrls']).strip() != ''):
-                initial_image_no_text_count += 1
-        
-        user_no_directives_count = 0  # directives为空的数量
-        for row in original_user_data:
-            # 计算directives为空的数量
-            if 'directives' in row and (row['directives'] is None or str(row['directives']).strip() == ''):
-                user_no_directives_count += 1
-        
-        initial_stats = {
-            '总数据量': len(initial_data),
-            '使用人数': len(initial_device_ids),
-            '给出指令次数': initial_directives_count,
-            '有帮助次数': initial_helpful_count,
-            '无帮助次数': initial_unhelpful_count,
-            '有图片无文字数量/无指令总数': f"{initial_image_no_text_count}"
-        }
-        
-        user_stats = {
-            '总数据量': len(user_data),
-            '使用人数': len(user_device_ids),
-            '给出指令次数': user_directives_count,
-            '有帮助次数': user_helpful_count,
-            '无帮助次数': user_unhelpful_count,
-            '有图片无文字数量/无指令总数': f"{user_no_directives_count}"
-        }
-        
-        # 构造返回结果
-        results = []
-        # 添加原有指标
-        for key in initial_stats.keys():
-            if key != '有图片无文字数量/无指令总数':
-                results.append({
-                    'metric': f'{platform} - {key}',
-                    'initialData': initial_stats[key] if 'initial' in data_types else '',
-                    'userData': user_stats[key] if 'user' in data_types else ''
-                })
-        
-        # 最后添加新指标（仅在没有过滤文件时）
-        if '有图片无文字数量/无指令总数' in initial_stats and not filter_filepath:
+def read_excel_table_cached(source, columns=None, progress=None, filename=None):
+    """读取 Excel 文件为列式表，相同内容的文件（且列投影相同）直接使用解析缓存"""
+    variant = 'all' if columns is None else ','.join(sorted(columns))
+    return workbook_cache.load_or_parse(
+        source, lambda source: read_excel_table(source, columns, progress, filename), variant)
+
+
+def read_excel_with_python_libs(filepath):
+    """读取 Excel 文件并转换为字典列表，返回 (data, headers)"""
+    table = read_excel_table_cached(filepath)
+    return list(table.view().iter_dicts()), table.headers
+
+
+def read_excel_with_python_libs_for_filter(source, filename=None):
+    """读取用于过滤的 Excel 文件，根据表头定位 userContent 列并只读取该列，返回非空值的集合"""
+    table = read_excel_table(source, columns=('userContent',), filename=filename)
+    return {str(value) for value in table.view().values('userContent') if value}
+
+
+def load_filter_set(filter_upload, filter_set_id):
+    """
+    获取需去除的 userContent 集合，返回 (filter_set_id, 集合)
+
+    上传了过滤文件时按文件内容哈希保存到服务器端，之后的请求可以只传 filterSetId；
+    filterSetId 不存在或已过期时集合为 None。没有任何过滤条件时返回 (None, None)。
+    """
+    if filter_upload:
+        filter_set_id = file_sha256(filter_upload.source)
+        filter_user_contents = filter_set_store.get(filter_set_id)
+        if filter_user_contents is None:
+            filter_user_contents = read_excel_with_python_libs_for_filter(filter_upload.source, filter_upload.filename)
+            filter_set_store.put(filter_set_id, filter_user_contents)
+        return filter_set_id, filter_user_contents
+    if filter_set_id:
+        if not re.fullmatch(r'[0-9a-f]{64}', filter_set_id):
+            return filter_set_id, None
+        return filter_set_id, filter_set_store.get(filter_set_id)
+    return None, None
+
+
+def parse_exclusion_lists(value):
+    """逗号分隔的排除列表名称（去掉重复），名称不合法时抛出 IngestError"""
+    names = list(dict.fromkeys(name.strip() for name in value.split(',') if name.strip())) if value else []
+    for name in names:
+        if not LIST_NAME_PATTERN.fullmatch(name):
+            raise IngestError(f'排除列表名称不正确: {name}')
+    return names
+
+
+def load_exclusions(filter_upload, filter_set_id, exclusion_lists):
+    """
+    需去除的 userContent：过滤文件（或 filterSetId）与排除列表的并集，返回 (filter_set_id, 集合)
+
+    过滤数据或排除列表不存在时抛出 IngestError，没有任何过滤条件时集合为 None。
+    """
+    filter_set_id, filter_user_contents = load_filter_set(filter_upload, filter_set_id)
+    if filter_set_id and filter_user_contents is None:
+        raise IngestError('过滤数据不存在或已过期，请重新导入需去除的数据')
+    parts = [filter_user_contents]
+    for name in exclusion_lists:
+        exclusion_set = exclusion_library.load(name)
+        if exclusion_set is None:
+            raise IngestError(f'排除列表不存在: {name}')
+        parts.append(exclusion_set)
+    return filter_set_id, union(parts)
+
+
+def parse_device_ids(device_ids):
+    """逗号分隔的需要去除的设备 ID"""
+    return [id.strip() for id in device_ids.split(',')] if device_ids else []
+
+
+def rollup_packages():
+    """设备预聚合包含所有已配置平台的 pkgName，之后可以按任意平台重新计算"""
+    return list(dict.fromkeys(app.config['PLATFORM_PACKAGES'].values()))
+
+
+def resolve_platforms(platform):
+    """返回 [(平台名称, pkgName)]，platform=all 时返回所有已配置的平台"""
+    packages = app.config['PLATFORM_PACKAGES']
+    if platform == ALL_PLATFORMS:
+        return list(packages.items())
+    # 未配置的平台名称按默认平台处理
+    return [(platform, packages.get(platform, packages[app.config['DEFAULT_PLATFORM']]))]
+
+
+def build_analyze_results(platform, initial_stats, user_stats, data_types, with_image_metric,
+                          count_mode=COUNT_EXACT):
+    """构造某个平台的小志总数据指标表，每行的 mode 为计算方式（近似计数时使用人数为 approximate）"""
+    results = []
+    # 添加原有指标
+    for key in initial_stats.keys():
+        if key != '有图片无文字数量/无指令总数':
             results.append({
-                'metric': f'{platform} - 有图片无文字数量/无指令总数',
-                'initialData': initial_stats['有图片无文字数量/无指令总数'] if 'initial' in data_types else '',
-                'userData': user_stats['有图片无文字数量/无指令总数'] if 'user' in data_types else ''
+                'metric': f'{platform} - {key}',
+                'initialData': initial_stats[key] if 'initial' in data_types else '',
+                'userData': user_stats[key] if 'user' in data_types else '',
+                'mode': count_mode if key == '使用人数' else COUNT_EXACT
             })
-        
-        # 存储数据到内存数据库供 SQL 查询使用
-        data_store['page1_data'] = user_data
-        if data_store['conn']:
-            data_store['conn'].close()
-        data_store['conn'] = sqlite3.connect(':memory:', check_same_thread=False)
-        
-        # 创建表并插入数据
-        cursor = data_store['conn'].cursor()
-        
-        # 创建表结构（基于数据的列）
-        if user_data:
-            columns = list(user_data[0].keys())
-            # 生成 SQL 创建语句
-            create_sql = f"CREATE TABLE data ({', '.join([f'{col} TEXT' for col in columns])})"
-            cursor.execute(create_sql)
-            
-            # 插入数据
-            for row in user_data:
-                placeholders = ','.join(['?' for _ in columns])
-                values = [str(row.get(col, '')) for col in columns]
-                cursor.execute(f"INSERT INTO data VALUES ({placeholders})", values)
-        
-        data_store['conn'].commit()
-        
-        # 删除上传的文件
-        try:
-            os.remove(filepath)
-        except OSError:
-            # 如果文件被占用，跳过删除（后续会被覆盖）
-            pass
-            
-        if filter_filepath:
+    
+    # 最后添加新指标
+    if '有图片无文字数量/无指令总数' in initial_stats and with_image_metric:
+        results.append({
+            'metric': f'{platform} - 有图片无文字数量/无指令总数',
+            'initialData': initial_stats['有图片无文字数量/无指令总数'] if 'initial' in data_types else '',
+            'userData': user_stats['有图片无文字数量/无指令总数'] if 'user' in data_types else '',
+            'mode': COUNT_EXACT
+        })
+    return results
+
+
+def get_session_id():
+    """当前请求的会话 ID，没有或格式不正确时为空字符串"""
+    session_id = request.headers.get('X-Session-Id', '')
+    return session_id if SESSION_ID_PATTERN.fullmatch(session_id) else ''
+
+
+def load_view_into_sqlite(view, name, session_id, state=None, row_keys=()):
+    """
+    将视图中的数据批量导入新的 SQLite 数据集（表名 data）供 SQL 查询使用，返回数据集 ID
+
+    state 为统计状态，row_keys 为已导入行的去重键哈希，之后可以向数据集追加增量数据。
+    """
+    return dataset_store.create(view, name, session_id, state, row_keys)
+
+
+def resolve_dataset_id(dataset_id):
+    """返回要查询的数据集 ID：指定了 datasetId 时使用该数据集，否则使用当前会话最近一次加载的数据集"""
+    if dataset_id:
+        return dataset_id if dataset_store.exists(dataset_id) else None
+    return dataset_store.latest_id(get_session_id())
+
+
+class IngestError(Exception):
+    """上传数据处理中的参数或数据错误，status 为返回的 HTTP 状态码"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+    def __reduce__(self):
+        # 批量导入的进程池通过 pickle 传回错误，保留状态码
+        return type(self), (str(self), self.status)
+
+
+class Upload:
+    """
+    上传的文件：source 为可 seek 的二进制流（请求中的上传文件）或磁盘路径（导入任务、分片上传），
+    filename 为处理后的文件名，用于按扩展名判断格式。
+    keep 为 True 时是分片上传完成的文件，处理后不删除，过期后由后台清理（同一文件可以再次统计）。
+    name 为原始文件名，用于在批量导入的结果中显示
+    """
+
+    def __init__(self, source, filename, keep=False, name=None):
+        self.source = source
+        self.filename = filename
+        self.keep = keep
+        self.name = name or filename
+
+    def save(self, filepath):
+        """保存到磁盘，返回磁盘上的 Upload（交给进程池处理时需要路径）"""
+        _rewind(self.source)
+        with open(filepath, 'wb') as f:
+            shutil.copyfileobj(self.source, f)
+        return Upload(filepath, self.filename, name=self.name)
+
+    def remove(self):
+        """删除磁盘上的文件，请求中的上传文件由 werkzeug 释放"""
+        if isinstance(self.source, str) and not self.keep:
             try:
-                os.remove(filter_filepath)
+                os.remove(self.source)
             except OSError:
+                # 如果文件被占用，跳过删除（后续由后台清理）
                 pass
 
-        return jsonify({'data': results})
-    
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
 
+def _upload_filename(name, format_error, extension_error, archive=False):
+    """检查上传文件的格式，返回保留扩展名的安全文件名，archive 为 True 时也接受 zip 压缩包（批量导入）"""
+    if not allowed_file(name) and not (archive and file_format(name) == ARCHIVE_FORMAT):
+        raise IngestError(format_error)
+    filename = secure_filename(name)
+    # 确保文件名有扩展名
+    if not '.' in filename:
+        # 如果 secure_filename 移除了扩展名，手动添加
+        original_ext = os.path.splitext(name)[1]
+        if original_ext:
+            filename += original_ext
+        else:
+            raise IngestError(extension_error)
+    return filename
 
-@app.route('/api/label-process', methods=['POST'])
-def label_process():
-    """小志标签数据接口"""
+
+def _chunked_upload(upload_id):
+    """分片上传完成的文件"""
     try:
-        # 清理旧文件
-        cleanup_old_files()
-        
-        # 获取上传的文件
-        if 'file' not in request.files:
-            return jsonify({'error': '没有上传文件'}), 400
-        
+        filepath, filename = chunked_upload_store.completed_path(upload_id)
+    except ChunkedUploadError as e:
+        raise IngestError(str(e), e.status)
+    return Upload(filepath, filename, keep=True)
+
+
+class UploadBatch:
+    """批量导入的多个上传文件（Upload 列表，可以包含 zip 压缩包）"""
+
+    def __init__(self, uploads):
+        self.uploads = uploads
+        self.keep = False
+
+    def remove(self):
+        remove_uploads(*self.uploads)
+
+
+def get_uploads(batch=False):
+    """
+    取得上传的主文件和过滤文件，返回 (upload, filter_upload)，没有过滤文件时 filter_upload 为 None
+
+    大文件先通过 /api/uploads 分片上传，这里用 uploadId（过滤文件为 filterUploadId）代替上传的文件。
+    batch 为 True 时 upload 为 UploadBatch：多个 file 和 uploadId 参数，可以是 zip 压缩包。
+    """
+    # 获取上传的文件
+    if batch:
+        uploads = []
+        for file in request.files.getlist('file'):
+            if file.filename == '':
+                raise IngestError('文件名为空')
+            uploads.append(Upload(file.stream, _upload_filename(
+                file.filename, f'不支持的文件格式: {file.filename}', '文件名没有扩展名', archive=True), name=file.filename))
+        uploads.extend(_chunked_upload(upload_id) for upload_id in request.form.getlist('uploadId') if upload_id)
+        if not uploads:
+            raise IngestError('没有上传文件')
+        upload = UploadBatch(uploads)
+    elif 'file' in request.files:
         file = request.files['file']
         if file.filename == '':
-            return jsonify({'error': '文件名为空'}), 400
-        
-        if not allowed_file(file.filename):
-            return jsonify({'error': '不支持的文件格式'}), 400
-        
-        # 保存主文件 - 确保扩展名保留
-        filename = secure_filename(file.filename)
-        # 确保文件名有扩展名
-        if not '.' in filename:
-            # 如果 secure_filename 移除了扩展名，手动添加
-            original_ext = os.path.splitext(file.filename)[1]
-            if original_ext:
-                filename += original_ext
-            else:
-                return jsonify({'error': '文件名没有扩展名'}), 400
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
-        
-        # 检查是否有用于过滤的文件
-        filter_file = None
-        filter_filepath = None
-        if 'filterFile' in request.files:
-            filter_file = request.files['filterFile']
-            if filter_file.filename != '':
-                if not allowed_file(filter_file.filename):
-                    return jsonify({'error': '过滤文件格式不支持'}), 400
-                filter_filename = secure_filename(filter_file.filename)
-                # 确保过滤文件名有扩展名
-                if not '.' in filter_filename:
-                    # 如果 secure_filename 移除了扩展名，手动添加
-                    original_ext = os.path.splitext(filter_file.filename)[1]
-                    if original_ext:
-                        filter_filename += original_ext
-                    else:
-                        return jsonify({'error': '过滤文件名没有扩展名'}), 400
-                filter_filepath = os.path.join(app.config['UPLOAD_FOLDER'], f"filter_{filter_filename}")
-                filter_file.save(filter_filepath)
-        
-        # 读取 Excel 文件
-        data, headers = read_excel_with_python_libs(filepath)
-        
-        # 检查必需字段
-        required_columns = ['question', 'pkgName', 'deviceId']
-        if not all(col in headers for col in required_columns):
-            return jsonify({'error': f'Excel 文件中缺少必需字段: {", ".join(required_columns)}'}), 400
-        
-        # 获取参数
-        device_ids = request.form.get('deviceIds', '')
-        platform = request.form.get('platform', '安卓')
-        analysis_type = request.form.get('analysisType', 'default')
-        
-        # 处理设备ID过滤
-        device_id_list = [id.strip() for id in device_ids.split(',')] if device_ids else []
-        
-        # 根据平台过滤
-        if platform == '安卓':
-            pkg_name = 'com.helloxj.xlook'
-        elif platform == 'iOS':
-            pkg_name = 'cs.zero.waterCamera'
-        else:
-            pkg_name = 'com.helloxj.xlookohos'
-        
-        # 1. 保存原始数据（用于有图片无文字数量/无指令总数统计）
-        if device_id_list:
-            original_data = [row for row in data 
-                            if 'pkgName' in row and row['pkgName'] == pkg_name and 
-                            'deviceId' in row and row['deviceId'] not in device_id_list]
-        else:
-            original_data = [row for row in data if 'pkgName' in row and row['pkgName'] == pkg_name]
-        
-        # 2. 剔除有图片无文字的内容
-        def filter_data(data_list):
-            return [row for row in data_list if not (
-                ('imageUrls' in row and row['imageUrls'] is not None and str(row['imageUrls']).strip() != '') and
-                ('userContent' in row and (row['userContent'] is None or str(row['userContent']).strip() == ''))
-            )]
-        
-        # 过滤后的数据
-        filtered_data = filter_data(original_data)
-        
-        # 3. 如果有用于过滤的文件，过滤 userContent 相同的数据
-        if filter_filepath:
-            filter_user_contents = read_excel_with_python_libs_for_filter(filter_filepath)
-            filtered_data = [row for row in filtered_data 
-                            if 'userContent' not in row or str(row['userContent']) not in filter_user_contents]
-            # 同时过滤原始数据
-            original_data = [row for row in original_data 
-                           if 'userContent' not in row or str(row['userContent']) not in filter_user_contents]
-        
-        # 统计问题/标签出现次数
-        question_counts = {}
-        for row in filtered_data:
-            if 'question' in row and row['question']:
-                question = str(row['question'])
-                question_counts[question] = question_counts.get(question, 0) + 1
-        
-        # 根据分析类型过滤
-        if analysis_type == 'function':
-            # 功能使用：仅展示 question 为功能使用的 userContent 内容
-            results = []
-            for row in filtered_data:
-                if row.get('question', '').strip() == '功能使用':
-                    user_content = row.get('userContent', '')
-                    if user_content:
-                        results.append({'label': user_content, 'count': ''})
-        elif analysis_type == 'lowVolume':
-            # 低量标签：仅展示标签数小于10，大于等于5的标签名称，但需要展示数量
-            filtered_counts = {k: v for k, v in question_counts.items() if 5 <= v < 10}
-            results = [{'label': label, 'count': count} for label, count in filtered_counts.items()]
-            # 按数量逆序排序
-            results.sort(key=lambda x: x['count'], reverse=True)
-        else:  # 默认分析
-            # 默认分析：标签数低于10的统称为其他，数量为低于10的标签数量之和
-            other_count = 0
-            other_labels = []
-            final_counts = {}
-            
-            for label, count in question_counts.items():
-                if count < 10:
-                    other_count += count
-                    other_labels.append(label)
-                else:
-                    final_counts[label] = count
-            
-            # 添加其他项
-            if other_labels:
-                final_counts['其他'] = other_count
-            
-            results = [{'label': label, 'count': count} for label, count in final_counts.items()]
-            # 按数量排序，其他项放在末尾
-            results.sort(key=lambda x: (x['label'] == '其他', -x['count'] if x['label'] != '其他' else 0))
-        
-        # 存储数据到内存数据库供 SQL 查询使用
-        data_store['page2_data'] = filtered_data
-        if data_store['conn']:
-            data_store['conn'].close()
-        data_store['conn'] = sqlite3.connect(':memory:', check_same_thread=False)
-        
-        # 创建表并插入数据
-        cursor = data_store['conn'].cursor()
-        
-        # 创建表结构（基于数据的列）
-        if filtered_data:
-            columns = list(filtered_data[0].keys())
-            # 生成 SQL 创建语句
-            create_sql = f"CREATE TABLE data ({', '.join([f'{col} TEXT' for col in columns])})"
-            cursor.execute(create_sql)
-            
-            # 插入数据
-            for row in filtered_data:
-                placeholders = ','.join(['?' for _ in columns])
-                values = [str(row.get(col, '')) for col in columns]
-                cursor.execute(f"INSERT INTO data VALUES ({placeholders})", values)
-        
-        data_store['conn'].commit()
-        
-        # 删除上传的文件
-        try:
-            os.remove(filepath)
-        except OSError:
-            # 如果文件被占用，跳过删除（后续会被覆盖）
-            pass
-            
-        if filter_filepath:
-            try:
-                os.remove(filter_filepath)
-            except OSError:
-                pass
-        
-        return jsonify({'data': results})
+            raise IngestError('文件名为空')
+        upload = Upload(file.stream, _upload_filename(file.filename, '不支持的文件格式', '文件名没有扩展名'))
+    elif request.form.get('uploadId'):
+        upload = _chunked_upload(request.form['uploadId'])
+    else:
+        raise IngestError('没有上传文件')
     
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+    return upload, get_filter_upload()
 
 
-@app.route('/api/sql-query', methods=['POST'])
-def sql_query():
-    """SQL 查询接口"""
-    try:
-        data = request.get_json()
-        query = data.get('query', '')
-        
-        if not query:
+def get_filter_upload():
+    """取得上传的过滤文件（filterFile 或分片上传的 filterUploadId），没有时返回 None"""
+    if 'filterFile' in request.files:
+        filter_file = request.files['filterFile']
+        if filter_file.filename != '':
+            return Upload(filter_file.stream, _upload_filename(filter_file.filename, '过滤文件格式不支持', '过滤文件名没有扩展名'))
+    elif request.form.get('filterUploadId'):
+        return _chunked_upload(request.form['filterUploadId'])
+    return None
+
+
+def _save_upload(upload, prefix):
+    if upload.keep:
+        return upload
+    return upload.save(os.path.join(app.config['UPLOAD_FOLDER'], f"{prefix}{upload.filename}"))
+
+
+def save_uploads(prefix, batch=False):
+    """
+    把上传的文件保存到 uploads 目录（文件名以 prefix 开头，不会与其他请求冲突），返回 (upload, filter_upload)
+
+    分片上传的文件已经在磁盘上，直接使用。batch 同 get_uploads。
+    """
+    upload, filter_upload = get_uploads(batch)
+    if batch:
+        saved = []
+        try:
+            for i, item in enumerate(upload.uploads):
+                saved.append(_save_upload(item, f"{prefix}{i}_"))
+        except Exception:
+            remove_uploads(*saved)
+            raise
+        upload = UploadBatch(saved)
+    else:
+        upload = _save_upload(upload, prefix)
+    if filter_upload is not None and not filter_upload.keep:
+        try:
+            filter_upload = filter_upload.save(
+                os.path.join(app.config['UPLOAD_FOLDER'], f"{prefix}filter_{filter_upload.filename}"))
+        except Exception:
+            upload.remove()
+            raise
+    return upload, filter_upload
+
+
+def remove_uploads(*uploads):
+    """删除保存到磁盘的上传文件"""
+    for upload in uploads:
+        if upload is not None:
+            upload.remove()
+
+
+def ingest_columns(dedup_columns=None):
+    """
+    解析时读取的列：统计使用的列、数据集保存的列和去重键中的列，返回 None 时读取所有列
+
+    DATASET_COLUMNS 为 None（默认）时数据集保存所有列；没有去重键时去重键为文件中的所有列，
+    这两种情况都不按列投影。
+    """
+    if app.config['DATASET_COLUMNS'] is None or app.config['PROJECTED_COLUMNS'] is None or not dedup_columns:
+        return None
+    return tuple(dict.fromkeys((*app.config['PROJECTED_COLUMNS'], *app.config['DATASET_COLUMNS'], *dedup_columns)))
+
+
+def resolve_dedup_columns(table):
+    """去重键使用的列：配置的 DEDUP_KEY_COLUMNS 中文件里存在的列，没有配置时为文件中的所有列（解析时读取了所有列）"""
+    columns = [name for name in app.config['DEDUP_KEY_COLUMNS'] or () if table.has_column(name)]
+    return columns or list(table.column_names)
+
+
+def parse_count_mode(form):
+    """请求参数中使用人数的计算方式（exact、approximate），没有时使用 DISTINCT_COUNT_MODE"""
+    count_mode = form.get('countMode') or app.config['DISTINCT_COUNT_MODE']
+    if count_mode not in COUNT_MODES:
+        raise IngestError(f"countMode 必须是 {'、'.join(COUNT_MODES)} 之一")
+    return count_mode
+
+
+def new_accumulators(kind, pkg_names, count_mode=COUNT_EXACT):
+    """空的统计量：小志总数据为 {pkg_name: (初始数据, 用户数据)}，标签数据为 {pkg_name: LabelAccumulator}"""
+    if kind == 'analyze':
+        approximate = count_mode == COUNT_APPROXIMATE
+        return {pkg_name: (StatsAccumulator(approximate), StatsAccumulator(approximate)) for pkg_name in pkg_names}
+    return {pkg_name: LabelAccumulator() for pkg_name in pkg_names}
+
+
+def compute_accumulators(kind, table, pkg_names, device_id_list, filter_user_contents, view=None,
+                         count_mode=COUNT_EXACT):
+    """按 kind 统计 view 中的行，返回 (统计量, 去除设备和过滤数据后的视图)，统计内核由 ANALYSIS_BACKEND 选择"""
+    if app.config['ANALYSIS_BACKEND'] == 'numpy' and vectorized.available():
+        compute_analyze, compute_label = vectorized.compute_analyze_accumulators, vectorized.compute_label_accumulators
+    else:
+        compute_analyze, compute_label = compute_analyze_accumulators, compute_label_accumulators
+    if kind == 'analyze':
+        return compute_analyze(table, pkg_names, device_id_list, filter_user_contents, view,
+                               approximate=count_mode == COUNT_APPROXIMATE)
+    return compute_label(table, pkg_names, device_id_list, filter_user_contents, view)
+
+
+def compute_rollup_accumulators(kind, table, pkg_names, device_id_list, filter_user_contents, view=None,
+                                rollup_pkg_names=None):
+    """
+    与 compute_accumulators（精确计数）相同，同一次遍历中构建设备预聚合，返回 (统计量, 视图, 设备预聚合)
+
+    设备预聚合包含 rollup_pkg_names（默认为所有已配置的平台）中的平台，统计量由设备预聚合得到；
+    小志总数据只预聚合部分统计量，标签数据只预聚合标签。内核与 compute_accumulators 相同由 ANALYSIS_BACKEND 选择。
+    """
+    if app.config['ANALYSIS_BACKEND'] == 'numpy' and vectorized.available():
+        compute_rollup = vectorized.compute_device_rollup
+    else:
+        compute_rollup = compute_device_rollup
+    rollup, rows = compute_rollup(table, rollup_pkg_names or rollup_packages(), device_id_list,
+                                  filter_user_contents, view, pkg_names,
+                                  stats=kind == 'analyze', labels=kind != 'analyze')
+    if kind == 'analyze':
+        accumulators = {pkg_name: rollup.stats_accumulators(pkg_name, device_id_list) for pkg_name in pkg_names}
+    else:
+        accumulators = {pkg_name: rollup.label_accumulator(pkg_name, device_id_list) for pkg_name in pkg_names}
+    return accumulators, rows, rollup
+
+
+def merge_accumulators(kind, accumulators, other):
+    """把 other 中各平台的统计量合并到 accumulators"""
+    for pkg_name, item in other.items():
+        if kind == 'analyze':
+            accumulators[pkg_name][0].merge(item[0])
+            accumulators[pkg_name][1].merge(item[1])
+        else:
+            accumulators[pkg_name].merge(item)
+
+
+def has_exclusions(state):
+    """导入时是否使用了过滤数据或排除列表"""
+    return state['filterSetId'] is not None or bool(state.get('exclusionLists'))
+
+
+def render_analyze_state(state, data_types):
+    """根据统计状态构造小志总数据结果，有图片无文字数量/无指令总数仅在没有过滤数据时返回"""
+    results = []
+    for platform_name, pkg_name in state['platforms']:
+        initial, user = state['accumulators'][pkg_name]
+        results.extend(build_analyze_results(platform_name, initial.to_stats(), user.to_stats(), data_types,
+                                             not has_exclusions(state), state.get('countMode', COUNT_EXACT)))
+    return results
+
+
+def render_label_state(state, analysis_type, **options):
+    """
+    根据统计状态和分析类型构造小志标签数据结果，platform=all 时每行附带平台名称
+
+    options 为 render_labels 的阈值、top 和排序参数，每个平台分别应用。
+    """
+    accumulators = state['accumulators']
+    if state['platform'] == ALL_PLATFORMS:
+        results = []
+        for platform_name, pkg_name in state['platforms']:
+            accumulator = accumulators[pkg_name]
+            for item in render_labels(accumulator.question_counts, accumulator.function_contents,
+                                      analysis_type, **options):
+                results.append({'platform': platform_name, **item})
+        return results
+    accumulator = accumulators[state['platforms'][0][1]]
+    return render_labels(accumulator.question_counts, accumulator.function_contents, analysis_type, **options)
+
+
+# 每个 worker 缓存最近使用的数据集统计状态，切换分析类型时不用重新读取
+STATE_CACHE_SIZE = 8
+_state_cache = OrderedDict()
+_state_cache_lock = threading.Lock()
+
+
+def load_dataset_state(dataset_id):
+    """读取数据集的统计状态（按修订号缓存，追加数据后重新读取），不存在或不能追加数据时返回 None"""
+    key = (dataset_id, dataset_store.revision(dataset_id))
+    with _state_cache_lock:
+        state = _state_cache.get(key)
+        if state is not None:
+            _state_cache.move_to_end(key)
+            return state
+    state = dataset_store.load_state(dataset_id)
+    if state is not None:
+        with _state_cache_lock:
+            _state_cache[key] = state
+            while len(_state_cache) > STATE_CACHE_SIZE:
+                _state_cache.popitem(last=False)
+    return state
+
+
+def _report(progress, stage, rows=None):
+    if progress is not None:
+        progress(stage, rows)
+
+
+def run_analyze(upload, filter_upload, form, session_id, progress=None):
+    """
+    小志总数据：读取上传文件、过滤、统计并加载数据集，返回响应内容
+
+    form 为请求参数（deviceIds、dataTypes、platform、filterSetId、exclusionLists、countMode），
+    progress(stage, rows) 用于报告处理进度。
+    近似计数（countMode=approximate）时不保存按设备的预聚合，之后不能由数据集修改平台或设备 ID。
+    """
+    try:
+        # 读取主 Excel 文件
+        _report(progress, 'parsing')
+        table = read_excel_table_cached(upload.source, ingest_columns(app.config['DEDUP_KEY_COLUMNS']),
+                                        lambda rows: _report(progress, 'parsing', rows), upload.filename)
+        _report(progress, 'filtering', table.nrows)
+        
+        # 获取参数
+        device_ids = form.get('deviceIds', '')
+        data_types = json.loads(form.get('dataTypes', '[]'))
+        platform = form.get('platform', '安卓')
+        count_mode = parse_count_mode(form)
+        
+        # 处理设备ID过滤
+        device_id_list = parse_device_ids(device_ids)
+        
+        # 根据平台过滤（platform=all 时一次统计所有平台）
+        platforms = resolve_platforms(platform)
+        pkg_names = [pkg_name for _, pkg_name in platforms]
+        
+        # 如果有用于过滤的文件（或之前上传的过滤集 filterSetId）或排除列表，按 userContent 去除相同的数据
+        exclusion_lists = parse_exclusion_lists(form.get('exclusionLists', ''))
+        filter_set_id, filter_user_contents = load_exclusions(filter_upload, form.get('filterSetId', ''),
+                                                              exclusion_lists)
+        
+        # 单次遍历统计初始数据和用户数据（剔除有图片无文字的内容后统计，
+        # 有图片无文字数量/无指令总数使用剔除前的数据），精确计数时同时按设备预聚合所有 deviceId
+        _report(progress, 'analyzing', table.nrows)
+        if count_mode == COUNT_EXACT:
+            accumulators, user_data, rollup = compute_rollup_accumulators(
+                'analyze', table, pkg_names, device_id_list, filter_user_contents)
+        else:
+            accumulators, user_data = compute_accumulators(
+                'analyze', table, pkg_names, device_id_list, filter_user_contents, count_mode=count_mode)
+            rollup = None
+        
+        # 统计状态随数据集保存，之后追加增量数据时合并
+        dedup_columns = resolve_dedup_columns(table)
+        state = {
+            'kind': 'analyze',
+            'platform': platform,
+            'platforms': platforms,
+            'deviceIds': device_id_list,
+            'filterSetId': filter_set_id,
+            'exclusionLists': exclusion_lists,
+            'dataTypes': data_types,
+            'countMode': count_mode,
+            'dedupColumns': dedup_columns,
+            'accumulators': accumulators,
+            # 按设备的预聚合保存所有 deviceId，近似计数时不保存
+            'rollup': rollup,
+        }
+        
+        # 构造返回结果，有图片无文字数量/无指令总数仅在没有过滤文件时返回
+        results = render_analyze_state(state, data_types)
+        
+        # 存储数据到数据集供 SQL 查询使用
+        _report(progress, 'loading', len(user_data))
+        dataset_id = load_view_into_sqlite(user_data, 'page1_data', session_id, state,
+                                           row_key_hashes(table, dedup_columns))
+        
+        response = {'data': results, 'datasetId': dataset_id, 'countMode': count_mode}
+        if filter_set_id:
+            response['filterSetId'] = filter_set_id
+        return response
+    finally:
+        # 删除保存到磁盘的上传文件（导入任务）
+        remove_uploads(upload, filter_upload)
+
+
+def run_label_process(upload, filter_upload, form, session_id, progress=None):
+    """
+    小志标签数据：读取上传文件、过滤、统计标签并加载数据集，返回响应内容
+
+    form 为请求参数（deviceIds、platform、analysisType、filterSetId、exclusionLists），
+    progress(stage, rows) 用于报告处理进度。
+    """
+    try:
+        # 读取 Excel 文件
+        _report(progress, 'parsing')
+        table = read_excel_table_cached(upload.source, ingest_columns(app.config['DEDUP_KEY_COLUMNS']),
+                                        lambda rows: _report(progress, 'parsing', rows), upload.filename)
+        _report(progress, 'filtering', table.nrows)
+        
+        # 检查必需字段
+        required_columns = ['question', 'pkgName', 'deviceId']
+        if not all(col in table.headers for col in required_columns):
+            raise IngestError(f'Excel 文件中缺少必需字段: {", ".join(required_columns)}')
+        
+        # 获取参数
+        device_ids = form.get('deviceIds', '')
+        platform = form.get('platform', '安卓')
+        analysis_type = form.get('analysisType', 'default')
+        
+        # 处理设备ID过滤
+        device_id_list = parse_device_ids(device_ids)
+        
+        # 根据平台过滤（platform=all 时一次统计所有平台）
+        platforms = resolve_platforms(platform)
+        pkg_names = [pkg_name for _, pkg_name in platforms]
+        
+        # 如果有用于过滤的文件（或之前上传的过滤集 filterSetId）或排除列表，按 userContent 去除相同的数据
+        exclusion_lists = parse_exclusion_lists(form.get('exclusionLists', ''))
+        filter_set_id, filter_user_contents = load_exclusions(filter_upload, form.get('filterSetId', ''),
+                                                              exclusion_lists)
+        
+        # 单次遍历统计问题/标签出现次数（剔除有图片无文字的内容），同时按设备预聚合
+        _report(progress, 'analyzing', table.nrows)
+        accumulators, filtered_data, rollup = compute_rollup_accumulators(
+            'label-process', table, pkg_names, device_id_list, filter_user_contents)
+        
+        # 统计状态随数据集保存，之后追加增量数据时合并
+        dedup_columns = resolve_dedup_columns(table)
+        state = {
+            'kind': 'label-process',
+            'platform': platform,
+            'platforms': platforms,
+            'deviceIds': device_id_list,
+            'filterSetId': filter_set_id,
+            'exclusionLists': exclusion_lists,
+            'analysisType': analysis_type,
+            'dedupColumns': dedup_columns,
+            'accumulators': accumulators,
+            'rollup': rollup,
+        }
+        
+        # 根据分析类型生成结果，platform=all 时每行附带平台名称
+        results = render_label_state(state, analysis_type)
+        
+        # 存储数据到数据集供 SQL 查询使用
+        _report(progress, 'loading', len(filtered_data))
+        dataset_id = load_view_into_sqlite(filtered_data, 'page2_data', session_id, state,
+                                           row_key_hashes(table, dedup_columns))
+        
+        response = {'data': results, 'datasetId': dataset_id}
+        if filter_set_id:
+            response['filterSetId'] = filter_set_id
+        return response
+    finally:
+        # 删除保存到磁盘的上传文件（导入任务）
+        remove_uploads(upload, filter_upload)
+
+
+def run_append(upload, filter_upload, form, session_id, progress=None):
+    """
+    向数据集追加增量文件：去掉已经导入过的行，只统计新增的行并合并到数据集的统计状态，
+    新增的行追加到数据集的 data 表，返回与导入数据集时相同格式的结果
+
+    form 为请求参数（datasetId，以及可选的 dataTypes、analysisType，默认与导入时相同），
+    平台、设备 ID、过滤数据和排除列表沿用导入数据集时的参数（排除列表使用当前的内容）。
+    """
+    try:
+        dataset_id = form.get('datasetId', '')
+        if not dataset_store.exists(dataset_id):
+            raise IngestError('数据集不存在或已过期', 404)
+        state = dataset_store.load_state(dataset_id)
+        if state is None:
+            raise IngestError('该数据集不支持追加数据，请重新导入', 409)
+        
+        # 读取增量文件
+        _report(progress, 'parsing')
+        table = read_excel_table_cached(upload.source, ingest_columns(state['dedupColumns']),
+                                        lambda rows: _report(progress, 'parsing', rows), upload.filename)
+        _report(progress, 'filtering', table.nrows)
+        
+        # 过滤数据与导入时相同（重新上传的过滤文件内容必须一致）
+        filter_set_id, filter_user_contents = load_filter_set(filter_upload, state['filterSetId'] or '')
+        if filter_set_id != state['filterSetId']:
+            raise IngestError('过滤数据与导入数据集时使用的不一致')
+        if filter_set_id and filter_user_contents is None:
+            raise IngestError('过滤数据不存在或已过期，请重新上传导入数据集时使用的过滤文件')
+        # 排除列表使用当前的内容（导入后追加的条目对新增的行生效）
+        _, exclusion_contents = load_exclusions(None, '', state.get('exclusionLists', []))
+        filter_user_contents = union([filter_user_contents, exclusion_contents])
+        
+        pkg_names = [pkg_name for _, pkg_name in state['platforms']]
+        
+        def update(kept, state):
+            # 只统计去重后新增的行，合并到原来的统计状态
+            _report(progress, 'analyzing', len(kept))
+            rollup = state.get('rollup')
+            if rollup is not None:
+                accumulators, rows, delta_rollup = compute_rollup_accumulators(
+                    state['kind'], table, pkg_names, state['deviceIds'], filter_user_contents,
+                    TableView(table, kept), list(rollup.totals))
+                rollup.merge(delta_rollup)
+            else:
+                accumulators, rows = compute_accumulators(state['kind'], table, pkg_names, state['deviceIds'],
+                                                          filter_user_contents, TableView(table, kept),
+                                                          state.get('countMode', COUNT_EXACT))
+            merge_accumulators(state['kind'], state['accumulators'], accumulators)
+            _report(progress, 'loading', len(rows))
+            return rows, state
+        
+        try:
+            state, appended = dataset_store.append(dataset_id, row_key_hashes(table, state['dedupColumns']), update)
+        except DatasetAppendError as e:
+            raise IngestError(str(e), 409)
+        
+        if state['kind'] == 'analyze':
+            data_types = json.loads(form['dataTypes']) if form.get('dataTypes') else state['dataTypes']
+            results = render_analyze_state(state, data_types)
+        else:
+            results = render_label_state(state, form.get('analysisType') or state['analysisType'])
+        
+        response = {'data': results, 'datasetId': dataset_id,
+                    'appendedRows': appended, 'duplicateRows': table.nrows - appended}
+        if state['kind'] == 'analyze':
+            response['countMode'] = state.get('countMode', COUNT_EXACT)
+        if filter_set_id:
+            response['filterSetId'] = filter_set_id
+        return response
+    finally:
+        # 删除保存到磁盘的上传文件（导入任务）
+        remove_uploads(upload, filter_upload)
+
+
+def _expand_batch(batch, prefix):
+    """
+    批量导入的文件保存到 uploads 目录（进程池需要路径），zip 压缩包展开为其中支持格式的文件，
+    返回 Upload 列表（处理后删除）
+    """
+    folder = app.config['UPLOAD_FOLDER']
+    uploads = []
+    try:
+        for i, upload in enumerate(batch.uploads):
+            if file_format(upload.filename) != ARCHIVE_FORMAT:
+                if isinstance(upload.source, str):
+                    # 导入任务中已经保存到磁盘，处理后由 batch 删除；分片上传的文件不删除
+                    uploads.append(Upload(upload.source, upload.filename, keep=True, name=upload.name))
+                else:
+                    uploads.append(upload.save(os.path.join(folder, f"{prefix}{i}_{upload.filename}")))
+                continue
+            try:
+                archive = zipfile.ZipFile(_rewind(upload.source) if hasattr(upload.source, 'read') else upload.source)
+            except zipfile.BadZipFile:
+                raise IngestError(f'{upload.name} 不是有效的 zip 压缩包')
+            with archive:
+                # 跳过目录、隐藏文件（如 macOS 的 __MACOSX/._xxx）和不支持的格式
+                members = [info for info in archive.infolist()
+                           if not info.is_dir() and not os.path.basename(info.filename).startswith('.')
+                           and not info.filename.startswith('__MACOSX/') and allowed_file(info.filename)]
+                if not members:
+                    raise IngestError(f'{upload.name} 中没有支持格式的文件')
+                if sum(info.file_size for info in members) > app.config['UPLOAD_MAX_BYTES']:
+                    raise IngestError(f"{upload.name} 解压后超过 {app.config['UPLOAD_MAX_BYTES'] // 1024 // 1024}MB 上限", 413)
+                for j, info in enumerate(members):
+                    filename = _upload_filename(os.path.basename(info.filename), '不支持的文件格式', '文件名没有扩展名')
+                    filepath = os.path.join(folder, f"{prefix}{i}_{j}_{filename}")
+                    with archive.open(info) as source, open(filepath, 'wb') as target:
+                        shutil.copyfileobj(source, target)
+                    uploads.append(Upload(filepath, filename, name=os.path.basename(info.filename)))
+    except Exception:
+        remove_uploads(*uploads)
+        raise
+    if len(uploads) > app.config['BATCH_MAX_FILES']:
+        remove_uploads(*uploads)
+        raise IngestError(f"每次最多导入 {app.config['BATCH_MAX_FILES']} 个文件")
+    return uploads
+
+
+def ingest_batch_file(kind, upload, pkg_names, device_id_list, filter_user_contents, session_id,
+                      count_mode=COUNT_EXACT):
+    """
+    批量导入中的一个文件：解析、统计并把数据导入单独的数据集（合并后删除），可以在进程池中执行
+
+    返回 (行数, 统计量, 设备预聚合, 去重键的列, 数据集 ID)，近似计数时设备预聚合为 None。
+    """
+    try:
+        table = read_excel_table_cached(upload.source, ingest_columns(app.config['DEDUP_KEY_COLUMNS']),
+                                        filename=upload.filename)
+        if kind == 'label-process':
+            required_columns = ['question', 'pkgName', 'deviceId']
+            if not all(col in table.headers for col in required_columns):
+                raise IngestError(f'Excel 文件中缺少必需字段: {", ".join(required_columns)}')
+        if count_mode == COUNT_EXACT:
+            accumulators, rows, rollup = compute_rollup_accumulators(kind, table, pkg_names, device_id_list,
+                                                                     filter_user_contents)
+        else:
+            accumulators, rows = compute_accumulators(kind, table, pkg_names, device_id_list, filter_user_contents,
+                                                      count_mode=count_mode)
+            rollup = None
+        dedup_columns = resolve_dedup_columns(table)
+        dataset_id = dataset_store.create(rows, '', session_id, {}, row_key_hashes(table, dedup_columns))
+        return table.nrows, accumulators, rollup, dedup_columns, dataset_id
+    finally:
+        upload.remove()
+
+
+# 批量导入进程池中每个进程的参数
+_batch_worker_state = {}
+
+
+def _init_batch_worker(filter_user_contents):
+    _batch_worker_state['filter_user_contents'] = filter_user_contents
+
+
+def _ingest_batch_file_worker(kind, upload, pkg_names, device_id_list, session_id, count_mode):
+    return ingest_batch_file(kind, upload, pkg_names, device_id_list,
+                             _batch_worker_state['filter_user_contents'], session_id, count_mode)
+
+
+def _ingest_batch_files(kind, uploads, pkg_names, device_id_list, filter_user_contents, session_id, progress=None,
+                        count_mode=COUNT_EXACT):
+    """
+    处理批量导入的各个文件，按文件顺序返回 ingest_batch_file 的结果
+
+    文件多于一个时由进程池并行处理，无法启动子进程时依次处理。
+    任何一个文件失败时删除其他文件已经导入的数据集，抛出第一个失败的文件的错误。
+    """
+    results = [None] * len(uploads)
+    errors = []
+    total_rows = 0
+
+    def finish(i, result):
+        nonlocal total_rows
+        results[i] = result
+        total_rows += result[0]
+        _report(progress, 'parsing', total_rows)
+
+    executor = None
+    processes = min(app.config['BATCH_PROCESSES'], len(uploads))
+    if processes > 1:
+        try:
+            executor = ProcessPoolExecutor(max_workers=processes, initializer=_init_batch_worker,
+                                           initargs=(filter_user_contents,))
+            futures = {executor.submit(_ingest_batch_file_worker, kind, upload, pkg_names, device_id_list,
+                                       session_id, count_mode): i for i, upload in enumerate(uploads)}
+        except Exception:
+            # 无法启动子进程（例如在守护进程中）
+            if executor is not None:
+                executor.shutdown(wait=False)
+            executor = None
+
+    if executor is None:
+        for i, upload in enumerate(uploads):
+            try:
+                finish(i, ingest_batch_file(kind, upload, pkg_names, device_id_list, filter_user_contents,
+                                            session_id, count_mode))
+            except Exception as e:
+                errors.append((upload, e))
+                break
+    else:
+        with executor:
+            for future in as_completed(futures):
+                i = futures[future]
+                try:
+                    finish(i, future.result())
+                except Exception as e:
+                    errors.append((uploads[i], e))
+                    # 取消还没有开始的文件
+                    for other in futures:
+                        other.cancel()
+
+    if errors:
+        for result in results:
+            if result is not None:
+                dataset_store.remove(result[-1])
+        upload, error = errors[0]
+        raise IngestError(f'{upload.name}: {error}', error.status if isinstance(error, IngestError) else 500)
+    return results
+
+
+def run_batch(kind, batch, filter_upload, form, session_id, progress=None):
+    """
+    批量导入多个文件（或 zip 压缩包中的文件）：各文件并行解析统计，返回每个文件的结果和合并后的结果
+
+    form 参数与单个文件的导入接口相同。合并结果中的使用人数为所有文件设备的并集，
+    标签数量先按文件相加再计算「其他」和少量标签；所有文件的数据合并到一个数据集。
+    """
+    uploads = []
+    results = []
+    try:
+        # 获取参数
+        device_ids = form.get('deviceIds', '')
+        platform = form.get('platform', '安卓')
+        count_mode = parse_count_mode(form) if kind == 'analyze' else COUNT_EXACT
+        device_id_list = parse_device_ids(device_ids)
+        platforms = resolve_platforms(platform)
+        pkg_names = [pkg_name for _, pkg_name in platforms]
+        
+        exclusion_lists = parse_exclusion_lists(form.get('exclusionLists', ''))
+        filter_set_id, filter_user_contents = load_exclusions(filter_upload, form.get('filterSetId', ''),
+                                                              exclusion_lists)
+        
+        _report(progress, 'parsing')
+        uploads = _expand_batch(batch, f"batch_{uuid.uuid4().hex}_")
+        results = _ingest_batch_files(kind, uploads, pkg_names, device_id_list, filter_user_contents,
+                                      session_id, progress, count_mode)
+        
+        # 合并各文件的统计量（合并到新的统计量，各文件的统计量保持不变）
+        _report(progress, 'analyzing', sum(rows for rows, _, _, _, _ in results))
+        accumulators = new_accumulators(kind, pkg_names, count_mode)
+        rollup = DeviceRollup(rollup_packages()) if count_mode == COUNT_EXACT else None
+        for _, file_accumulators, file_rollup, _, _ in results:
+            merge_accumulators(kind, accumulators, file_accumulators)
+            if rollup is not None:
+                rollup.merge(file_rollup)
+        
+        # 各文件的去重键的列相同时合并后的数据集可以追加数据（列按第一个文件的表头顺序）
+        dedup_columns = list(dict.fromkeys(tuple(columns) for _, _, _, columns, _ in results))
+        state = {
+            'kind': kind,
+            'platform': platform,
+            'platforms': platforms,
+            'deviceIds': device_id_list,
+            'filterSetId': filter_set_id,
+            'exclusionLists': exclusion_lists,
+            'dedupColumns': list(dedup_columns[0]),
+            'accumulators': accumulators,
+            'rollup': rollup,
+        }
+        if kind == 'analyze':
+            data_types = json.loads(form.get('dataTypes', '[]'))
+            state['dataTypes'] = data_types
+            state['countMode'] = count_mode
+            render = lambda state: render_analyze_state(state, data_types)
+            name = 'page1_data'
+        else:
+            analysis_type = form.get('analysisType', 'default')
+            state['analysisType'] = analysis_type
+            render = lambda state: render_label_state(state, analysis_type)
+            name = 'page2_data'
+        
+        files = [{'filename': upload.name, 'rows': rows, 'data': render(dict(state, accumulators=file_accumulators))}
+                 for upload, (rows, file_accumulators, _, _, _) in zip(uploads, results)]
+        data = render(state)
+        
+        # 各文件的数据集合并为一个数据集供 SQL 查询使用
+        _report(progress, 'loading', sum(rows for rows, _, _, _, _ in results))
+        dataset_id = dataset_store.merge([part_id for _, _, _, _, part_id in results], name, session_id,
+                                         state if len(dedup_columns) == 1 else None)
+        results = []
+        
+        response = {'data': data, 'files': files, 'datasetId': dataset_id}
+        if kind == 'analyze':
+            response['countMode'] = count_mode
+        if filter_set_id:
+            response['filterSetId'] = filter_set_id
+        return response
+    finally:
+        for _, _, _, _, part_id in results:
+            dataset_store.remove(part_id)
+        # 删除展开和保存到磁盘的文件
+        remove_uploads(batch, filter_upload, *uploads)
+
+
+def run_analyze_batch(batch, filter_upload, form, session_id, progress=None):
+    """批量导入小志总数据"""
+    return run_batch('analyze', batch, filter_upload, form, session_id, progress)
+
+
+def run_label_process_batch(batch, filter_upload, form, session_id, progress=None):
+    """批量导入小志标签数据"""
+    return run_batch('label-process', batch, filter_upload, form, session_id, progress)
+
+
+# 导入任务类型对应的处理函数
+INGEST_RUNNERS = {
+    'analyze': run_analyze,
+    'label-process': run_label_process,
+    'append': run_append,
+    'analyze-batch': run_analyze_batch,
+    'label-process-batch': run_label_process_batch,
+}
+
+# 批量导入的任务类型（上传多个文件）
+BATCH_KINDS = ('analyze-batch', 'label-process-batch')
+
+
+@app.route('/api/analyze', methods=['POST'])
+def analyze_data():
+    """小志总数据接口"""
+    try:
+        # 直接解析请求中的上传文件，不保存到 uploads 目录
+        upload, filter_upload = get_uploads()
+        return jsonify(run_analyze(upload, filter_upload, request.form, get_session_id()))
+    
+    except IngestError as e:
+        return jsonify({'error': str(e)}), e.status
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/label-process', methods=['POST'])
+def label_process():
+    """小志标签数据接口"""
+    try:
+        # 直接解析请求中的上传文件，不保存到 uploads 目录
+        upload, filter_upload = get_uploads()
+        return jsonify(run_label_process(upload, filter_upload, request.form, get_session_id()))
+    
+    except IngestError as e:
+        return jsonify({'error': str(e)}), e.status
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+def batch_ingest(kind):
+    """批量导入的同步接口：file（可以是 zip 压缩包）和 uploadId 可以有多个，其余参数同单个文件的接口"""
+    try:
+        batch, filter_upload = get_uploads(batch=True)
+        return jsonify(INGEST_RUNNERS[kind](batch, filter_upload, request.form, get_session_id()))
+    
+    except IngestError as e:
+        return jsonify({'error': str(e)}), e.status
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/analyze/batch', methods=['POST'])
+def analyze_batch():
+    """批量导入小志总数据：返回每个文件的结果 files 和合并后的结果 data"""
+    return batch_ingest('analyze-batch')
+
+
+@app.route('/api/label-process/batch', methods=['POST'])
+def label_process_batch():
+    """批量导入小志标签数据：返回每个文件的结果 files 和合并后的结果 data"""
+    return batch_ingest('label-process-batch')
+
+
+@app.route('/api/datasets/<dataset_id>/append', methods=['POST'])
+def append_dataset(dataset_id):
+    """向小志总数据或小志标签数据的数据集追加增量文件（参数同导入接口，平台等参数沿用导入时的设置）"""
+    try:
+        upload, filter_upload = get_uploads()
+        form = request.form.to_dict()
+        form['datasetId'] = dataset_id
+        return jsonify(run_append(upload, filter_upload, form, get_session_id()))
+    
+    except IngestError as e:
+        return jsonify({'error': str(e)}), e.status
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+def run_ingest_job(job_id, kind, upload, filter_upload, form, session_id):
+    """在进程池中执行导入任务，进度和结果写入任务状态文件"""
+    def progress(stage, rows=None):
+        job_store.update(job_id, stage=stage, rowsProcessed=rows)
+    
+    try:
+        # 所有 worker 同时执行的导入任务数量有上限，等待期间保持 queued 状态
+        release_slot = ingest_slots.acquire(app.config['INGEST_SLOT_WAIT'])
+    except QueryBusy:
+        remove_uploads(upload, filter_upload)
+        job_store.update(job_id, status='failed', stage='failed', error='导入任务繁忙，请稍后重试', errorStatus=503)
+        return
+    
+    try:
+        job_store.update(job_id, status='running')
+        result = INGEST_RUNNERS[kind](upload, filter_upload, form, session_id, progress)
+        job_store.update(job_id, status='done', stage='done', result=result)
+    except IngestError as e:
+        job_store.update(job_id, status='failed', stage='failed', error=str(e), errorStatus=e.status)
+    except Exception as e:
+        job_store.update(job_id, status='failed', stage='failed', error=str(e), errorStatus=500)
+    finally:
+        release_slot()
+
+
+_job_executor = None
+_job_executor_pid = None
+
+
+def get_job_executor():
+    """当前 worker 的导入进程池（gunicorn 预加载应用后 fork，进程池在每个 worker 中单独创建）"""
+    global _job_executor, _job_executor_pid
+    if _job_executor is None or _job_executor_pid != os.getpid():
+        _job_executor = ProcessPoolExecutor(max_workers=app.config['INGEST_PROCESSES'])
+        _job_executor_pid = os.getpid()
+    return _job_executor
+
+
+def submit_ingest_job(kind):
+    """保存上传文件并提交导入任务，立即返回任务 ID"""
+    try:
+        job_id = job_store.create(kind)
+        try:
+            # 进程池中的进程需要从磁盘读取上传文件
+            upload, filter_upload = save_uploads(f"{job_id}_", batch=kind in BATCH_KINDS)
+        except Exception:
+            job_store.remove(job_id)
+            raise
+        
+        # request.form 不能跨进程传递，只取需要的参数
+        form = {key: request.form[key] for key in INGEST_FORM_FIELDS if key in request.form}
+        future = get_job_executor().submit(
+            run_ingest_job, job_id, kind, upload, filter_upload, form, get_session_id())
+        
+        def on_done(future):
+            # 进程池中的进程异常退出时任务不会写入结果，在这里标记为失败并重建进程池
+            global _job_executor
+            error = future.exception()
+            if error is not None:
+                remove_uploads(upload, filter_upload)
+                job_store.update(job_id, status='failed', stage='failed', error=str(error), errorStatus=500)
+                _job_executor = None
+        
+        future.add_done_callback(on_done)
+        return jsonify({'jobId': job_id, 'status': 'queued'}), 202
+    
+    except IngestError as e:
+        return jsonify({'error': str(e)}), e.status
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/jobs/analyze', methods=['POST'])
+def submit_analyze_job():
+    """小志总数据导入任务：参数同 /api/analyze，立即返回任务 ID"""
+    return submit_ingest_job('analyze')
+
+
+@app.route('/api/jobs/label-process', methods=['POST'])
+def submit_label_process_job():
+    """小志标签数据导入任务：参数同 /api/label-process，立即返回任务 ID"""
+    return submit_ingest_job('label-process')
+
+
+@app.route('/api/jobs/analyze-batch', methods=['POST'])
+def submit_analyze_batch_job():
+    """批量导入小志总数据的任务：参数同 /api/analyze/batch，立即返回任务 ID"""
+    return submit_ingest_job('analyze-batch')
+
+
+@app.route('/api/jobs/label-process-batch', methods=['POST'])
+def submit_label_process_batch_job():
+    """批量导入小志标签数据的任务：参数同 /api/label-process/batch，立即返回任务 ID"""
+    return submit_ingest_job('label-process-batch')
+
+
+@app.route('/api/jobs/append', methods=['POST'])
+def submit_append_job():
+    """追加增量文件的导入任务：参数同 /api/datasets/<datasetId>/append，datasetId 在表单中传递"""
+    return submit_ingest_job('append')
+
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job_status(job_id):
+    """导入任务状态：status、stage 和已处理的行数"""
+    job = job_store.get(job_id)
+    if job is None:
+        return jsonify({'error': '任务不存在或已过期'}), 404
+    job.pop('result', None)
+    return jsonify(job)
+
+
+@app.route('/api/jobs/<job_id>/result', methods=['GET'])
+def get_job_result(job_id):
+    """导入任务完成后的结果，与同步接口的返回内容相同"""
+    job = job_store.get(job_id)
+    if job is None:
+        return jsonify({'error': '任务不存在或已过期'}), 404
+    if job['status'] == 'failed':
+        return jsonify({'error': job['error']}), job.get('errorStatus', 500)
+    if job['status'] != 'done':
+        return jsonify({'error': '任务尚未完成', 'status': job['status'], 'stage': job['stage']}), 409
+    return jsonify(job['result'])
+
+
+@app.route('/api/uploads', methods=['POST'])
+def create_chunked_upload():
+    """
+    开始分片上传：参数为 filename、size 和可选的 sha256（完整文件的十六进制摘要），
+    返回 uploadId、分片大小 chunkSize 和分片数 chunkCount
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        # zip 压缩包只能用于批量导入
+        filename = _upload_filename(str(data.get('filename') or ''), '不支持的文件格式', '文件名没有扩展名', archive=True)
+        size = data.get('size')
+        if not isinstance(size, int) or isinstance(size, bool) or size <= 0:
+            return jsonify({'error': '文件大小无效'}), 400
+        if size > app.config['UPLOAD_MAX_BYTES']:
+            return jsonify({'error': f"文件超过 {app.config['UPLOAD_MAX_BYTES'] // 1024 // 1024}MB 上限"}), 413
+        return jsonify(chunked_upload_store.create(filename, size, data.get('sha256'))), 201
+
+    except (IngestError, ChunkedUploadError) as e:
+        return jsonify({'error': str(e)}), e.status
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/uploads/<upload_id>', methods=['GET'])
+def get_chunked_upload(upload_id):
+    """分片上传的状态和已收到的分片序号 received，连接中断后只需补传缺少的分片"""
+    try:
+        return jsonify(chunked_upload_store.status(upload_id))
+    except ChunkedUploadError as e:
+        return jsonify({'error': str(e)}), e.status
+
+
+@app.route('/api/uploads/<upload_id>/chunks/<int:index>', methods=['PUT'])
+def put_upload_chunk(upload_id, index):
+    """
+    上传第 index 个分片（从 0 开始），请求体为分片内容（application/octet-stream），
+    可以用 X-Chunk-Sha256 请求头带上分片的摘要，校验失败时重新上传该分片
+    """
+    try:
+        # 边读请求体边写入磁盘，不把分片读入内存
+        chunked_upload_store.write_chunk(upload_id, index, request.stream, request.headers.get('X-Chunk-Sha256'))
+        return jsonify({'uploadId': upload_id, 'index': index})
+    except ChunkedUploadError as e:
+        return jsonify({'error': str(e)}), e.status
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/uploads/<upload_id>/complete', methods=['POST'])
+def complete_chunked_upload(upload_id):
+    """拼接全部分片并校验，之后 /api/analyze、/api/label-process 和导入任务可以用 uploadId 代替上传的文件"""
+    try:
+        return jsonify(chunked_upload_store.complete(upload_id))
+    except ChunkedUploadError as e:
+        return jsonify({'error': str(e)}), e.status
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/uploads/<upload_id>', methods=['DELETE'])
+def delete_chunked_upload(upload_id):
+    """放弃分片上传，删除已收到的分片"""
+    if chunked_upload_store.get(upload_id) is None:
+        return jsonify({'error': '上传不存在或已过期'}), 404
+    chunked_upload_store.remove(upload_id)
+    return jsonify({'uploadId': upload_id, 'deleted': True})
+
+
+def _int_arg(args, name, default, minimum=0):
+    """读取非负整数参数，没有时返回 default"""
+    value = args.get(name, '')
+    if value == '':
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        raise IngestError(f'{name} 必须是整数')
+    if value < minimum:
+        raise IngestError(f'{name} 不能小于 {minimum}')
+    return value
+
+
+def parse_label_options(args):
+    """标签结果的展示参数：阈值、top 和排序方式，返回 render_labels 的关键字参数"""
+    sort = args.get('sort', 'count')
+    if sort not in LABEL_SORTS:
+        raise IngestError(f"sort 必须是 {'、'.join(LABEL_SORTS)} 之一")
+    order = args.get('order', '')
+    if order not in ('', 'asc', 'desc'):
+        raise IngestError('order 必须是 asc 或 desc')
+    options = {
+        'other_threshold': _int_arg(args, 'otherThreshold', 10),
+        'low_volume_min': _int_arg(args, 'lowVolumeMin', 5),
+        'low_volume_max': _int_arg(args, 'lowVolumeMax', 10),
+        'top': _int_arg(args, 'top', None, minimum=1),
+        'sort': sort,
+        'descending': None if not order else order == 'desc',
+    }
+    if options['low_volume_min'] > options['low_volume_max']:
+        raise IngestError('lowVolumeMin 不能大于 lowVolumeMax')
+    return options
+
+
+def rollup_params(state, args):
+    """
+    请求参数中的平台和需要去除的设备 ID（没有时沿用导入时的设置），返回 (platforms, device_id_list, 设备预聚合)
+
+    修改这两个参数时由设备预聚合重新计算，之前导入的数据集没有设备预聚合时抛出 IngestError。
+    """
+    platform = args.get('platform', state['platform'])
+    platforms = resolve_platforms(platform)
+    device_id_list = parse_device_ids(args['deviceIds']) if 'deviceIds' in args else state['deviceIds']
+    rollup = state.get('rollup')
+    if rollup is None or not all(pkg_name in rollup for _, pkg_name in platforms):
+        raise IngestError('该数据集不支持修改平台或设备 ID，请重新导入', 409)
+    return platform, platforms, device_id_list, rollup
+
+
+@app.route('/api/datasets/<dataset_id>/analyze', methods=['GET'])
+def render_dataset_analyze(dataset_id):
+    """
+    用数据集中按 (pkgName, deviceId) 预聚合的统计量重新生成小志总数据结果，修改需要去除的设备 ID 时不重新统计所有行
+
+    参数：deviceIds、platform、dataTypes（JSON 数组），没有时沿用导入时的设置。
+    SQL 查询的数据集仍为导入时去除设备后的数据。近似计数的数据集只能修改 dataTypes。
+    """
+    try:
+        state = load_dataset_state(dataset_id) if dataset_store.exists(dataset_id) else None
+        if state is None or state['kind'] != 'analyze':
+            return jsonify({'error': '数据集不存在、已过期或不是小志总数据'}), 404
+        
+        data_types = json.loads(request.args['dataTypes']) if request.args.get('dataTypes') else state['dataTypes']
+        count_mode = state.get('countMode', COUNT_EXACT)
+        unchanged = (request.args.get('platform', state['platform']) == state['platform']
+                     and ('deviceIds' not in request.args
+                          or set(parse_device_ids(request.args['deviceIds'])) == set(state['deviceIds'])))
+        if count_mode == COUNT_APPROXIMATE and unchanged:
+            # 近似计数没有按设备的预聚合，平台和设备 ID 不变时直接使用保存的统计量
+            return jsonify({'data': render_analyze_state(state, data_types), 'datasetId': dataset_id,
+                            'countMode': count_mode})
+        
+        _, platforms, device_id_list, rollup = rollup_params(state, request.args)
+        results = []
+        for platform_name, pkg_name in platforms:
+            initial_stats, user_stats = rollup.analyze_stats(pkg_name, device_id_list)
+            results.extend(build_analyze_results(
+                platform_name, initial_stats, user_stats, data_types, not has_exclusions(state)))
+        return jsonify({'data': results, 'datasetId': dataset_id, 'countMode': count_mode})
+    
+    except IngestError as e:
+        return jsonify({'error': str(e)}), e.status
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/datasets/<dataset_id>/labels', methods=['GET'])
+def render_dataset_labels(dataset_id):
+    """
+    用数据集中保存的标签统计重新生成小志标签数据结果，切换分析类型或阈值时不需要重新上传文件
+
+    参数：analysisType（default、function、lowVolume）、otherThreshold、lowVolumeMin、lowVolumeMax、
+    top（每个平台最多返回的标签数）、sort（count、label、first）、order（asc、desc）；
+    功能使用的 userContent 按 offset、pageSize 分页返回。
+    指定 deviceIds 或 platform 时由设备预聚合重新计算，不重新统计所有行。
+    """
+    try:
+        state = load_dataset_state(dataset_id) if dataset_store.exists(dataset_id) else None
+        if state is None or state['kind'] != 'label-process':
+            return jsonify({'error': '数据集不存在、已过期或不是小志标签数据'}), 404
+        
+        if 'deviceIds' in request.args or 'platform' in request.args:
+            platform, platforms, device_id_list, rollup = rollup_params(state, request.args)
+            state = dict(state, platform=platform, platforms=platforms, accumulators={
+                pkg_name: rollup.label_accumulator(pkg_name, device_id_list) for _, pkg_name in platforms})
+        
+        analysis_type = request.args.get('analysisType', 'default')
+        if analysis_type not in ('default', 'function', 'lowVolume'):
+            return jsonify({'error': '不支持的分析类型'}), 400
+        
+        if analysis_type != 'function':
+            results = render_label_state(state, analysis_type, **parse_label_options(request.args))
+            return jsonify({'data': results, 'analysisType': analysis_type, 'total': len(results),
+                            'offset': 0, 'hasMore': False})
+        
+        # 功能使用：按平台顺序分页，不一次返回所有 userContent
+        offset = _int_arg(request.args, 'offset', 0)
+        page_size = min(_int_arg(request.args, 'pageSize', app.config['LABEL_PAGE_SIZE'], minimum=1),
+                        app.config['SQL_MAX_PAGE_SIZE'])
+        with_platform = state['platform'] == ALL_PLATFORMS
+        results = []
+        total = 0
+        for platform_name, pkg_name in state['platforms']:
+            contents = state['accumulators'][pkg_name].function_contents
+            start = max(offset - total, 0)
+            for user_content in contents[start:start + page_size - len(results)]:
+                item = {'label': user_content, 'count': ''}
+                results.append({'platform': platform_name, **item} if with_platform else item)
+            total += len(contents)
+        return jsonify({'data': results, 'analysisType': analysis_type, 'total': total,
+                        'offset': offset, 'hasMore': offset + len(results) < total})
+    
+    except IngestError as e:
+        return jsonify({'error': str(e)}), e.status
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+def parse_page_size(value):
+    """解析每页行数，限制在 1 到 SQL_MAX_PAGE_SIZE 之间"""
+    try:
+        page_size = int(value)
+    except (TypeError, ValueError):
+        page_size = app.config['SQL_PAGE_SIZE']
+    return max(1, min(page_size, app.config['SQL_MAX_PAGE_SIZE']))
+
+
+def build_query_response(dataset_id, query, query_id, offset, column_names, rows, has_more, cached):
+    """组装 SQL 查询一页结果的响应"""
+    # 转换为字典列表
+    results = [dict(zip(column_names, row)) for row in rows]
+    next_page_token = None
+    if has_more:
+        next_page_token = query_results.encode_page_token(dataset_id, query, offset + len(rows))
+    
+    return {
+        'data': results,
+        'columns': column_names,
+        'datasetId': dataset_id,
+        'queryId': query_id,
+        'nextPageToken': next_page_token,
+        'cached': cached
+    }
+
+
+@app.route('/api/sql-query', methods=['POST'])
+def sql_query():
+    """
+    SQL 查询接口
+
+    默认分页返回，每页 pageSize 行（默认 SQL_PAGE_SIZE，最多 SQL_MAX_PAGE_SIZE），
+    还有数据时返回 nextPageToken，带上同一条 SQL 和 pageToken 继续查询下一页；
+    format 为 ndjson 或 csv 时流式返回全部结果。
+    """
+    try:
+        data = request.get_json()
+        query = data.get('query', '')
+        output_format = data.get('format', 'json')
+        
+        if not query:
             return jsonify({'error': 'SQL 查询语句不能为空'}), 400
+        if output_format not in ('json', 'ndjson', 'csv'):
+            return jsonify({'error': f'不支持的输出格式: {output_format}'}), 400
         
-        if not data_store['conn']:
+        dataset_id = resolve_dataset_id(data.get('datasetId', ''))
+        if not dataset_id:
             return jsonify({'error': '没有可用的数据，请先在「小志总数据」或「小志标签数据」页面点击查询/生成按钮加载数据'}), 400
         
-        # 执行 SQL 查询
-        cursor = data_store['conn'].cursor()
-        cursor.execute(query)
-        rows = cursor.fetchall()
+        offset = 0
+        if data.get('pageToken'):
+            offset = query_results.decode_page_token(data['pageToken'], dataset_id, query)
+        
+        # 时间限制在获取查询槽后 install 时开始计算
+        time_limit = app.config['SQL_TIME_LIMIT' if output_format == 'json' else 'SQL_EXPORT_TIME_LIMIT']
+        query_guard = QueryGuard(QUERY_FOLDER, data.get('queryId'), time_limit)
+        page_size = parse_page_size(data.get('pageSize'))
+        
+        # 当前会话的其他数据集按名称附加，可以用 page1_data.data、page2_data.data 关联查询
+        attached = dataset_store.named_datasets(get_session_id())
+        
+        # 相同数据集上的相同 SQL 直接返回缓存的结果
+        cache_key = None
+        if output_format == 'json' and result_cache_enabled and is_cacheable(query):
+            # 追加数据后修订号变化，之前缓存的结果不再命中
+            revisions = {i: dataset_store.revision(i) for i in {dataset_id, *attached.values()}}
+            cache_key = make_key(dataset_id, attached, query, offset, page_size, revisions)
+            cached = result_cache.get(cache_key)
+            if cached is not None:
+                return jsonify(build_query_response(dataset_id, query, query_guard.query_id, offset,
+                                                    cached['columns'], cached['rows'], cached['hasMore'], True))
+        
+        # 获取查询槽，同时执行的用户 SQL 数量有上限
+        release_slot = query_slots.acquire(app.config['SQL_SLOT_WAIT'])
+        
+        # 执行 SQL 查询（以只读方式打开数据集）
+        try:
+            conn = dataset_store.connect(dataset_id, attached)
+        except Exception:
+            release_slot()
+            raise
+        
+        def finish():
+            conn.close()
+            release_slot()
+            query_guard.finish()
         
-        # 获取列名
-        column_names = [description[0] for description in cursor.description]
+        try:
+            query_guard.install(conn)
+            cursor = conn.cursor()
+            cursor.execute(query)
+            column_names = query_results.column_names(cursor)
+        except Exception as e:
+            finish()
+            raise query_guard.translate(e)
         
-        # 转换为字典列表
-        results = [dict(zip(column_names, row)) for row in rows]
+        if output_format != 'json':
+            # 流式输出：边读取游标边写出，结束后关闭连接并释放查询槽
+            def generate(chunks):
+                try:
+                    yield from chunks
+                except sqlite3.Error as e:
+                    # 响应已经开始发送，只能在 NDJSON 末尾写出中断原因
+                    if output_format == 'ndjson':
+                        yield json.dumps({'error': str(query_guard.translate(e))}, ensure_ascii=False) + '\n'
+                finally:
+                    finish()
+            
+            headers = {'X-Dataset-Id': dataset_id, 'X-Query-Id': query_guard.query_id}
+            max_rows = app.config['SQL_EXPORT_MAX_ROWS']
+            if output_format == 'csv':
+                headers['Content-Disposition'] = 'attachment; filename=query_result.csv'
+                return Response(generate(query_results.iter_csv(cursor, column_names, max_rows)),
+                                mimetype='text/csv', headers=headers)
+            return Response(generate(query_results.iter_ndjson(cursor, column_names, max_rows)),
+                            mimetype='application/x-ndjson', headers=headers)
         
-        return jsonify({'data': results})
+        try:
+            rows, has_more = query_results.fetch_page(cursor, offset, page_size)
+        except Exception as e:
+            raise query_guard.translate(e)
+        finally:
+            finish()
+        
+        if cache_key is not None:
+            result_cache.put(cache_key, {'columns': column_names, 'rows': rows, 'hasMore': has_more})
+        
+        return jsonify(build_query_response(dataset_id, query, query_guard.query_id, offset,
+                                            column_names, rows, has_more, False))
     
+    except (PageTokenError, QueryAborted) as e:
+        return jsonify({'error': str(e)}), 400
+    except QueryBusy as e:
+        return jsonify({'error': str(e)}), 503
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/sql-query/cancel', methods=['POST'])
+def cancel_sql_query():
+    """取消正在执行的 SQL 查询（可能在其他 worker 中执行）"""
+    try:
+        data = request.get_json()
+        query_id = data.get('queryId', '')
+        if not request_cancel(QUERY_FOLDER, query_id):
+            return jsonify({'error': '查询 ID 无效'}), 400
+        return jsonify({'cancelled': True, 'queryId': query_id})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/sql-query/cache-stats', methods=['GET'])
+def sql_query_cache_stats():
+    """SQL 查询结果缓存的命中/未命中统计"""
+    try:
+        if not result_cache_enabled:
+            return jsonify({'enabled': False})
+        return jsonify(dict(result_cache.stats(), enabled=True))
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -785,25 +1924,86 @@ def sql_query():
 def data_status():
     """检查数据加载状态"""
     try:
-        has_data = data_store['conn'] is not None
+        dataset_id = resolve_dataset_id(request.args.get('datasetId', ''))
+        has_data = dataset_id is not None
         data_count = 0
         
         if has_data:
+            conn = dataset_store.connect(dataset_id)
             try:
-                cursor = data_store['conn'].cursor()
+                cursor = conn.cursor()
                 cursor.execute('SELECT COUNT(*) FROM data')
                 data_count = cursor.fetchone()[0]
             except:
                 has_data = False
+            finally:
+                conn.close()
         
         return jsonify({
             'hasData': has_data,
-            'dataCount': data_count
+            'dataCount': data_count,
+            'datasetId': dataset_id if has_data else None
         })
     except Exception as e:
         return jsonify({'hasData': False, 'dataCount': 0})
 
 
+@app.route('/api/datasets', methods=['GET'])
+def list_datasets():
+    """列出当前会话的数据集（行数、大小、最后访问时间）"""
+    try:
+        return jsonify({'data': dataset_store.list(get_session_id())})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/exclusion-lists', methods=['GET'])
+def list_exclusion_lists():
+    """列出排除列表（名称、条目数、占用字节数、创建和更新时间）"""
+    try:
+        return jsonify({'data': exclusion_library.list()})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/exclusion-lists/<name>', methods=['POST'])
+def append_exclusion_list(name):
+    """
+    把需去除的数据追加到排除列表（不存在时新建），返回新增的条目数和条目总数
+
+    需去除的数据与导入接口相同：filterFile、分片上传的 filterUploadId 或之前导入的 filterSetId。
+    """
+    filter_upload = None
+    try:
+        if not LIST_NAME_PATTERN.fullmatch(name):
+            raise IngestError('排除列表名称只能包含字母、数字、汉字、下划线和连字符，最多 64 个字符')
+        filter_upload = get_filter_upload()
+        filter_set_id, filter_user_contents = load_filter_set(filter_upload, request.form.get('filterSetId', ''))
+        if filter_set_id is None:
+            raise IngestError('没有上传需去除的数据')
+        if filter_user_contents is None:
+            raise IngestError('过滤数据不存在或已过期，请重新上传')
+        added, count = exclusion_library.append(name, filter_user_contents)
+        return jsonify({'name': name, 'added': added, 'count': count})
+    except IngestError as e:
+        return jsonify({'error': str(e)}), e.status
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    finally:
+        remove_uploads(filter_upload)
+
+
+@app.route('/api/exclusion-lists/<name>', methods=['DELETE'])
+def delete_exclusion_list(name):
+    """删除排除列表，之前导入的数据集追加数据时不能再使用该列表"""
+    try:
+        if not exclusion_library.remove(name):
+            return jsonify({'error': '排除列表不存在'}), 404
+        return jsonify({'name': name})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
 @app.route('/api/health', methods=['GET'])
 def health():
     """健康检查接口"""
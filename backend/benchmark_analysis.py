@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+对比逐行实现（analysis）和 NumPy 实现（vectorized）的统计耗时
+
+用法：
+    python benchmark_analysis.py                 # 生成与导出数据格式相同的工作簿（默认 50 万行）后对比
+    python benchmark_analysis.py --rows 100000
+    python benchmark_analysis.py 导出文件.xlsx     # 使用已有文件对比
+只计算统计内核的耗时，不包括解析；需去除的数据为随机选取的 5% 的 userContent。
+「导入」为精确计数导入时的设备预聚合（compute_rollup_accumulators），「逐行统计」为不预聚合的统计内核；
+平台为 app 中配置的所有平台。
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import analysis
+import app as backend
+import vectorized
+from benchmark_xlsx import PACKAGES, make_export_workbook
+
+
+def best_time(compute, args, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        compute(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='对比逐行实现和 NumPy 实现的统计耗时')
+    parser.add_argument('path', nargs='?', help='要统计的 .xlsx 文件，不指定时生成测试文件')
+    parser.add_argument('--rows', type=int, default=500000, help='生成的数据行数')
+    parser.add_argument('--repeat', type=int, default=3, help='每种实现重复次数，取最快的一次')
+    args = parser.parse_args()
+    if not vectorized.available():
+        print("没有安装 numpy")
+        return
+
+    path = args.path
+    if path is None:
+        path = os.path.join(tempfile.mkdtemp(), 'export.xlsx')
+        make_export_workbook(path, args.rows)
+        print(f"生成 {args.rows} 行测试文件: {path}")
+    table = backend.read_excel_table(path, backend.app.config['PROJECTED_COLUMNS'])
+
+    rng = random.Random(0)
+    contents = [value for value in table.view().values('userContent') if value]
+    filter_user_contents = set(rng.sample(contents, len(contents) // 20)) if contents else None
+    devices = [value for value in table.view().values('deviceId') if value]
+    device_id_list = sorted(set(rng.sample(devices, min(len(devices), 30))))
+    kernel_args = (table, PACKAGES, device_id_list, filter_user_contents)
+
+    def rollup_import(kind):
+        return lambda *call_args: backend.compute_rollup_accumulators(kind, *call_args)
+
+    for label, python_kernel, numpy_kernel in [
+        ('小志总数据逐行统计', analysis.compute_analyze_accumulators, vectorized.compute_analyze_accumulators),
+        ('小志标签数据逐行统计', analysis.compute_label_accumulators, vectorized.compute_label_accumulators),
+        ('小志总数据导入', rollup_import('analyze'), rollup_import('analyze')),
+        ('小志标签数据导入', rollup_import('label-process'), rollup_import('label-process')),
+    ]:
+        times = []
+        for analysis_backend, kernel in (('python', python_kernel), ('numpy', numpy_kernel)):
+            backend.app.config['ANALYSIS_BACKEND'] = analysis_backend
+            try:
+                times.append(best_time(kernel, kernel_args, args.repeat))
+            finally:
+                backend.app.config['ANALYSIS_BACKEND'] = 'python'
+        python_time, numpy_time = times
+        print(f"{label}: {table.nrows} 行，逐行 {python_time:.2f}s，NumPy {numpy_time:.2f}s，"
+              f"是逐行的 {python_time / numpy_time:.2f} 倍速度")
+
+
+if __name__ == '__main__':
+    main()
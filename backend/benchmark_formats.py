@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+对比同一份数据保存为 .xlsx、.csv、.csv.gz 和 .parquet 时的解析耗时
+
+用法：
+    python benchmark_formats.py                 # 生成与导出数据格式相同的工作簿（默认 20 万行）后对比
+    python benchmark_formats.py --rows 50000
+    python benchmark_formats.py 导出文件.xlsx     # 把已有文件转换为其他格式后对比
+只读取 PROJECTED_COLUMNS 中的列（与 DATASET_COLUMNS 设为 () 时的接口相同）；没有安装 pyarrow 时跳过 Parquet。
+"""
+
+import argparse
+import csv
+import gzip
+import os
+import sys
+import tempfile
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import app as backend
+from benchmark_xlsx import make_export_workbook
+from xlsx_reader import XlsxReader
+
+
+def convert(xlsx_path, folder):
+    """把工作簿的活动工作表转换为 CSV、CSV.gz 和 Parquet，返回 [(格式, 路径)]"""
+    with XlsxReader(xlsx_path) as reader:
+        rows = list(reader.iter_rows())
+    headers = [str(cell) if cell is not None else f'Column_{i}' for i, cell in enumerate(rows[0])]
+    data = rows[1:]
+
+    paths = [('xlsx', xlsx_path)]
+    csv_path = os.path.join(folder, 'export.csv')
+    with open(csv_path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(headers)
+        writer.writerows(data)
+    paths.append(('csv', csv_path))
+    gz_path = os.path.join(folder, 'export.csv.gz')
+    with open(csv_path, 'rb') as source, gzip.open(gz_path, 'wb') as target:
+        target.write(source.read())
+    paths.append(('csv.gz', gz_path))
+
+    try:
+        import pyarrow
+        import pyarrow.parquet as pq
+    except ImportError:
+        print("没有安装 pyarrow，跳过 Parquet")
+        return paths
+    parquet_path = os.path.join(folder, 'export.parquet')
+    columns = {name: [row[i] if i < len(row) else None for row in data] for i, name in enumerate(headers)}
+    pq.write_table(pyarrow.table(columns), parquet_path)
+    paths.append(('parquet', parquet_path))
+    return paths
+
+
+def best_time(path, repeat):
+    best = None
+    table = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        table = backend.read_excel_table(path, backend.app.config['PROJECTED_COLUMNS'])
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, table
+
+
+def main():
+    parser = argparse.ArgumentParser(description='对比 xlsx、csv、csv.gz 和 parquet 的解析耗时')
+    parser.add_argument('path', nargs='?', help='要转换的 .xlsx 文件，不指定时生成测试文件')
+    parser.add_argument('--rows', type=int, default=200000, help='生成的数据行数')
+    parser.add_argument('--repeat', type=int, default=3, help='每种格式重复次数，取最快的一次')
+    args = parser.parse_args()
+
+    folder = tempfile.mkdtemp()
+    path = args.path
+    if path is None:
+        path = os.path.join(folder, 'export.xlsx')
+        make_export_workbook(path, args.rows)
+        print(f"生成 {args.rows} 行测试文件: {path}")
+
+    xlsx_time = expected = None
+    for label, format_path in convert(path, folder):
+        elapsed, table = best_time(format_path, args.repeat)
+        rows = list(table.view().iter_dicts())
+        if expected is None:
+            xlsx_time, expected = elapsed, rows
+        same = '一致' if rows == expected else '不一致'
+        print(f"{label}: {os.path.getsize(format_path) / 1024 / 1024:.1f}MB，解析 {elapsed:.2f}s，"
+              f"是 xlsx 的 {xlsx_time / elapsed:.2f} 倍速度，{len(rows)} 行，结果{same}")
+
+
+if __name__ == '__main__':
+    main()
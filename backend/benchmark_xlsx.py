@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+对比 openpyxl 只读模式和流式读取（xlsx_reader）读取 .xlsx 的耗时
+
+用法：
+    python benchmark_xlsx.py                 # 生成与导出数据格式相同的工作簿（默认 20 万行）后对比
+    python benchmark_xlsx.py --rows 50000
+    python benchmark_xlsx.py 导出文件.xlsx     # 使用已有文件对比
+生成的工作簿与 Excel 导出的文件相同使用共享字符串表。
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import zipfile
+from xml.sax.saxutils import escape
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from openpyxl import load_workbook
+
+import app as backend
+from xlsx_reader import XlsxReader
+
+HEADERS = ['deviceId', 'pkgName', 'directives', 'avail', 'userContent', 'imageUrls', 'question',
+           'createTime', 'sessionId', 'duration']
+
+# 与线上相同使用已配置平台的 pkgName，统计时每行都属于某个平台
+PACKAGES = list(dict.fromkeys(backend.app.config['PLATFORM_PACKAGES'].values()))
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '<Override PartName="/xl/sharedStrings.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"/>'
+    '<Override PartName="/xl/styles.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+    '</Types>'
+)
+
+_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Target="xl/workbook.xml" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+    '</Relationships>'
+)
+
+_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="Sheet1" sheetId="1" r:id="rId1"/></sheets></workbook>'
+)
+
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Target="worksheets/sheet1.xml" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>'
+    '<Relationship Id="rId2" Target="sharedStrings.xml" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/sharedStrings"/>'
+    '<Relationship Id="rId3" Target="styles.xml" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles"/>'
+    '</Relationships>'
+)
+
+# 1 号样式为日期时间格式
+_STYLES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<fonts count="1"><font><sz val="11"/><name val="等线"/></font></fonts>'
+    '<fills count="1"><fill><patternFill patternType="none"/></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="2"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="22" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/></cellXfs>'
+    '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+    '</styleSheet>'
+)
+
+
+def _column_letter(index):
+    letters = ''
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
+def make_export_workbook(path, rows, seed=0):
+    """生成与导出数据格式相同的工作簿：设备 ID、包名、指令、反馈、用户输入、图片地址、标签等列"""
+    rng = random.Random(seed)
+    strings = []
+    string_index = {}
+
+    def shared(value):
+        index = string_index.get(value)
+        if index is None:
+            index = string_index[value] = len(strings)
+            strings.append(value)
+        return index
+
+    letters = [_column_letter(i + 1) for i in range(len(HEADERS))]
+    devices = [f'{rng.getrandbits(128):032x}' for _ in range(max(rows // 20, 1))]
+    labels = [f'标签{i}' for i in range(40)]
+    directives = [f'指令{i}' for i in range(25)]
+
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('[Content_Types].xml', _CONTENT_TYPES)
+        archive.writestr('_rels/.rels', _ROOT_RELS)
+        archive.writestr('xl/workbook.xml', _WORKBOOK)
+        archive.writestr('xl/_rels/workbook.xml.rels', _WORKBOOK_RELS)
+        archive.writestr('xl/styles.xml', _STYLES)
+
+        with archive.open('xl/worksheets/sheet1.xml', 'w') as sheet:
+            sheet.write(
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                f'<dimension ref="A1:{letters[-1]}{rows + 1}"/><sheetData>'.encode('utf-8'))
+            header = ''.join(f'<c r="{letters[i]}1" t="s"><v>{shared(name)}</v></c>' for i, name in enumerate(HEADERS))
+            sheet.write(f'<row r="1">{header}</row>'.encode('utf-8'))
+            for r in range(2, rows + 2):
+                values = [
+                    shared(rng.choice(devices)),
+                    shared(rng.choice(PACKAGES)),
+                    shared(rng.choice(directives)) if rng.random() < 0.7 else None,
+                    shared(rng.choice(['有帮助', '无帮助'])) if rng.random() < 0.3 else None,
+                    shared(f'用户输入的内容 {rng.getrandbits(40)}') if rng.random() < 0.9 else None,
+                    shared(f'https://img.example.com/{rng.getrandbits(64):016x}.jpg') if rng.random() < 0.2 else None,
+                    shared(rng.choice(labels)),
+                ]
+                cells = [f'<c r="{letters[i]}{r}" t="s"><v>{value}</v></c>'
+                         for i, value in enumerate(values) if value is not None]
+                cells.append(f'<c r="{letters[7]}{r}" s="1"><v>{45292 + rng.random() * 30:.6f}</v></c>')
+                cells.append(f'<c r="{letters[8]}{r}" t="s"><v>{shared(f"s{rng.getrandbits(48):012x}")}</v></c>')
+                cells.append(f'<c r="{letters[9]}{r}"><v>{rng.randint(1, 5000)}</v></c>')
+                sheet.write(f'<row r="{r}">{"".join(cells)}</row>'.encode('utf-8'))
+            sheet.write(b'</sheetData></worksheet>')
+
+        with archive.open('xl/sharedStrings.xml', 'w') as sst:
+            sst.write(
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<sst xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+                f'count="{len(strings)}" uniqueCount="{len(strings)}">'.encode('utf-8'))
+            for value in strings:
+                sst.write(f'<si><t>{escape(value)}</t></si>'.encode('utf-8'))
+            sst.write(b'</sst>')
+
+
+def read_with_openpyxl(path, max_col=None):
+    wb = load_workbook(path, read_only=True)
+    try:
+        return list(wb.active.iter_rows(max_col=max_col, values_only=True))
+    finally:
+        wb.close()
+
+
+def read_with_stream(path, max_col=None):
+    with XlsxReader(path) as reader:
+        return list(reader.iter_rows(max_col=max_col))
+
+
+def best_time(func, path, repeat, max_col=None):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(path, max_col)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='对比 openpyxl 和流式读取 .xlsx 的耗时')
+    parser.add_argument('path', nargs='?', help='要读取的 .xlsx 文件，不指定时生成测试文件')
+    parser.add_argument('--rows', type=int, default=200000, help='生成的数据行数')
+    parser.add_argument('--repeat', type=int, default=3, help='每种方式重复次数，取最快的一次')
+    args = parser.parse_args()
+
+    path = args.path
+    if path is None:
+        path = os.path.join(tempfile.mkdtemp(), 'export.xlsx')
+        start = time.perf_counter()
+        make_export_workbook(path, args.rows)
+        print(f"生成 {args.rows} 行测试文件: {path}（{time.perf_counter() - start:.1f}s）")
+    print(f"文件大小: {os.path.getsize(path) / 1024 / 1024:.1f}MB")
+
+    # 全部列，以及解析时只取到 question 列（与列投影相同）
+    for label, max_col in (('全部列', None), ('前 7 列', 7)):
+        openpyxl_time, expected = best_time(read_with_openpyxl, path, args.repeat, max_col)
+        stream_time, rows = best_time(read_with_stream, path, args.repeat, max_col)
+        same = '一致' if rows == expected else '不一致'
+        print(f"{label}: openpyxl {openpyxl_time:.2f}s，流式读取 {stream_time:.2f}s，"
+              f"加速 {openpyxl_time / stream_time:.2f} 倍，{len(rows)} 行，结果{same}")
+
+
+if __name__ == '__main__':
+    main()
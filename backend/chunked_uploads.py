@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+"""
+分片上传的存储
+
+单个请求受 nginx 和 MAX_CONTENT_LENGTH 的大小限制，大文件由前端切成固定大小的分片逐个上传：
+- 每个上传在上传目录下有单独的子目录，upload.json 记录文件名、大小、分片大小和状态
+- 每个分片边读请求体边写入 <index>.part，先写临时文件再原子替换，内存占用只有一个读缓冲区
+- 已收到的分片可以随时查询，连接中断后只需补传缺少的分片
+- 全部分片到齐后按顺序拼接成完整文件，同时计算 SHA-256 并与上传前声明的值核对
+多个 worker 可以同时接收同一上传的不同分片。
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+import time
+import uuid
+from pathlib import Path
+
+UPLOAD_ID_PATTERN = re.compile(r'[0-9a-f]{32}')
+SHA256_PATTERN = re.compile(r'[0-9a-f]{64}')
+
+# 读写分片时的缓冲区大小
+COPY_BLOCK_SIZE = 1024 * 1024
+
+META_NAME = 'upload.json'
+PART_SUFFIX = '.part'
+
+
+class ChunkedUploadError(Exception):
+    """分片上传的参数错误或状态错误，status 为返回的 HTTP 状态码"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class ChunkedUploadStore:
+    """基于文件的分片上传存储"""
+
+    def __init__(self, folder, chunk_size, max_age=6 * 3600):
+        self.folder = Path(folder)
+        self.chunk_size = chunk_size
+        self.max_age = max_age
+        self.folder.mkdir(parents=True, exist_ok=True)
+
+    def _dir(self, upload_id):
+        return self.folder / upload_id
+
+    def _write_meta(self, upload_id, meta):
+        tmp_path = self._dir(upload_id) / f'{META_NAME}.{uuid.uuid4().hex}.tmp'
+        tmp_path.write_text(json.dumps(meta, ensure_ascii=False), encoding='utf-8')
+        os.replace(tmp_path, self._dir(upload_id) / META_NAME)
+
+    def _part_path(self, upload_id, index):
+        return self._dir(upload_id) / f'{index}{PART_SUFFIX}'
+
+    def create(self, filename, size, sha256=None):
+        """开始上传，filename 为处理后的安全文件名，sha256 为完整文件的十六进制摘要（可选），返回上传状态"""
+        if sha256 is not None:
+            sha256 = sha256.lower()
+            if SHA256_PATTERN.fullmatch(sha256) is None:
+                raise ChunkedUploadError('sha256 格式不正确')
+        upload_id = uuid.uuid4().hex
+        self._dir(upload_id).mkdir()
+        now = time.time()
+        meta = {
+            'uploadId': upload_id,
+            'filename': filename,
+            'size': size,
+            'sha256': sha256,
+            'chunkSize': self.chunk_size,
+            'chunkCount': max(1, -(-size // self.chunk_size)),
+            'status': 'uploading',
+            'created': now,
+        }
+        self._write_meta(upload_id, meta)
+        meta['received'] = []
+        return meta
+
+    def get(self, upload_id):
+        """读取上传状态，不存在时返回 None"""
+        if not upload_id or UPLOAD_ID_PATTERN.fullmatch(upload_id) is None:
+            return None
+        try:
+            return json.loads((self._dir(upload_id) / META_NAME).read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            return None
+
+    def _require(self, upload_id):
+        meta = self.get(upload_id)
+        if meta is None:
+            raise ChunkedUploadError('上传不存在或已过期', 404)
+        return meta
+
+    def received(self, upload_id):
+        """已收到的分片序号"""
+        indexes = []
+        for path in self._dir(upload_id).iterdir():
+            stem = path.name[:-len(PART_SUFFIX)]
+            if path.name.endswith(PART_SUFFIX) and stem.isdigit():
+                indexes.append(int(stem))
+        return sorted(indexes)
+
+    def status(self, upload_id):
+        """上传状态和已收到的分片序号，用于断点续传"""
+        meta = self._require(upload_id)
+        meta['received'] = [] if meta['status'] == 'complete' else self.received(upload_id)
+        return meta
+
+    def write_chunk(self, upload_id, index, stream, sha256=None):
+        """从 stream 读取第 index 个分片写入磁盘，sha256 为该分片的十六进制摘要（可选）"""
+        meta = self._require(upload_id)
+        if meta['status'] == 'complete':
+            raise ChunkedUploadError('上传已完成', 409)
+        if not 0 <= index < meta['chunkCount']:
+            raise ChunkedUploadError('分片序号超出范围')
+        expected = min(meta['chunkSize'], meta['size'] - index * meta['chunkSize'])
+
+        digest = hashlib.sha256()
+        written = 0
+        tmp_path = self._dir(upload_id) / f'{index}.{uuid.uuid4().hex}.tmp'
+        try:
+            with open(tmp_path, 'wb') as f:
+                while True:
+                    block = stream.read(COPY_BLOCK_SIZE)
+                    if not block:
+                        break
+                    written += len(block)
+                    if written > expected:
+                        break
+                    digest.update(block)
+                    f.write(block)
+            if written != expected:
+                raise ChunkedUploadError(f'分片大小不正确，应为 {expected} 字节')
+            if sha256 is not None and digest.hexdigest() != sha256.lower():
+                raise ChunkedUploadError('分片校验失败，请重新上传该分片')
+            os.replace(tmp_path, self._part_path(upload_id, index))
+        except BaseException:
+            try:
+                tmp_path.unlink()
+            except OSError:
+                pass
+            raise
+
+    def complete(self, upload_id):
+        """拼接全部分片并核对大小和 SHA-256，返回上传状态；重复调用时直接返回已完成的状态"""
+        meta = self._require(upload_id)
+        if meta['status'] == 'complete':
+            return meta
+        missing = meta['chunkCount'] - len(self.received(upload_id))
+        if missing > 0:
+            raise ChunkedUploadError(f'还有 {missing} 个分片没有上传', 409)
+
+        digest = hashlib.sha256()
+        size = 0
+        tmp_path = self._dir(upload_id) / f'data.{uuid.uuid4().hex}.tmp'
+        try:
+            with open(tmp_path, 'wb') as out:
+                for index in range(meta['chunkCount']):
+                    with open(self._part_path(upload_id, index), 'rb') as f:
+                        for block in iter(lambda: f.read(COPY_BLOCK_SIZE), b''):
+                            digest.update(block)
+                            out.write(block)
+                            size += len(block)
+        except OSError:
+            _unlink(tmp_path)
+            # 其他 worker 同时完成了该上传并删除了分片
+            meta = self._require(upload_id)
+            if meta['status'] == 'complete':
+                return meta
+            raise
+
+        sha256 = digest.hexdigest()
+        if size != meta['size'] or (meta['sha256'] is not None and sha256 != meta['sha256']):
+            _unlink(tmp_path)
+            self.remove(upload_id)
+            raise ChunkedUploadError('文件校验失败，请重新上传')
+
+        os.replace(tmp_path, self._dir(upload_id) / meta['filename'])
+        meta.update(status='complete', sha256=sha256, completed=time.time())
+        self._write_meta(upload_id, meta)
+        for index in range(meta['chunkCount']):
+            _unlink(self._part_path(upload_id, index))
+        return meta
+
+    def completed_path(self, upload_id):
+        """已完成上传的文件路径和文件名，并刷新过期时间（同一文件可以多次统计）"""
+        meta = self._require(upload_id)
+        if meta['status'] != 'complete':
+            raise ChunkedUploadError('上传尚未完成', 409)
+        os.utime(self._dir(upload_id))
+        return str(self._dir(upload_id) / meta['filename']), meta['filename']
+
+    def remove(self, upload_id):
+        if UPLOAD_ID_PATTERN.fullmatch(upload_id or '') is not None:
+            shutil.rmtree(self._dir(upload_id), ignore_errors=True)
+
+    def cleanup(self):
+        """删除超过保留时间没有活动的上传（目录修改时间在收到分片、完成和使用时更新）"""
+        now = time.time()
+        for path in self.folder.iterdir():
+            try:
+                if path.is_dir() and now - path.stat().st_mtime > self.max_age:
+                    shutil.rmtree(path, ignore_errors=True)
+            except OSError:
+                pass
+
+
+def _unlink(path):
+    try:
+        path.unlink()
+    except OSError:
+        pass
@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+"""
+列式内存表
+
+每列一个数组，不再为每一行构建字典。pkgName、avail、question、deviceId 等
+重复度高的列使用字典编码：列中只保存整数编码，实际值保存在字典中。
+过滤操作返回 TableView（行号数组），不复制行数据。
+
+缺失的单元格（行比表头短）用 None 表示，对应原来行字典中不存在该键的情况。
+"""
+from array import array
+from itertools import compress
+
+# 默认使用字典编码的列
+ENCODED_COLUMNS = ('pkgName', 'avail', 'question', 'deviceId')
+
+
+class PlainColumn:
+    """普通列：直接保存单元格值"""
+
+    def __init__(self):
+        self.values = []
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, i):
+        return self.values[i]
+
+    def append(self, value):
+        self.values.append(value)
+
+
+class DictColumn:
+    """字典编码列：codes 保存每行的编码，dictionary 保存编码对应的值"""
+
+    def __init__(self):
+        self.codes = array('i')
+        self.dictionary = []
+        # 以 (类型, 值) 为键，避免 1、1.0、True 被合并为同一个编码
+        self._index = {}
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, i):
+        return self.dictionary[self.codes[i]]
+
+    def __getstate__(self):
+        # 编码索引可以由字典重建，不写入缓存
+        return {'codes': self.codes, 'dictionary': self.dictionary}
+
+    def __setstate__(self, state):
+        self.codes = state['codes']
+        self.dictionary = state['dictionary']
+        self._index = {(type(value), value): code for code, value in enumerate(self.dictionary)}
+
+    def append(self, value):
+        key = (type(value), value)
+        code = self._index.get(key)
+        if code is None:
+            code = len(self.dictionary)
+            self._index[key] = code
+            self.dictionary.append(value)
+        self.codes.append(code)
+
+
+class ColumnTable:
+    """列式表：headers 保留原始表头顺序，columns 按列名保存列数据"""
+
+    def __init__(self, headers, columns, nrows):
+        self.headers = headers
+        self.columns = columns
+        self.nrows = nrows
+        # 行字典中键的顺序：按列名第一次出现的位置（只包含读取了的列）
+        self.column_names = [name for name in dict.fromkeys(headers) if name in columns]
+
+    def __len__(self):
+        return self.nrows
+
+    def has_column(self, name):
+        return name in self.columns
+
+    def column(self, name):
+        """返回列对象，不存在时返回 None"""
+        return self.columns.get(name)
+
+    def view(self):
+        """返回包含所有行的视图"""
+        return TableView(self, range(self.nrows))
+
+
+class TableBuilder:
+    """
+    逐行构建 ColumnTable，供 Excel 读取函数使用
+
+    columns 为列投影：只保存这些列，其余单元格不会被读取；为 None 时保存所有列。
+    单元格值为 None 时按空字符串保存。
+    """
+
+    def __init__(self, encoded_columns=ENCODED_COLUMNS, columns=None):
+        self.encoded_columns = encoded_columns
+        self.projection = None if columns is None else frozenset(columns)
+        self.headers = []
+        self.nrows = 0
+        self._columns = {}
+        self._slots = []
+
+    def set_headers(self, headers):
+        self.headers = list(headers)
+        positions = {}
+        for i, name in enumerate(self.headers):
+            positions.setdefault(name, []).append(i)
+
+        self._columns = {}
+        self._slots = []
+        for name, indexes in positions.items():
+            if self.projection is not None and name not in self.projection:
+                continue
+            column = DictColumn() if name in self.encoded_columns else PlainColumn()
+            self._columns[name] = column
+            # 同名列与原来的行字典一致：后出现的列覆盖先出现的列
+            self._slots.append((column, indexes[-1], tuple(reversed(indexes))))
+
+    def append(self, row):
+        width = len(row)
+        if width > len(self.headers):
+            raise ValueError(f"第 {self.nrows + 2} 行的列数 ({width}) 超过表头列数 ({len(self.headers)})")
+
+        for column, last, indexes in self._slots:
+            if last < width:
+                value = row[last]
+            else:
+                # 行比表头短：取仍在范围内的同名列，都不在范围内时为缺失
+                value = None
+                for i in indexes:
+                    if i < width:
+                        value = row[i]
+                        break
+                else:
+                    column.append(None)
+                    continue
+            column.append(value if value is not None else '')
+        self.nrows += 1
+
+    def append_columns(self, values_by_name, nrows):
+        """按列追加 nrows 行（列式文件格式使用），values_by_name 中没有的列为缺失"""
+        for name, column in self._columns.items():
+            values = values_by_name.get(name)
+            append = column.append
+            if values is None:
+                for _ in range(nrows):
+                    append(None)
+                continue
+            if len(values) != nrows:
+                raise ValueError(f"列 {name} 的行数 ({len(values)}) 与其他列 ({nrows}) 不一致")
+            for value in values:
+                append(value if value is not None else '')
+        self.nrows += nrows
+
+    @property
+    def max_position(self):
+        """需要读取的最大列下标，没有需要读取的列时为 -1"""
+        return max((last for _, last, _ in self._slots), default=-1)
+
+    def build(self):
+        return ColumnTable(self.headers, self._columns, self.nrows)
+
+
+class TableView:
+    """表的行视图：indices 为行号序列，过滤时只生成新的行号数组"""
+
+    def __init__(self, table, indices):
+        self.table = table
+        self.indices = indices
+
+    def __len__(self):
+        return len(self.indices)
+
+    def _derive(self, indices):
+        return TableView(self.table, array('l', indices))
+
+    def where(self, name, predicate):
+        """按单列过滤，predicate 接收单元格值（列或单元格缺失时为 None）"""
+        column = self.table.column(name)
+        if column is None:
+            return self._derive(self.indices if predicate(None) else ())
+
+        if isinstance(column, DictColumn):
+            # 字典编码列：每个不同的值只判断一次
+            flags = [predicate(value) for value in column.dictionary]
+            selectors = map(flags.__getitem__, map(column.codes.__getitem__, self.indices))
+        else:
+            selectors = map(predicate, map(column.values.__getitem__, self.indices))
+        return self._derive(compress(self.indices, selectors))
+
+    def filter(self, predicate, *names):
+        """按多列过滤，predicate 依次接收各列的单元格值"""
+        getters = [self._getter(name) for name in names]
+        return self._derive(i for i in self.indices if predicate(*[get(i) for get in getters]))
+
+    def _getter(self, name):
+        column = self.table.column(name)
+        if column is None:
+            return lambda i: None
+        if isinstance(column, DictColumn):
+            codes = column.codes
+            dictionary = column.dictionary
+            return lambda i: dictionary[codes[i]]
+        return column.values.__getitem__
+
+    def values(self, name):
+        """按视图顺序迭代某一列的值"""
+        return map(self._getter(name), self.indices)
+
+    def row_dict(self, i):
+        """还原第 i 行（表中的行号）的行字典，缺失的单元格不出现在字典中"""
+        row = {}
+        for name in self.table.column_names:
+            value = self.table.columns[name][i]
+            if value is not None:
+                row[name] = value
+        return row
+
+    def iter_dicts(self):
+        for i in self.indices:
+            yield self.row_dict(i)
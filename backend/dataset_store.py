@@ -0,0 +1,407 @@
+# -*- coding: utf-8 -*-
+"""
+跨 worker 共享的数据集存储
+
+每次加载的数据写入数据目录下独立的 SQLite 文件（<dataset_id>.db），并返回 dataset_id。
+文件先写到临时文件再原子重命名；查询时以只读方式打开，
+因此任何 gunicorn worker 都能直接查询其他 worker 加载的数据，worker 重启也不会丢失数据。
+
+增量数据在一个写事务中追加到同一个文件：数据库中的 _state 表保存可合并的统计状态（pickle，
+读取时只允许统计状态中会出现的类），
+_row_keys 表保存已导入行的去重键哈希和每个键已导入的行数，数据行、统计状态和去重键一起提交，
+查询只会看到追加前或追加后的数据。
+每次追加后数据库的 user_version（修订号）加 1，查询结果缓存的键包含修订号。
+
+每个数据集旁边有一个 <dataset_id>.json 记录名称（page1_data/page2_data）、会话和行数，
+同一会话下可以同时保存多个数据集；数据库文件的修改时间作为最后访问时间，
+总大小超过预算时按最久未访问的顺序淘汰。
+"""
+import io
+import json
+import os
+import pickle
+import re
+import sqlite3
+import time
+import uuid
+from collections import Counter
+from pathlib import Path
+
+import sqlite_loader
+
+DATASET_ID_PATTERN = re.compile(r'[0-9a-f]{32}')
+
+# 追加数据时等待其他写入或正在执行的查询结束的最长时间（秒）
+APPEND_TIMEOUT = 60
+
+
+# 统计状态中可以出现的类：统计量、设备预聚合、HyperLogLog 草图和单元格值的类型
+STATE_CLASSES = frozenset({
+    ('analysis', 'StatsAccumulator'), ('analysis', 'LabelAccumulator'), ('analysis', 'DeviceRollup'),
+    ('hyperloglog', 'HyperLogLog'),
+    ('builtins', 'set'), ('builtins', 'frozenset'), ('builtins', 'bytearray'), ('builtins', 'complex'),
+    ('datetime', 'datetime'), ('datetime', 'date'), ('datetime', 'time'), ('datetime', 'timedelta'),
+    ('datetime', 'timezone'), ('decimal', 'Decimal'), ('array', 'array'), ('array', '_array_reconstructor'),
+    ('copyreg', '_reconstructor'), ('builtins', 'object'),
+})
+
+
+class DatasetAppendError(Exception):
+    """数据集不存在或不支持追加数据"""
+
+
+class _StateUnpickler(pickle.Unpickler):
+    """只允许 STATE_CLASSES 中的类，数据集文件被篡改时不会执行任意代码"""
+
+    def find_class(self, module, name):
+        if (module, name) not in STATE_CLASSES:
+            raise pickle.UnpicklingError(f'统计状态中不允许的类型: {module}.{name}')
+        return super().find_class(module, name)
+
+
+def _write_state(conn, state, row_keys):
+    conn.execute('CREATE TABLE IF NOT EXISTS _state (value BLOB NOT NULL)')
+    conn.execute('DELETE FROM _state')
+    conn.execute('INSERT INTO _state (value) VALUES (?)', (pickle.dumps(state, pickle.HIGHEST_PROTOCOL),))
+    conn.execute('CREATE TABLE IF NOT EXISTS _row_keys (h INTEGER PRIMARY KEY, n INTEGER NOT NULL DEFAULT 1)')
+    conn.executemany('INSERT INTO _row_keys (h, n) VALUES (?, ?) ON CONFLICT (h) DO UPDATE SET n = n + excluded.n',
+                     Counter(row_keys).items())
+
+
+def _upgrade_row_keys(conn, schema='main'):
+    """之前的版本只记录去重键，没有行数（每个键按 1 行计算）"""
+    columns = [row[1] for row in conn.execute(f'PRAGMA {schema}.table_info(_row_keys)')]
+    if columns and 'n' not in columns:
+        conn.execute(f'ALTER TABLE {schema}._row_keys ADD COLUMN n INTEGER NOT NULL DEFAULT 1')
+
+
+def _read_state(conn):
+    try:
+        row = conn.execute('SELECT value FROM _state').fetchone()
+    except sqlite3.OperationalError:
+        # 追加功能之前创建的数据集没有统计状态
+        return None
+    return _StateUnpickler(io.BytesIO(row[0])).load() if row is not None else None
+
+
+def _read_state_table(conn, schema):
+    """附加数据库 schema 中是否有去重键表"""
+    return conn.execute(f"SELECT 1 FROM {schema}.sqlite_master WHERE type = 'table' AND name = '_row_keys'").fetchone() is not None
+
+
+def _new_row_indexes(conn, row_keys):
+    """
+    去掉已经导入过的行，返回保留的行号，并更新每个键已导入的行数
+
+    同一个键在增量中第 k 次出现（从 0 开始）的行在已导入的行数不超过 k 时保留：增量与之前的文件重叠时
+    重叠部分被去掉，键相同的多行（例如同一设备重复的提问）与一次导入所有数据时一样全部保留。
+    """
+    _upgrade_row_keys(conn)
+    conn.execute('CREATE TEMP TABLE delta_keys (i INTEGER PRIMARY KEY, h INTEGER NOT NULL, k INTEGER NOT NULL)')
+    try:
+        occurrences = Counter()
+
+        def numbered():
+            for i, h in enumerate(row_keys):
+                yield i, h, occurrences[h]
+                occurrences[h] += 1
+        conn.executemany('INSERT INTO temp.delta_keys (i, h, k) VALUES (?, ?, ?)', numbered())
+        kept = [i for i, in conn.execute('SELECT d.i FROM temp.delta_keys d LEFT JOIN main._row_keys r ON r.h = d.h '
+                                         'WHERE d.k >= COALESCE(r.n, 0) ORDER BY d.i')]
+        conn.executemany('INSERT INTO main._row_keys (h, n) VALUES (?, ?) '
+                         'ON CONFLICT (h) DO UPDATE SET n = MAX(n, excluded.n)', occurrences.items())
+    finally:
+        conn.execute('DROP TABLE temp.delta_keys')
+    return kept
+
+
+class DatasetStore:
+    """基于文件的数据集存储"""
+
+    def __init__(self, folder, max_bytes=1024 * 1024 * 1024, max_age=24 * 3600):
+        self.folder = Path(folder)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.folder.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, dataset_id):
+        return self.folder / f'{dataset_id}.db'
+
+    def _meta_path(self, dataset_id):
+        return self.folder / f'{dataset_id}.json'
+
+    def is_valid_id(self, dataset_id):
+        return bool(dataset_id) and DATASET_ID_PATTERN.fullmatch(dataset_id) is not None
+
+    def exists(self, dataset_id):
+        return self.is_valid_id(dataset_id) and self._path(dataset_id).is_file()
+
+    def _write_meta(self, dataset_id, meta):
+        meta_tmp_path = self.folder / f'{dataset_id}.json.{uuid.uuid4().hex}.tmp'
+        meta_tmp_path.write_text(json.dumps(meta, ensure_ascii=False), encoding='utf-8')
+        os.replace(meta_tmp_path, self._meta_path(dataset_id))
+
+    def create(self, view, name='', session='', state=None, row_keys=()):
+        """
+        将视图导入新的数据集文件，返回 dataset_id
+
+        state 为可以追加数据的数据集的统计状态（可 pickle 的对象），row_keys 为已导入行的去重键哈希；
+        state 为 None 时数据集不能追加数据。
+        """
+        dataset_id = uuid.uuid4().hex
+        tmp_path = self.folder / f'{dataset_id}.db.tmp'
+        conn = sqlite3.connect(str(tmp_path))
+        try:
+            rows = sqlite_loader.load_view(conn, view)
+            if state is not None:
+                with conn:
+                    _write_state(conn, state, row_keys)
+        finally:
+            conn.close()
+
+        # 先写元数据再发布数据库文件，列表中出现的数据集一定有元数据
+        self._write_meta(dataset_id, {'name': name, 'session': session, 'rows': rows, 'created': time.time()})
+        os.replace(tmp_path, self._path(dataset_id))
+
+        self.evict(keep=dataset_id)
+        return dataset_id
+
+    def load_state(self, dataset_id):
+        """读取数据集的统计状态，数据集不存在或不能追加数据时返回 None"""
+        if not self.exists(dataset_id):
+            return None
+        try:
+            conn = sqlite3.connect(self._path(dataset_id).absolute().as_uri() + '?mode=ro', uri=True)
+        except sqlite3.Error:
+            return None
+        try:
+            return _read_state(conn)
+        finally:
+            conn.close()
+
+    def append(self, dataset_id, row_keys, update):
+        """
+        在一个写事务中把增量数据追加到数据集，返回 (新的统计状态, 保留的行数)
+
+        row_keys 为增量每一行的去重键哈希，已经导入过的行被去掉（见 _new_row_indexes）；
+        update(kept, state) 接收保留的行号和原来的统计状态，返回 (要追加到 data 表的视图, 新的统计状态)。
+        同一数据集的多次追加依次执行。
+        """
+        if not self.exists(dataset_id):
+            raise DatasetAppendError('数据集不存在或已过期')
+        conn = sqlite3.connect(str(self._path(dataset_id)), timeout=APPEND_TIMEOUT, isolation_level=None)
+        try:
+            conn.execute('PRAGMA temp_store = MEMORY')
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                state = _read_state(conn)
+                if state is None:
+                    raise DatasetAppendError('该数据集不支持追加数据，请重新导入')
+                kept = _new_row_indexes(conn, row_keys)
+                view, state = update(kept, state)
+                sqlite_loader.append_view(conn, view)
+                _write_state(conn, state, ())
+                revision = conn.execute('PRAGMA user_version').fetchone()[0] + 1
+                conn.execute(f'PRAGMA user_version = {revision}')
+                try:
+                    rows = conn.execute('SELECT COUNT(*) FROM data').fetchone()[0]
+                except sqlite3.OperationalError:
+                    # 导入和追加的数据都为空时没有 data 表
+                    rows = 0
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+        finally:
+            conn.close()
+
+        try:
+            meta = json.loads(self._meta_path(dataset_id).read_text(encoding='utf-8'))
+            meta.update(rows=rows, updated=time.time())
+            self._write_meta(dataset_id, meta)
+        except (OSError, ValueError):
+            pass
+        return state, len(kept)
+
+    def merge(self, dataset_ids, name='', session='', state=None):
+        """
+        把多个数据集的 data 表合并到新的数据集（列取并集，在 SQLite 内部复制），返回新的 dataset_id
+
+        state 为合并后的统计状态，不为 None 时合并各数据集已导入行的去重键，新的数据集可以追加数据。
+        合并完成后删除原来的数据集。
+        """
+        dataset_id = uuid.uuid4().hex
+        tmp_path = self.folder / f'{dataset_id}.db.tmp'
+        conn = sqlite3.connect(str(tmp_path), isolation_level=None)
+        rows = 0
+        try:
+            for pragma in sqlite_loader.LOAD_PRAGMAS:
+                conn.execute(pragma)
+            if state is not None:
+                _write_state(conn, state, ())
+            # ATTACH 不能在事务中执行，每个数据集单独附加并在一个事务中复制
+            for source_id in dataset_ids:
+                if not self.exists(source_id):
+                    raise FileNotFoundError(f'数据集 {source_id} 不存在或已过期')
+                conn.execute('ATTACH DATABASE ? AS source', (str(self._path(source_id)),))
+                try:
+                    conn.execute('BEGIN')
+                    rows += sqlite_loader.append_table(conn, 'source')
+                    if state is not None and _read_state_table(conn, 'source'):
+                        # 各文件分别导入，键相同的行数相加
+                        _upgrade_row_keys(conn, 'source')
+                        conn.execute('INSERT INTO main._row_keys (h, n) SELECT h, n FROM source._row_keys WHERE true '
+                                     'ON CONFLICT (h) DO UPDATE SET n = n + excluded.n')
+                    conn.execute('COMMIT')
+                finally:
+                    if conn.in_transaction:
+                        conn.execute('ROLLBACK')
+                    conn.execute('DETACH DATABASE source')
+            sqlite_loader.create_indexes(conn)
+        except BaseException:
+            conn.close()
+            tmp_path.unlink()
+            raise
+        conn.close()
+
+        self._write_meta(dataset_id, {'name': name, 'session': session, 'rows': rows, 'created': time.time()})
+        os.replace(tmp_path, self._path(dataset_id))
+        for source_id in dataset_ids:
+            self._remove(source_id)
+
+        self.evict(keep=dataset_id)
+        return dataset_id
+
+    def remove(self, dataset_id):
+        """删除数据集"""
+        if self.is_valid_id(dataset_id):
+            self._remove(dataset_id)
+
+    def revision(self, dataset_id):
+        """数据集的修订号，每次追加数据后加 1"""
+        try:
+            conn = sqlite3.connect(self._path(dataset_id).absolute().as_uri() + '?mode=ro', uri=True)
+        except sqlite3.Error:
+            return 0
+        try:
+            return conn.execute('PRAGMA user_version').fetchone()[0]
+        except sqlite3.Error:
+            return 0
+        finally:
+            conn.close()
+
+    def info(self, dataset_id):
+        """数据集信息（名称、会话、行数、大小、创建和最后访问时间），不存在时返回 None"""
+        try:
+            meta = json.loads(self._meta_path(dataset_id).read_text(encoding='utf-8'))
+            stat = self._path(dataset_id).stat()
+        except (OSError, ValueError):
+            return None
+        return {
+            'datasetId': dataset_id,
+            'name': meta.get('name', ''),
+            'session': meta.get('session', ''),
+            'rows': meta.get('rows', 0),
+            'size': stat.st_size,
+            'created': meta.get('created', stat.st_mtime),
+            'lastAccess': stat.st_mtime,
+        }
+
+    def list(self, session=None):
+        """列出数据集（指定 session 时只列出该会话的），按最后访问时间从新到旧排序"""
+        datasets = []
+        for path in self.folder.glob('*.db'):
+            info = self.info(path.stem)
+            if info is not None and (session is None or info['session'] == session):
+                datasets.append(info)
+        datasets.sort(key=lambda info: info['lastAccess'], reverse=True)
+        return datasets
+
+    def latest_id(self, session='', name=None):
+        """该会话最近一次加载的数据集 ID（可按名称筛选），没有时返回 None"""
+        datasets = [info for info in self.list(session) if name is None or info['name'] == name]
+        if not datasets:
+            return None
+        return max(datasets, key=lambda info: info['created'])['datasetId']
+
+    def named_datasets(self, session=''):
+        """该会话每个名称最近一次加载的数据集：{名称: dataset_id}"""
+        named = {}
+        for info in sorted(self.list(session), key=lambda info: info['created']):
+            if info['name']:
+                named[info['name']] = info['datasetId']
+        return named
+
+    def touch(self, dataset_id):
+        """更新最后访问时间"""
+        try:
+            os.utime(self._path(dataset_id))
+        except OSError:
+            pass
+
+    def connect(self, dataset_id, attach=None):
+        """
+        以只读方式打开数据集
+
+        attach 为 {别名: dataset_id}，这些数据集以只读方式附加到同一连接，
+        可以在一条 SQL 中用 别名.data 关联查询多个数据集。
+        """
+        uri = self._path(dataset_id).absolute().as_uri() + '?mode=ro'
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        self.touch(dataset_id)
+        try:
+            for alias, attached_id in (attach or {}).items():
+                attached_uri = self._path(attached_id).absolute().as_uri() + '?mode=ro'
+                conn.execute(f'ATTACH DATABASE ? AS {sqlite_loader.quote_identifier(alias)}', (attached_uri,))
+                self.touch(attached_id)
+        except sqlite3.Error:
+            conn.close()
+            raise
+        return conn
+
+    def _remove(self, dataset_id):
+        for path in (self._path(dataset_id), self._meta_path(dataset_id)):
+            try:
+                path.unlink()
+            except OSError:
+                pass
+
+    def evict(self, keep=None):
+        """删除过期的数据集和遗留的临时文件，总大小超过预算时按最久未访问的顺序淘汰"""
+        now = time.time()
+        for path in self.folder.glob('*.tmp'):
+            try:
+                if now - path.stat().st_mtime > self.max_age:
+                    path.unlink()
+            except OSError:
+                pass
+
+        datasets = []
+        total_bytes = 0
+        for path in self.folder.glob('*.db'):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            if path.stem != keep and now - stat.st_mtime > self.max_age:
+                self._remove(path.stem)
+                continue
+            datasets.append((stat.st_mtime, stat.st_size, path.stem))
+            total_bytes += stat.st_size
+
+        datasets.sort()
+        for _, size, dataset_id in datasets:
+            if total_bytes <= self.max_bytes:
+                break
+            if dataset_id == keep:
+                continue
+            self._remove(dataset_id)
+            total_bytes -= size
+
+        # 数据库文件已被删除的元数据
+        for path in self.folder.glob('*.json'):
+            try:
+                if not self._path(path.stem).exists() and now - path.stat().st_mtime > 60:
+                    path.unlink()
+            except OSError:
+                pass
@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+"""
+服务器端的排除列表库（需去除的 userContent）
+
+每周审核过的 userContent 追加到有名称的排除列表，导入时按名称引用，不用每次上传越来越大的过滤文件：
+- 每个条目保存为 userContent 的 64 位哈希（blake2b），按大小排序保存在 array('Q') 中，每个条目 8 字节；
+  用 Python set 保存完整字符串时每个条目通常在 100 字节以上
+- 按哈希的高位分桶，记录每个桶在有序数组中的起始位置（平均每桶约 8 个条目，每个条目约 0.5 字节），
+  判断是否在列表中时只在一个桶内二分查找，耗时与列表大小基本无关
+- 64 位哈希在千万条目时误判的概率约为 5e-13，可以忽略
+- 列表保存为 <key>.bin（pickle）和 <key>.json（名称、条目数、更新时间），先写临时文件再原子替换；
+  追加和删除时用文件锁（没有 fcntl 时为进程内的锁）串行执行，各 worker 按文件修改时间缓存读取的列表
+"""
+import hashlib
+import json
+import os
+import pickle
+import re
+import struct
+import tempfile
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from pathlib import Path
+
+try:
+    import fcntl
+    HAS_FCNTL = True
+except ImportError:
+    HAS_FCNTL = False
+
+# 列表名称：字母、数字、汉字、下划线和连字符
+LIST_NAME_PATTERN = re.compile(r'[\w-]{1,64}')
+
+# 每个 worker 缓存最近使用的列表数
+LIST_CACHE_SIZE = 8
+
+# 每个桶的平均条目数
+BUCKET_ENTRIES = 8
+
+
+# 复制初始状态比每次新建 blake2b 对象快
+_HASH_BASE = hashlib.blake2b(digest_size=8)
+_unpack_hash = struct.Struct('>Q').unpack
+
+
+def content_hash(text):
+    """userContent 文本的 64 位哈希（无符号整数）"""
+    h = _HASH_BASE.copy()
+    h.update(text.encode('utf-8', 'surrogatepass'))
+    return _unpack_hash(h.digest())[0]
+
+
+def bucket_offsets(hashes):
+    """有序哈希数组的分桶：返回 (桶的位数, 每个桶的起始位置 array('I')，最后一项为条目总数)"""
+    bits = (len(hashes) // BUCKET_ENTRIES).bit_length()
+    shift = 64 - bits
+    offsets = array('I')
+    start = 0
+    for bucket in range(1 << bits):
+        start = bisect_left(hashes, bucket << shift, start)
+        offsets.append(start)
+    offsets.append(len(hashes))
+    return bits, offsets
+
+
+class ExclusionSet:
+    """
+    排除列表的只读集合：value in exclusion_set 判断文本是否在列表中，用法与 set 相同
+
+    hashes 为排好序的 array('Q')，bits 和 offsets 为 bucket_offsets 的分桶。
+    """
+
+    def __init__(self, hashes, bits, offsets):
+        self.hashes = hashes
+        self.offsets = offsets
+        self._shift = 64 - bits
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def __contains__(self, value):
+        h = content_hash(value)
+        bucket = h >> self._shift
+        hi = self.offsets[bucket + 1]
+        i = bisect_left(self.hashes, h, self.offsets[bucket], hi)
+        return i < hi and self.hashes[i] == h
+
+
+class ExclusionUnion:
+    """多个集合（排除列表和上传的过滤数据）的并集，值在任一集合中即需去除"""
+
+    def __init__(self, parts):
+        self.parts = parts
+
+    def __len__(self):
+        return sum(len(part) for part in self.parts)
+
+    def __contains__(self, value):
+        for part in self.parts:
+            if value in part:
+                return True
+        return False
+
+
+def union(parts):
+    """parts 中不为 None 的集合的并集，都为 None 时返回 None"""
+    parts = [part for part in parts if part is not None]
+    if not parts:
+        return None
+    return parts[0] if len(parts) == 1 else ExclusionUnion(parts)
+
+
+def _merge_sorted(hashes, new_hashes):
+    """把排好序且不在 hashes 中的 new_hashes 合并到 hashes，返回新的有序数组"""
+    if len(new_hashes) * 64 > len(hashes):
+        # 新增的条目较多时整体排序（两段有序数据的归并）
+        return array('Q', sorted(hashes.tolist() + new_hashes))
+    merged = array('Q')
+    start = 0
+    for h in new_hashes:
+        i = bisect_left(hashes, h, start)
+        merged.extend(hashes[start:i])
+        merged.append(h)
+        start = i
+    merged.extend(hashes[start:])
+    return merged
+
+
+class ExclusionLibrary:
+    """按名称保存的排除列表"""
+
+    def __init__(self, folder):
+        self.folder = Path(folder)
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+    def _key(self, name):
+        return hashlib.sha256(name.encode('utf-8')).hexdigest()[:32]
+
+    def _data_path(self, name):
+        return self.folder / f'{self._key(name)}.bin'
+
+    def _meta_path(self, name):
+        return self.folder / f'{self._key(name)}.json'
+
+    def _write_atomic(self, path, data):
+        fd, tmp_path = tempfile.mkstemp(dir=self.folder, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def _locked(self, name):
+        """追加和删除同一列表时的锁（所有 worker 共享），返回释放函数"""
+        self._write_lock.acquire()
+        if not HAS_FCNTL:
+            return self._write_lock.release
+        lock_file = open(self.folder / f'{self._key(name)}.lock', 'a')
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+        def release():
+            lock_file.close()
+            self._write_lock.release()
+        return release
+
+    def list(self):
+        """所有列表的名称、条目数、创建和更新时间，按名称排序"""
+        lists = []
+        for path in self.folder.glob('*.json'):
+            try:
+                lists.append(json.loads(path.read_text(encoding='utf-8')))
+            except (OSError, ValueError):
+                continue
+        return sorted(lists, key=lambda meta: meta['name'])
+
+    def exists(self, name):
+        return bool(LIST_NAME_PATTERN.fullmatch(name)) and self._data_path(name).exists()
+
+    def _read(self, name):
+        path = self._data_path(name)
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            return None, None
+        # 追加后文件被替换，修改时间或 inode 变化
+        version = (stat.st_mtime_ns, stat.st_ino, stat.st_size)
+        with self._cache_lock:
+            cached = self._cache.get(name)
+            if cached is not None and cached[0] == version:
+                self._cache.move_to_end(name)
+                return version, cached[1]
+        try:
+            with open(path, 'rb') as f:
+                data = pickle.load(f)
+        except FileNotFoundError:
+            return None, None
+        exclusion_set = ExclusionSet(data['hashes'], data['bits'], data['offsets'])
+        with self._cache_lock:
+            self._cache[name] = (version, exclusion_set)
+            self._cache.move_to_end(name)
+            while len(self._cache) > LIST_CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return version, exclusion_set
+
+    def load(self, name):
+        """读取列表为 ExclusionSet，不存在时返回 None"""
+        if not LIST_NAME_PATTERN.fullmatch(name):
+            return None
+        return self._read(name)[1]
+
+    def append(self, name, contents):
+        """把 contents（userContent 文本）追加到列表（不存在时新建），返回 (新增的条目数, 条目总数)"""
+        if not LIST_NAME_PATTERN.fullmatch(name):
+            raise ValueError('排除列表名称只能包含字母、数字、汉字、下划线和连字符，最多 64 个字符')
+        new_hashes = sorted({content_hash(text) for text in contents})
+
+        release = self._locked(name)
+        try:
+            _, current = self._read(name)
+            now = time.time()
+            if current is None:
+                hashes = array('Q')
+                meta = {'name': name, 'createdAt': now}
+            else:
+                hashes = current.hashes
+                try:
+                    meta = json.loads(self._meta_path(name).read_text(encoding='utf-8'))
+                except (OSError, ValueError):
+                    meta = {'name': name, 'createdAt': now}
+
+            added = [h for h in new_hashes if not self._contains_hash(hashes, h)]
+            hashes = _merge_sorted(hashes, added)
+            bits, offsets = bucket_offsets(hashes)
+
+            data = {'hashes': hashes, 'bits': bits, 'offsets': offsets}
+            self._write_atomic(self._data_path(name), pickle.dumps(data, pickle.HIGHEST_PROTOCOL))
+            meta.update(count=len(hashes), updatedAt=now,
+                        bytes=hashes.itemsize * len(hashes) + offsets.itemsize * len(offsets))
+            self._write_atomic(self._meta_path(name), json.dumps(meta, ensure_ascii=False).encode('utf-8'))
+            return len(added), len(hashes)
+        finally:
+            release()
+
+    @staticmethod
+    def _contains_hash(hashes, h):
+        i = bisect_left(hashes, h)
+        return i < len(hashes) and hashes[i] == h
+
+    def remove(self, name):
+        """删除列表，不存在时返回 False"""
+        if not self.exists(name):
+            return False
+        release = self._locked(name)
+        try:
+            removed = False
+            for path in (self._data_path(name), self._meta_path(name)):
+                try:
+                    path.unlink()
+                    removed = True
+                except FileNotFoundError:
+                    pass
+            with self._cache_lock:
+                self._cache.pop(name, None)
+            return removed
+        finally:
+            release()
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+HyperLogLog 近似去重计数
+
+合并多个月或多个地区的数据时，用 set 保存所有 deviceId 的内存没有上限。HyperLogLog 只保存
+2^precision 个寄存器（默认 precision=14，16KB），与设备数无关：
+- 估计按寄存器值的分布修正（Ertl 2017），各种设备数都没有系统偏差，包括原来线性计数与原始估计
+  的切换点（默认约 4 万个设备，原来偏高约 2%）附近；几千个设备以内几乎没有误差
+- 标准误差约为 1.04 / sqrt(2^precision)，默认约 0.81%，约 95% 的结果误差在 ±1.6% 以内
+- 两个草图按寄存器取最大值即可求并集，结果与把所有设备放在一起计数相同
+接口与 set 相同（add、len、|=），可以直接替换 StatsAccumulator 中的设备集合。
+"""
+import hashlib
+import math
+
+DEFAULT_PRECISION = 14
+
+
+def _hash64(value):
+    # 与 set 一致，'1' 和 1 视为不同的设备
+    key = value if isinstance(value, str) else '\x00' + repr(value)
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+# m 趋于无穷时的修正系数 1 / (2 ln 2)
+_ALPHA_INF = 1 / (2 * math.log(2))
+
+
+def _sigma(x):
+    """值为 0 的寄存器比例 x 的修正项，x 为 1（空草图）时为无穷大"""
+    if x == 1:
+        return math.inf
+    y = 1
+    z = x
+    while True:
+        x *= x
+        previous = z
+        z += x * y
+        y += y
+        if z == previous:
+            return z
+
+
+def _tau(x):
+    """达到上限的寄存器以外的比例 x 的修正项"""
+    if x == 0 or x == 1:
+        return 0
+    y = 1
+    z = 1 - x
+    while True:
+        x = math.sqrt(x)
+        previous = z
+        y *= 0.5
+        z -= (1 - x) ** 2 * y
+        if z == previous:
+            return z / 3
+
+
+def standard_error(precision=DEFAULT_PRECISION):
+    """precision 对应的相对标准误差"""
+    return 1.04 / math.sqrt(1 << precision)
+
+
+class HyperLogLog:
+    """可合并的近似去重计数草图"""
+
+    def __init__(self, precision=DEFAULT_PRECISION):
+        if not 4 <= precision <= 18:
+            raise ValueError('precision 必须在 4 到 18 之间')
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add(self, value):
+        x = _hash64(value)
+        index = x >> (64 - self.precision)
+        bits = 64 - self.precision
+        # 剩余位中第一个 1 的位置（从 1 开始）
+        rank = bits - (x & ((1 << bits) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def update(self, other):
+        """并入另一个草图（按寄存器取最大值）或一组值"""
+        if not isinstance(other, HyperLogLog):
+            for value in other:
+                self.add(value)
+            return
+        if other.precision != self.precision:
+            raise ValueError('只能合并 precision 相同的 HyperLogLog')
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def estimate(self):
+        """
+        按寄存器值的分布估计基数（Ertl 2017 的改进估计）
+
+        用 sigma、tau 分别修正值为 0 和达到上限的寄存器，从几个设备到远超 2^precision 都没有系统偏差，
+        不需要在线性计数和原始估计之间切换（切换点附近原始估计约偏高 2%）。
+        """
+        m = len(self.registers)
+        q = 64 - self.precision
+        # 每个寄存器值的个数
+        counts = [self.registers.count(k) for k in range(q + 2)]
+        z = m * _tau(1 - counts[q + 1] / m)
+        for k in range(q, 0, -1):
+            z = 0.5 * (z + counts[k])
+        z += m * _sigma(counts[0] / m)
+        return _ALPHA_INF * m * m / z
+
+    def __len__(self):
+        return int(round(self.estimate()))
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+异步导入任务的状态存储
+
+每个任务的状态（status、stage、已处理行数、错误和结果）保存在任务目录下的 <job_id>.json 中，
+先写临时文件再原子替换。提交任务的 worker、执行任务的进程和查询状态的 worker 可以不是同一个进程。
+"""
+import json
+import os
+import re
+import time
+import uuid
+from pathlib import Path
+
+JOB_ID_PATTERN = re.compile(r'[0-9a-f]{32}')
+
+
+class JobStore:
+    """基于文件的任务状态存储"""
+
+    def __init__(self, folder, max_age=3600):
+        self.folder = Path(folder)
+        self.max_age = max_age
+        self.folder.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, job_id):
+        return self.folder / f'{job_id}.json'
+
+    def _write(self, job_id, job):
+        tmp_path = self.folder / f'{job_id}.{os.getpid()}.tmp'
+        tmp_path.write_text(json.dumps(job, ensure_ascii=False), encoding='utf-8')
+        os.replace(tmp_path, self._path(job_id))
+
+    def create(self, kind):
+        """创建排队中的任务，返回 job_id"""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        self._write(job_id, {
+            'jobId': job_id,
+            'kind': kind,
+            'status': 'queued',
+            'stage': 'queued',
+            'rowsProcessed': None,
+            'created': now,
+            'updated': now,
+        })
+        return job_id
+
+    def get(self, job_id):
+        """读取任务状态，不存在时返回 None"""
+        if not job_id or JOB_ID_PATTERN.fullmatch(job_id) is None:
+            return None
+        try:
+            return json.loads(self._path(job_id).read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            return None
+
+    def update(self, job_id, **fields):
+        """更新任务状态（同一任务只由执行它的进程更新）"""
+        job = self.get(job_id)
+        if job is None:
+            return
+        job.update(fields)
+        job['updated'] = time.time()
+        self._write(job_id, job)
+
+    def remove(self, job_id):
+        try:
+            self._path(job_id).unlink()
+        except OSError:
+            pass
+
+    def cleanup(self):
+        """删除超过保留时间的任务状态和遗留的临时文件"""
+        now = time.time()
+        for path in self.folder.iterdir():
+            if not (path.name.endswith('.json') or path.name.endswith('.tmp')):
+                continue
+            try:
+                if now - path.stat().st_mtime > self.max_age:
+                    path.unlink()
+            except OSError:
+                pass
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""
+用户 SQL 的资源保护
+
+- 时间限制：通过 SQLite 的 progress handler 定期检查，超时后中断查询
+- 取消：取消请求在查询目录下写入 <query_id>.cancel 标记文件，
+  执行查询的 worker（可能是另一个进程）在 progress handler 中发现后中断查询
+- 权限：禁止 ATTACH、DETACH、VACUUM INTO 和修改设置的 PRAGMA，用户 SQL 不能写入任何数据库文件
+- 查询槽：同时执行的用户 SQL 不超过固定数量，避免占满所有 gunicorn worker。
+  有 fcntl 时用文件锁在所有 worker 之间共享，否则（Windows）退化为进程内的信号量
+"""
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+
+try:
+    import fcntl
+    HAS_FCNTL = True
+except ImportError:
+    HAS_FCNTL = False
+
+QUERY_ID_PATTERN = re.compile(r'[0-9A-Za-z_-]{1,64}')
+
+# progress handler 每执行多少条 SQLite 虚拟机指令检查一次
+PROGRESS_INTERVAL = 10000
+
+# 检查取消标记文件的最小间隔（秒）
+CANCEL_CHECK_INTERVAL = 0.2
+
+# 用户 SQL 连接的 PRAGMA：临时表和排序写到临时文件，限制页缓存大小
+QUERY_PRAGMAS = (
+    'PRAGMA temp_store = FILE',
+    'PRAGMA cache_size = -16384',  # 16MB
+)
+
+# 用户 SQL 可以执行的带参数的 PRAGMA（只读取结构信息），其他带参数的 PRAGMA 视为修改设置
+READ_PRAGMAS = frozenset({
+    'table_info', 'table_xinfo', 'table_list', 'index_list', 'index_info', 'index_xinfo',
+    'foreign_key_list', 'foreign_key_check', 'integrity_check', 'quick_check',
+})
+
+
+class QueryAborted(Exception):
+    """查询超时、被取消或包含不允许执行的语句"""
+
+
+class QueryBusy(Exception):
+    """没有空闲的查询槽"""
+
+
+class QuerySlots:
+    """固定数量的查询槽"""
+
+    def __init__(self, folder, slots):
+        self.folder = Path(folder)
+        self.slots = slots
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self._semaphore = threading.BoundedSemaphore(slots)
+
+    def acquire(self, timeout):
+        """获取一个查询槽，超过 timeout 秒仍没有空闲槽时抛出 QueryBusy；返回释放函数"""
+        deadline = time.monotonic() + timeout
+        if not HAS_FCNTL:
+            if not self._semaphore.acquire(timeout=timeout):
+                raise QueryBusy('查询繁忙，请稍后重试')
+            return self._semaphore.release
+
+        while True:
+            for slot in range(self.slots):
+                lock_file = open(self.folder / f'slot-{slot}.lock', 'a')
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    lock_file.close()
+                    continue
+                # 进程退出时文件关闭，锁会自动释放
+                return lock_file.close
+            if time.monotonic() >= deadline:
+                raise QueryBusy('查询繁忙，请稍后重试')
+            time.sleep(0.1)
+
+
+class QueryGuard:
+    """为一次查询安装时间限制和取消检查，时间限制从 install 开始计算（不含等待查询槽的时间）"""
+
+    def __init__(self, folder, query_id=None, time_limit=30):
+        self.folder = Path(folder)
+        self.query_id = query_id if query_id and QUERY_ID_PATTERN.fullmatch(query_id) else uuid.uuid4().hex
+        self.time_limit = time_limit
+        self.deadline = None
+        self.reason = None
+        self._next_cancel_check = 0
+
+    @property
+    def cancel_path(self):
+        return self.folder / f'{self.query_id}.cancel'
+
+    def install(self, conn):
+        """安装时间限制、取消检查和语句权限检查，之后连接上只执行用户 SQL"""
+        self.deadline = time.monotonic() + self.time_limit
+        for pragma in QUERY_PRAGMAS:
+            conn.execute(pragma)
+        conn.set_progress_handler(self._check, PROGRESS_INTERVAL)
+        conn.set_authorizer(self._authorize)
+
+    def _check(self):
+        # 返回非零值时 SQLite 中断当前语句
+        now = time.monotonic()
+        if now > self.deadline:
+            self.reason = f'查询超过 {self.time_limit} 秒时间限制，已终止'
+            return 1
+        if now >= self._next_cancel_check:
+            self._next_cancel_check = now + CANCEL_CHECK_INTERVAL
+            if self.cancel_path.exists():
+                self.reason = '查询已取消'
+                return 1
+        return 0
+
+    def _authorize(self, action, arg1, arg2, database, trigger):
+        # 只读连接仍可以 ATTACH 其他可写的数据库文件（VACUUM INTO 也通过 ATTACH 写出文件），
+        # 禁止后用户 SQL 不能修改数据集的文件（例如 _state 表）
+        if action in (sqlite3.SQLITE_ATTACH, sqlite3.SQLITE_DETACH):
+            self.reason = '不允许在查询中附加、分离数据库或执行 VACUUM INTO'
+            return sqlite3.SQLITE_DENY
+        if action == sqlite3.SQLITE_PRAGMA and arg2 is not None and arg1.lower() not in READ_PRAGMAS:
+            self.reason = f'不允许在查询中修改 PRAGMA {arg1}'
+            return sqlite3.SQLITE_DENY
+        return sqlite3.SQLITE_OK
+
+    def translate(self, error):
+        """把被 progress handler 中断或权限检查拒绝的 sqlite3 错误转换为 QueryAborted，其他错误原样返回"""
+        if self.reason and isinstance(error, sqlite3.DatabaseError):
+            return QueryAborted(self.reason)
+        return error
+
+    def finish(self):
+        try:
+            self.cancel_path.unlink()
+        except OSError:
+            pass
+
+
+def request_cancel(folder, query_id):
+    """写入取消标记；query_id 无效时返回 False"""
+    if not query_id or not QUERY_ID_PATTERN.fullmatch(query_id):
+        return False
+    Path(folder).mkdir(parents=True, exist_ok=True)
+    (Path(folder) / f'{query_id}.cancel').touch()
+    return True
+
+
+def cleanup_cancel_markers(folder, max_age=3600):
+    """删除没有被查询处理的过期取消标记"""
+    now = time.time()
+    for path in Path(folder).glob('*.cancel'):
+        try:
+            if now - path.stat().st_mtime > max_age:
+                path.unlink()
+        except OSError:
+            pass
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+SQL 查询结果的分页和流式输出
+
+- 分页：每页最多 page_size 行，还有数据时返回继续查询用的分页标记。
+  数据集写完后不再修改，同一条 SQL 重新执行的结果顺序不变，
+  因此分页标记只记录数据集、SQL 摘要和偏移量，翻页时重新执行 SQL 并跳过前面的行。
+- 流式：边遍历游标边输出 NDJSON 或 CSV，每次只在内存中保留一批行；超过行数上限时在末尾写出截断标记。
+"""
+import base64
+import csv
+import hashlib
+import json
+from io import StringIO
+
+# 流式输出和跳过行时每批读取的行数
+FETCH_BATCH_SIZE = 1000
+
+
+class PageTokenError(ValueError):
+    """分页标记无效或与当前查询不匹配"""
+
+
+def _query_digest(dataset_id, query):
+    return hashlib.sha256(f'{dataset_id}\n{query}'.encode('utf-8')).hexdigest()[:16]
+
+
+def encode_page_token(dataset_id, query, offset):
+    payload = json.dumps({'d': dataset_id, 'q': _query_digest(dataset_id, query), 'o': offset})
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+
+def decode_page_token(token, dataset_id, query):
+    """返回分页标记中的偏移量"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+        offset = int(payload['o'])
+        matches = payload['d'] == dataset_id and payload['q'] == _query_digest(dataset_id, query)
+    except (ValueError, TypeError, KeyError, UnicodeError):
+        raise PageTokenError('分页标记无效，请重新查询')
+    if not matches or offset < 0:
+        raise PageTokenError('分页标记与当前查询不匹配，请重新查询')
+    return offset
+
+
+def column_names(cursor):
+    # 非查询语句没有结果列
+    return [description[0] for description in cursor.description or ()]
+
+
+def fetch_page(cursor, offset, page_size):
+    """跳过前 offset 行后读取一页，返回 (rows, has_more)"""
+    skipped = 0
+    while skipped < offset:
+        batch = cursor.fetchmany(min(FETCH_BATCH_SIZE, offset - skipped))
+        if not batch:
+            return [], False
+        skipped += len(batch)
+
+    rows = cursor.fetchmany(page_size + 1)
+    return rows[:page_size], len(rows) > page_size
+
+
+def _iter_batches(cursor, max_rows=None):
+    remaining = max_rows
+    while remaining is None or remaining > 0:
+        batch_size = FETCH_BATCH_SIZE if remaining is None else min(FETCH_BATCH_SIZE, remaining)
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        if remaining is not None:
+            remaining -= len(rows)
+        yield rows
+
+
+def _truncated(cursor, written, max_rows):
+    """已经输出 max_rows 行后游标中是否还有数据（多读取一行判断）"""
+    return max_rows is not None and written >= max_rows and cursor.fetchone() is not None
+
+
+def truncation_message(max_rows):
+    return f'结果超过 {max_rows} 行，只导出了前 {max_rows} 行'
+
+
+def iter_ndjson(cursor, names, max_rows=None):
+    """
+    每行输出一个 JSON 对象，最多输出 max_rows 行
+
+    超过 max_rows 行时最后输出 {"truncated": true, "maxRows": ..., "message": ...}，客户端据此判断结果不完整。
+    """
+    written = 0
+    for rows in _iter_batches(cursor, max_rows):
+        written += len(rows)
+        yield ''.join(json.dumps(dict(zip(names, row)), ensure_ascii=False) + '\n' for row in rows)
+    if _truncated(cursor, written, max_rows):
+        yield json.dumps({'truncated': True, 'maxRows': max_rows, 'message': truncation_message(max_rows)},
+                         ensure_ascii=False) + '\n'
+
+
+def iter_csv(cursor, names, max_rows=None):
+    """
+    输出带 BOM 的 CSV（Excel 打开中文不乱码），最多输出 max_rows 行
+
+    超过 max_rows 行时最后一行为只有一列的截断提示。
+    """
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('\ufeff')
+    writer.writerow(names)
+    written = 0
+    for rows in _iter_batches(cursor, max_rows):
+        written += len(rows)
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if _truncated(cursor, written, max_rows):
+        writer.writerow([f'# {truncation_message(max_rows)}'])
+    if buffer.tell():
+        yield buffer.getvalue()
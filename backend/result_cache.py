@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+SQL 查询结果缓存
+
+缓存键由数据集 ID 和修订号（包括按名称附加的数据集）、规范化后的 SQL 和分页参数组成。
+重新加载数据会生成新的数据集 ID，追加数据会增加修订号，因此旧结果不会再被命中，
+之后按 LRU 淘汰即可。
+缓存和命中/未命中计数保存在一个 SQLite 文件中，所有 gunicorn worker 共享；
+缓存读写出错时按未命中处理，不影响查询本身。
+"""
+import hashlib
+import json
+import re
+import sqlite3
+import time
+from pathlib import Path
+
+# 字符串字面量和带引号的标识符，规范化时保持原样
+_QUOTED_PATTERN = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|`[^`]*`|\[[^\]]*\])")
+
+# 注释（-- 到行尾、/* */，未结束的块注释到语句结尾），引号内的内容按 group(1) 跳过
+_COMMENT_PATTERN = re.compile(_QUOTED_PATTERN.pattern + r"|--[^\n]*|/\*.*?(?:\*/|\Z)", re.DOTALL)
+
+# 结果不确定的查询不缓存：随机数、当前时间（CURRENT_* 关键字、'now' 参数和省略时间参数的日期函数）
+# 以及与连接状态相关的函数
+_VOLATILE_PATTERN = re.compile(
+    r"\brandom(?:blob)?\s*\("
+    r"|['\"]now['\"]"
+    r"|\bcurrent_(?:timestamp|date|time)\b"
+    r"|\b(?:date|time|datetime|julianday|unixepoch)\s*\(\s*\)"
+    r"|\bstrftime\s*\(\s*'(?:[^']|'')*'\s*\)"
+    r"|\b(?:changes|total_changes|last_insert_rowid)\s*\(",
+    re.IGNORECASE)
+
+_SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS results ('
+    'key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)',
+    'CREATE INDEX IF NOT EXISTS idx_results_last_access ON results (last_access)',
+    'CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)',
+)
+
+
+def normalize_sql(query):
+    """去掉引号外的注释，合并引号外的连续空白，去掉首尾空白和末尾的分号"""
+    # 先去掉注释，否则合并空白后 -- 注释会延续到之后的语句
+    query = _COMMENT_PATTERN.sub(lambda m: m.group(1) or ' ', query)
+    parts = _QUOTED_PATTERN.split(query)
+    # split 的结果中奇数位置是引号内的内容
+    for i in range(0, len(parts), 2):
+        parts[i] = re.sub(r'\s+', ' ', parts[i])
+    return ''.join(parts).strip().rstrip(';').strip()
+
+
+def is_cacheable(query):
+    return _VOLATILE_PATTERN.search(query) is None
+
+
+def make_key(dataset_id, attached, query, offset, page_size, revisions=None):
+    """attached 为按名称附加的数据集 {别名: dataset_id}，revisions 为各数据集的修订号 {dataset_id: 修订号}"""
+    payload = json.dumps([dataset_id, sorted(attached.items()), normalize_sql(query), offset, page_size,
+                          sorted((revisions or {}).items())], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ResultCache:
+    """基于 SQLite 文件的查询结果缓存，超出容量上限时按最近访问时间（LRU）淘汰"""
+
+    def __init__(self, path, max_bytes, max_entry_bytes=None):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        # 单个结果超过该大小时不缓存，避免一个大结果挤掉所有常用查询
+        self.max_entry_bytes = max_entry_bytes or max_bytes // 8
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode = WAL')
+            for statement in _SCHEMA:
+                conn.execute(statement)
+
+    def _connect(self):
+        return sqlite3.connect(str(self.path), timeout=5)
+
+    def _count(self, conn, name):
+        conn.execute('INSERT INTO counters (name, value) VALUES (?, 1) '
+                     'ON CONFLICT (name) DO UPDATE SET value = value + 1', (name,))
+
+    def get(self, key):
+        """读取缓存的结果，未命中返回 None"""
+        try:
+            conn = self._connect()
+            try:
+                with conn:
+                    row = conn.execute('SELECT value FROM results WHERE key = ?', (key,)).fetchone()
+                    if row is None:
+                        self._count(conn, 'misses')
+                        return None
+                    conn.execute('UPDATE results SET last_access = ? WHERE key = ?', (time.time(), key))
+                    self._count(conn, 'hits')
+                return json.loads(row[0])
+            finally:
+                conn.close()
+        except (sqlite3.Error, ValueError):
+            return None
+
+    def put(self, key, value):
+        """写入结果，并在超出容量时淘汰最久未使用的条目"""
+        text = json.dumps(value, ensure_ascii=False)
+        size = len(text.encode('utf-8'))
+        if size > self.max_entry_bytes:
+            return
+        try:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.execute('INSERT OR REPLACE INTO results (key, value, size, last_access) VALUES (?, ?, ?, ?)',
+                                 (key, text, size, time.time()))
+                    self._evict(conn)
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            pass
+
+    def _evict(self, conn):
+        total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM results').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = []
+        for key, size in conn.execute('SELECT key, size FROM results ORDER BY last_access'):
+            if total <= self.max_bytes:
+                break
+            evicted.append((key,))
+            total -= size
+        conn.executemany('DELETE FROM results WHERE key = ?', evicted)
+
+    def stats(self):
+        """命中/未命中次数、命中率、条目数和占用字节数"""
+        conn = self._connect()
+        try:
+            counters = dict(conn.execute('SELECT name, value FROM counters'))
+            entries, total = conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results').fetchone()
+        finally:
+            conn.close()
+        hits = counters.get('hits', 0)
+        misses = counters.get('misses', 0)
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hitRate': round(hits / (hits + misses), 4) if hits + misses else 0,
+            'entries': entries,
+            'bytes': total,
+            'maxBytes': self.max_bytes,
+        }
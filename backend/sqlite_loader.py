@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""
+SQLite 批量导入
+
+把列式表视图导入 SQLite 的 data 表供 SQL 查询页使用：
+- 在一个事务中分批 executemany 插入，导入期间关闭日志和同步写
+- 根据数据推断 INTEGER/REAL/TEXT 列类型
+- 自动为常用查询列建立索引
+- 列名统一加引号，包含空格或中文的表头也能正常建表
+- 增量数据追加到已有的表，新出现的列自动添加
+- 多个数据集的表可以在 SQLite 内部合并（批量导入），不经过 Python
+"""
+from itertools import islice
+
+# 自动建立索引的列
+INDEXED_COLUMNS = ('deviceId', 'pkgName', 'question', 'avail')
+
+# 每批插入的行数
+BATCH_SIZE = 5000
+
+# 导入时使用的 PRAGMA（数据可以随时从上传文件重建，不需要崩溃保护）
+LOAD_PRAGMAS = (
+    'PRAGMA journal_mode = OFF',
+    'PRAGMA synchronous = OFF',
+    'PRAGMA temp_store = MEMORY',
+    'PRAGMA cache_size = -65536',  # 64MB
+)
+
+
+def quote_identifier(name):
+    """SQLite 标识符加引号"""
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def infer_column_type(values):
+    """根据非空值推断列类型：全是整数为 INTEGER，全是数字为 REAL，否则为 TEXT"""
+    column_type = None
+    for value in values:
+        if value is None or value == '':
+            continue
+        value_type = type(value)
+        if value_type is int:
+            if column_type is None:
+                column_type = 'INTEGER'
+        elif value_type is float:
+            column_type = 'REAL'
+        else:
+            # 字符串、日期、布尔值等按原来的方式保存为文本
+            return 'TEXT'
+    return column_type or 'TEXT'
+
+
+def _text_value(value):
+    return '' if value is None else str(value)
+
+
+def _numeric_value(value):
+    # 数字列中的空单元格保存为 NULL，不影响 SUM/AVG 等聚合
+    return None if value is None or value == '' else value
+
+
+def _view_columns(view):
+    # 列与原来的行字典一致：以第一行中存在的列为准
+    return list(view.row_dict(view.indices[0]).keys())
+
+
+def _insert_rows(conn, table_name, view, columns, column_types):
+    quoted_columns = ', '.join(quote_identifier(col) for col in columns)
+    placeholders = ', '.join('?' for _ in columns)
+    insert_sql = f'INSERT INTO {quote_identifier(table_name)} ({quoted_columns}) VALUES ({placeholders})'
+
+    converters = [_text_value if col_type == 'TEXT' else _numeric_value for col_type in column_types]
+    rows = zip(*[map(convert, view.values(col)) for col, convert in zip(columns, converters)])
+    while True:
+        batch = list(islice(rows, BATCH_SIZE))
+        if not batch:
+            break
+        conn.executemany(insert_sql, batch)
+
+
+def _create_indexes(conn, table_name, columns):
+    for col in columns:
+        if col in INDEXED_COLUMNS:
+            index_name = quote_identifier(f'idx_{table_name}_{col}')
+            conn.execute(f'CREATE INDEX IF NOT EXISTS {index_name} '
+                         f'ON {quote_identifier(table_name)} ({quote_identifier(col)})')
+
+
+def _create_table(conn, table_name, view):
+    columns = _view_columns(view)
+    column_types = [infer_column_type(view.values(col)) for col in columns]
+    column_defs = ', '.join(f'{quote_identifier(col)} {col_type}' for col, col_type in zip(columns, column_types))
+    conn.execute(f'CREATE TABLE {quote_identifier(table_name)} ({column_defs})')
+    _insert_rows(conn, table_name, view, columns, column_types)
+    # 数据导入完成后再建索引，比边插入边维护索引快
+    _create_indexes(conn, table_name, columns)
+
+
+def load_view(conn, view, table_name='data'):
+    """将视图中的数据导入 table_name 表，返回导入的行数"""
+    if not len(view):
+        return 0
+
+    for pragma in LOAD_PRAGMAS:
+        conn.execute(pragma)
+
+    with conn:
+        _create_table(conn, table_name, view)
+
+    return len(view)
+
+
+def append_view(conn, view, table_name='data'):
+    """
+    将视图中的数据追加到 table_name 表（表不存在时新建），返回追加的行数
+
+    在调用方的事务中执行，不修改 PRAGMA。已有列沿用原来的类型，新出现的列自动添加，
+    增量中没有的列为 NULL。
+    """
+    if not len(view):
+        return 0
+
+    existing = {row[1]: row[2] for row in conn.execute(f'PRAGMA table_info({quote_identifier(table_name)})')}
+    if not existing:
+        _create_table(conn, table_name, view)
+        return len(view)
+
+    columns = _view_columns(view)
+    new_columns = [col for col in columns if col not in existing]
+    for col in new_columns:
+        existing[col] = infer_column_type(view.values(col))
+        conn.execute(f'ALTER TABLE {quote_identifier(table_name)} '
+                     f'ADD COLUMN {quote_identifier(col)} {existing[col]}')
+    _insert_rows(conn, table_name, view, columns, [existing[col] for col in columns])
+    _create_indexes(conn, table_name, new_columns)
+    return len(view)
+
+
+def append_table(conn, schema, table_name='data'):
+    """
+    将附加数据库 schema 中的 table_name 表复制到主数据库的同名表（表不存在时新建），返回复制的行数
+
+    列取并集：已有列沿用原来的类型，新出现的列自动添加，源表中没有的列为 NULL。
+    在调用方的事务中执行，不建立索引，全部复制完成后由调用方执行 create_indexes。
+    """
+    source_columns = [(row[1], row[2]) for row in conn.execute(
+        f'PRAGMA {quote_identifier(schema)}.table_info({quote_identifier(table_name)})')]
+    if not source_columns:
+        return 0
+
+    target = f'main.{quote_identifier(table_name)}'
+    existing = {row[1] for row in conn.execute(f'PRAGMA main.table_info({quote_identifier(table_name)})')}
+    if not existing:
+        column_defs = ', '.join(f'{quote_identifier(col)} {col_type}' for col, col_type in source_columns)
+        conn.execute(f'CREATE TABLE {target} ({column_defs})')
+    else:
+        for col, col_type in source_columns:
+            if col not in existing:
+                conn.execute(f'ALTER TABLE {target} ADD COLUMN {quote_identifier(col)} {col_type}')
+
+    quoted_columns = ', '.join(quote_identifier(col) for col, _ in source_columns)
+    cursor = conn.execute(f'INSERT INTO {target} ({quoted_columns}) '
+                          f'SELECT {quoted_columns} FROM {quote_identifier(schema)}.{quote_identifier(table_name)}')
+    return cursor.rowcount
+
+
+def create_indexes(conn, table_name='data'):
+    """为 table_name 表中的常用查询列建立索引（已存在的跳过）"""
+    columns = [row[1] for row in conn.execute(f'PRAGMA main.table_info({quote_identifier(table_name)})')]
+    _create_indexes(conn, table_name, columns)
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试小志总数据统计内核与原逐行实现结果一致
+"""
+
+import json
+import os
+import random
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from columnar import TableBuilder
+from analysis import (compute_analyze_stats, compute_label_counts, compute_analyze_accumulators,
+                      compute_label_accumulators, build_device_rollup, compute_device_rollup)
+
+HEADERS = ['deviceId', 'pkgName', 'directives', 'avail', 'userContent', 'imageUrls', 'question', 'payload']
+PKG_NAMES = ['com.helloxj.xlook', 'cs.zero.waterCamera', 'com.helloxj.xlookohos', 'other.pkg', '']
+DEVICE_IDS = ['ac28a948f719463aa730514e04ca66e6', '4d530e405ee02c82', 'dev1', 'dev2', '']
+
+
+def make_rows(count, seed):
+    """生成覆盖空值、空白、数字等情况的测试数据"""
+    rng = random.Random(seed)
+    rows = []
+    for _ in range(count):
+        rows.append((
+            rng.choice(DEVICE_IDS + [f'dev{rng.randint(0, 40)}', rng.randint(1, 3), '']),
+            rng.choice(PKG_NAMES + [PKG_NAMES[0]] * 3),
+            rng.choice(['', ' ', 'open_camera', '{"a": 1}']),
+            rng.choice(['有帮助', '无帮助', '', '其他']),
+            rng.choice(['', '  ', f'内容{rng.randint(0, 30)}', 'hello', 12]),
+            rng.choice(['', 'http://img/1.png', ' ']),
+            rng.choice(['标签1', '标签2', '功能使用', '']),
+            'x' * rng.randint(0, 10),
+        ))
+    # 一行缺少后几列，对应原来行字典中没有这些键的情况
+    rows.append(('dev9', 'com.helloxj.xlook', 'open_camera'))
+    return rows
+
+
+def build_table(rows):
+    builder = TableBuilder()
+    builder.set_headers(HEADERS)
+    for row in rows:
+        builder.append(row)
+    return builder.build()
+
+
+def legacy_analyze(data, pkg_name, device_id_list, filter_user_contents):
+    """原 analyze_data 中基于行字典的统计实现"""
+    original_initial_data = [row for row in data if 'pkgName' in row and row['pkgName'] == pkg_name]
+    if device_id_list:
+        original_user_data = [row for row in data
+                              if 'pkgName' in row and row['pkgName'] == pkg_name and
+                              'deviceId' in row and row['deviceId'] not in device_id_list]
+    else:
+        original_user_data = [row for row in data if 'pkgName' in row and row['pkgName'] == pkg_name]
+
+    def filter_data(data_list):
+        return [row for row in data_list if not (
+            ('imageUrls' in row and row['imageUrls'] is not None and str(row['imageUrls']).strip() != '') and
+            ('userContent' in row and (row['userContent'] is None or str(row['userContent']).strip() == ''))
+        )]
+
+    initial_data = filter_data(original_initial_data)
+    user_data = filter_data(original_user_data)
+
+    if filter_user_contents is not None:
+        initial_data = [row for row in initial_data
+                        if 'userContent' not in row or str(row['userContent']) not in filter_user_contents]
+        user_data = [row for row in user_data
+                     if 'userContent' not in row or str(row['userContent']) not in filter_user_contents]
+        original_initial_data = [row for row in original_initial_data
+                                 if 'userContent' not in row or str(row['userContent']) not in filter_user_contents]
+        original_user_data = [row for row in original_user_data
+                              if 'userContent' not in row or str(row['userContent']) not in filter_user_contents]
+
+    def stats(rows, extra):
+        device_ids = set()
+        directives_count = helpful_count = unhelpful_count = 0
+        for row in rows:
+            if 'deviceId' in row and row['deviceId']:
+                device_ids.add(row['deviceId'])
+            if 'directives' in row and row['directives'] is not None and str(row['directives']).strip() != '':
+                directives_count += 1
+            if 'avail' in row and row['avail'] == '有帮助':
+                helpful_count += 1
+            elif 'avail' in row and row['avail'] == '无帮助':
+                unhelpful_count += 1
+        return {
+            '总数据量': len(rows),
+            '使用人数': len(device_ids),
+            '给出指令次数': directives_count,
+            '有帮助次数': helpful_count,
+            '无帮助次数': unhelpful_count,
+            '有图片无文字数量/无指令总数': f"{extra}"
+        }
+
+    image_no_text_count = 0
+    for row in original_initial_data:
+        if ('userContent' in row and (row['userContent'] is None or str(row['userContent']).strip() == '')) and \
+           ('imageUrls' in row and row['imageUrls'] is not None and str(row['imageUrls']).strip() != ''):
+            image_no_text_count += 1
+
+    no_directives_count = 0
+    for row in original_user_data:
+        if 'directives' in row and (row['directives'] is None or str(row['directives']).strip() == ''):
+            no_directives_count += 1
+
+    return stats(initial_data, image_no_text_count), stats(user_data, no_directives_count), user_data
+
+
+def test_fused_kernel_matches_legacy():
+    """测试单次遍历统计与原实现的 JSON 输出逐字节一致"""
+    print("测试单次遍历统计内核...")
+
+    rows = make_rows(3000, seed=7)
+    data = [{HEADERS[i]: cell for i, cell in enumerate(row)} for row in rows]
+    table = build_table(rows)
+
+    device_lists = [[], ['ac28a948f719463aa730514e04ca66e6', '4d530e405ee02c82', 'dev1', '']]
+    filter_sets = [None, {'内容1', '内容2', 'hello', '12', '  '}]
+
+    for pkg_name in PKG_NAMES[:3]:
+        for device_id_list in device_lists:
+            for filter_user_contents in filter_sets:
+                expected = legacy_analyze(data, pkg_name, device_id_list, filter_user_contents)
+                stats_by_pkg, user_data = compute_analyze_stats(
+                    table, [pkg_name], device_id_list, filter_user_contents)
+
+                expected_json = json.dumps(expected[:2], ensure_ascii=False)
+                actual_json = json.dumps(stats_by_pkg[pkg_name], ensure_ascii=False)
+                same_rows = list(user_data.iter_dicts()) == expected[2]
+                status = "✓" if expected_json == actual_json and same_rows else "✗"
+                print(f"  {status} {pkg_name} 设备过滤={bool(device_id_list)} 内容过滤={filter_user_contents is not None}")
+                assert expected_json == actual_json
+                assert same_rows
+
+    print()
+
+
+def test_all_platforms_match_single_platform():
+    """测试一次统计所有平台的结果与逐个平台统计一致"""
+    print("测试所有平台模式...")
+
+    table = build_table(make_rows(2000, seed=11))
+    pkg_names = PKG_NAMES[:3]
+    device_id_list = ['dev1', 'dev2']
+    filter_user_contents = {'hello', '12'}
+
+    stats_by_pkg, _ = compute_analyze_stats(table, pkg_names, device_id_list, filter_user_contents)
+    counts_by_pkg, filtered_by_pkg, _ = compute_label_counts(table, pkg_names, device_id_list, filter_user_contents)
+    for pkg_name in pkg_names:
+        single_stats, _ = compute_analyze_stats(table, [pkg_name], device_id_list, filter_user_contents)
+        single_counts, single_filtered, _ = compute_label_counts(
+            table, [pkg_name], device_id_list, filter_user_contents)
+        same = (stats_by_pkg[pkg_name] == single_stats[pkg_name] and
+                list(counts_by_pkg[pkg_name].items()) == list(single_counts[pkg_name].items()) and
+                list(filtered_by_pkg[pkg_name].indices) == list(single_filtered[pkg_name].indices))
+        status = "✓" if same else "✗"
+        print(f"  {status} {pkg_name}")
+        assert same
+
+    print()
+
+
+def test_device_rollup_matches_row_scan():
+    """测试按设备预聚合后减去被去除设备的结果与逐行统计完全一致（包括标签顺序和过滤后的视图），分段统计后合并的结果相同"""
+    print("测试设备预聚合...")
+
+    checks = []
+    for seed in range(10):
+        rows = make_rows(300, seed)
+        table = build_table(rows)
+        filter_user_contents = {'内容1', 'hello'} if seed % 2 else None
+        rollup = build_device_rollup(table, PKG_NAMES, filter_user_contents)
+        cut = len(rows) // 3
+        merged = build_device_rollup(build_table(rows[:cut]), PKG_NAMES, filter_user_contents)
+        merged.merge(build_device_rollup(build_table(rows[cut:]), PKG_NAMES, filter_user_contents))
+
+        for device_id_list in ([], DEVICE_IDS[:1], DEVICE_IDS, ['dev3', '', 'dev-none']):
+            accumulators, user_data = compute_analyze_accumulators(table, PKG_NAMES, device_id_list,
+                                                                   filter_user_contents)
+            labels, filtered_data = compute_label_accumulators(table, PKG_NAMES, device_id_list, filter_user_contents)
+            # 同一次遍历选出的视图与逐行统计相同，统计量由预聚合得到
+            fused, fused_data = compute_device_rollup(table, PKG_NAMES, device_id_list, filter_user_contents)
+            single, single_data = compute_device_rollup(table, PKG_NAMES, device_id_list, filter_user_contents,
+                                                        selected=PKG_NAMES[:1])
+            single_user = compute_analyze_accumulators(table, PKG_NAMES[:1], device_id_list, filter_user_contents)[1]
+            checks.append(list(fused_data.indices) == list(user_data.indices) == list(filtered_data.indices)
+                          and list(single_data.indices) == list(single_user.indices))
+            # 只预聚合一部分时结果与同时预聚合相同
+            stats_only, stats_data = compute_device_rollup(table, PKG_NAMES, device_id_list, filter_user_contents,
+                                                           labels=False)
+            labels_only, labels_data = compute_device_rollup(table, PKG_NAMES, device_id_list, filter_user_contents,
+                                                             stats=False)
+            checks.append(list(stats_data.indices) == list(labels_data.indices) == list(user_data.indices))
+            for pkg_name in PKG_NAMES:
+                label = labels_only.label_accumulator(pkg_name, device_id_list)
+                checks.append(stats_only.analyze_stats(pkg_name, device_id_list)
+                              == fused.analyze_stats(pkg_name, device_id_list)
+                              and list(label.question_counts.items())
+                              == list(labels[pkg_name].question_counts.items())
+                              and label.function_contents == labels[pkg_name].function_contents)
+            for pkg_name in PKG_NAMES:
+                initial, user = accumulators[pkg_name]
+                fused_initial, fused_user = fused.stats_accumulators(pkg_name, device_id_list)
+                checks.append((fused_initial.to_stats(), fused_user.to_stats()) == (initial.to_stats(), user.to_stats())
+                              and (fused_initial.device_ids, fused_user.device_ids)
+                              == (initial.device_ids, user.device_ids))
+            for pkg_name in PKG_NAMES:
+                initial, user = accumulators[pkg_name]
+                for candidate in (rollup, merged):
+                    label = candidate.label_accumulator(pkg_name, device_id_list)
+                    checks.append(
+                        candidate.analyze_stats(pkg_name, device_id_list) == (initial.to_stats(), user.to_stats())
+                        and list(label.question_counts.items()) == list(labels[pkg_name].question_counts.items())
+                        and label.function_contents == labels[pkg_name].function_contents)
+
+    ok = all(checks)
+    print(f"  {'✓' if ok else '✗'} {len(checks)} 种组合")
+    assert ok
+    print()
+
+
+if __name__ == "__main__":
+    print("统计内核测试")
+    print("=" * 50)
+
+    test_fused_kernel_matches_legacy()
+    test_all_platforms_match_single_platform()
+    test_device_rollup_matches_row_scan()
+
+    print("测试完成！")
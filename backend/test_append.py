@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试向数据集追加增量文件：去重后合并的统计结果与一次导入全部数据一致
+"""
+
+import csv
+import os
+import shutil
+import sys
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from openpyxl import Workbook
+
+import app as backend
+from columnar import TableBuilder
+
+HEADERS = ['deviceId', 'pkgName', 'directives', 'avail', 'userContent', 'imageUrls', 'question']
+PKG_NAMES = ['com.huawei.hmos.xlook', 'com.helloxj.xlook']
+
+
+# use_temp_folders 创建的临时目录
+_temp_root = None
+
+
+def use_temp_folders():
+    """
+    把 app 的存储目录（上传文件、分片上传、解析缓存、过滤集、排除列表、数据集、查询和导入任务）指向临时目录，
+    测试不写入 backend 下的目录。导入 app 的测试模块在导入时调用，同一进程中只设置一次
+    """
+    global _temp_root
+    if _temp_root is not None:
+        return _temp_root
+    _temp_root = tempfile.mkdtemp()
+    config = backend.app.config
+
+    def folder(name):
+        path = os.path.join(_temp_root, name)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    backend.UPLOAD_FOLDER = config['UPLOAD_FOLDER'] = folder('uploads')
+    backend.CHUNKED_UPLOAD_FOLDER = folder('chunked_uploads')
+    backend.chunked_upload_store = backend.ChunkedUploadStore(
+        backend.CHUNKED_UPLOAD_FOLDER, config['UPLOAD_CHUNK_BYTES'], config['CHUNKED_UPLOAD_MAX_AGE'])
+    backend.CACHE_FOLDER = config['CACHE_FOLDER'] = folder('cache')
+    backend.workbook_cache = backend.WorkbookCache(backend.CACHE_FOLDER, config['CACHE_MAX_BYTES'])
+    backend.FILTER_SET_FOLDER = config['FILTER_SET_FOLDER'] = folder('filter_sets')
+    backend.filter_set_store = backend.WorkbookCache(backend.FILTER_SET_FOLDER, config['FILTER_SET_MAX_BYTES'])
+    backend.EXCLUSION_LIST_FOLDER = config['EXCLUSION_LIST_FOLDER'] = folder('exclusion_lists')
+    backend.exclusion_library = backend.ExclusionLibrary(backend.EXCLUSION_LIST_FOLDER)
+    backend.DATA_FOLDER = config['DATA_FOLDER'] = folder('datasets')
+    backend.dataset_store = backend.DatasetStore(backend.DATA_FOLDER, config['DATASET_MAX_BYTES'],
+                                                 config['DATASET_MAX_AGE'])
+    backend.QUERY_FOLDER = folder('queries')
+    backend.query_slots = backend.QuerySlots(backend.QUERY_FOLDER, config['SQL_QUERY_SLOTS'])
+    backend.result_cache = backend.ResultCache(os.path.join(backend.QUERY_FOLDER, 'result_cache.db'),
+                                               config['SQL_RESULT_CACHE_MAX_BYTES'])
+    backend.JOB_FOLDER = folder('jobs')
+    backend.job_store = backend.JobStore(backend.JOB_FOLDER, config['JOB_MAX_AGE'])
+    backend.ingest_slots = backend.QuerySlots(os.path.join(backend.JOB_FOLDER, 'slots'), config['INGEST_SLOTS'])
+    return _temp_root
+
+
+use_temp_folders()
+
+
+def make_rows(start, stop):
+    return [[f'dev{i % 7}', PKG_NAMES[i % 2], 'open_camera' if i % 4 == 0 else '',
+             ['有帮助', '无帮助', ''][i % 3], f'内容{i}' if i % 5 else '', 'http://img/1.png' if i % 6 == 0 else '',
+             f'标签{i % 4}' if i % 9 else '功能使用'] for i in range(start, stop)]
+
+
+def write_xlsx(path, rows, headers=HEADERS):
+    wb = Workbook()
+    ws = wb.active
+    ws.append(headers)
+    for row in rows:
+        ws.append([value or None for value in row])
+    wb.save(path)
+
+
+def write_csv(path, rows, headers=HEADERS):
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(headers)
+        writer.writerows(rows)
+
+
+def upload(folder, filename, rows, headers=HEADERS):
+    # 处理完成后会删除上传文件，每次生成新文件
+    path = os.path.join(tempfile.mkdtemp(dir=folder), filename)
+    (write_csv if filename.endswith('.csv') else write_xlsx)(path, rows, headers)
+    return backend.Upload(path, filename)
+
+
+def row_count(dataset_id):
+    conn = backend.dataset_store.connect(dataset_id)
+    try:
+        return conn.execute('SELECT COUNT(*) FROM data').fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_append_matches_combined_file():
+    """测试基础文件加上与之重叠的增量文件（CSV），结果与导入合并后的文件一致，重复行只统计一次"""
+    print("测试追加增量文件...")
+
+    folder = tempfile.mkdtemp()
+    base_rows, delta_rows = make_rows(0, 300), make_rows(250, 400)
+    combined_rows = make_rows(0, 400)
+
+    checks = []
+    for kind, run, form in [
+        ('analyze', backend.run_analyze, {'platform': 'all', 'deviceIds': 'dev1', 'dataTypes': '["initial", "user"]'}),
+        ('label-process', backend.run_label_process, {'platform': 'all', 'deviceIds': 'dev1', 'analysisType': 'default'}),
+    ]:
+        expected = run(upload(folder, 'all.xlsx', combined_rows), None, form, 'test-session')
+        base = run(upload(folder, 'base.xlsx', base_rows), None, form, 'test-session')
+        dataset_id = base['datasetId']
+        revision = backend.dataset_store.revision(dataset_id)
+
+        appended = backend.run_append(upload(folder, 'delta.csv', delta_rows), None,
+                                      {'datasetId': dataset_id}, 'test-session')
+        again = backend.run_append(upload(folder, 'delta.csv', delta_rows), None,
+                                   {'datasetId': dataset_id}, 'test-session')
+        checks += [
+            (f"{kind} 合并结果一致", appended['data'] == expected['data']),
+            (f"{kind} 跳过重复行", appended['appendedRows'] == 100 and appended['duplicateRows'] == 50),
+            (f"{kind} 重复追加不改变结果", again['appendedRows'] == 0 and again['data'] == expected['data']),
+            (f"{kind} 数据表追加新行", row_count(dataset_id) == row_count(expected['datasetId'])),
+            (f"{kind} 修订号增加", backend.dataset_store.revision(dataset_id) == revision + 2),
+        ]
+
+    for name, ok in checks:
+        print(f"  {'✓' if ok else '✗'} {name}")
+        assert ok
+    print()
+
+
+def test_append_keeps_repeated_rows():
+    """测试统计列相同但来自不同会话的行、以及增量中多出的相同行追加后都保留，与一次导入全部数据一致"""
+    print("测试追加时保留重复的行...")
+
+    folder = tempfile.mkdtemp()
+    form = {'platform': 'all', 'deviceIds': 'dev1', 'dataTypes': '["initial", "user"]'}
+    headers = HEADERS + ['createTime']
+    same = make_rows(5, 6)[0]
+    # 统计列相同、createTime 不同的行
+    base_rows = [row + [f'2024-01-01 10:{i:02d}'] for i, row in enumerate(make_rows(0, 40))]
+    delta_rows = base_rows[30:] + [same + [f'2024-01-02 10:{i:02d}'] for i in range(3)]
+    # 所有列都相同的行：基础文件中 2 行，增量中 3 行，追加 1 行
+    repeated = same + ['2024-01-03 10:00']
+    base_rows += [repeated] * 2
+    delta_rows += [repeated] * 3
+
+    expected = backend.run_analyze(upload(folder, 'all.csv', base_rows + delta_rows[10:13] + [repeated], headers),
+                                   None, form, '')
+    base = backend.run_analyze(upload(folder, 'base.csv', base_rows, headers), None, form, '')
+    appended = backend.run_append(upload(folder, 'delta.csv', delta_rows, headers), None,
+                                  {'datasetId': base['datasetId']}, '')
+    again = backend.run_append(upload(folder, 'delta.csv', delta_rows, headers), None,
+                               {'datasetId': base['datasetId']}, '')
+
+    checks = [
+        ("合并结果一致", appended['data'] == expected['data']),
+        ("保留统计列相同的行", appended['appendedRows'] == 4 and appended['duplicateRows'] == 12),
+        ("重复追加不改变结果", again['appendedRows'] == 0 and again['data'] == expected['data']),
+        ("数据表行数", row_count(base['datasetId']) == row_count(expected['datasetId'])),
+    ]
+    for name, ok in checks:
+        print(f"  {'✓' if ok else '✗'} {name}")
+        assert ok
+    shutil.rmtree(folder, ignore_errors=True)
+    print()
+
+
+def test_append_rejects_unknown_dataset():
+    """测试数据集不存在或没有统计状态时拒绝追加"""
+    print("测试拒绝追加...")
+
+    folder = tempfile.mkdtemp()
+    builder = TableBuilder()
+    builder.set_headers(HEADERS)
+    legacy_id = backend.dataset_store.create(builder.build().view(), 'page1_data', 'test-session')
+
+    def status(dataset_id):
+        try:
+            backend.run_append(upload(folder, 'delta.csv', make_rows(0, 10)), None, {'datasetId': dataset_id}, '')
+        except backend.IngestError as e:
+            return e.status
+        return 200
+
+    checks = [
+        ("数据集不存在", status('0' * 32) == 404),
+        ("没有统计状态", status(legacy_id) == 409),
+    ]
+    for name, ok in checks:
+        print(f"  {'✓' if ok else '✗'} {name}")
+        assert ok
+    shutil.rmtree(folder, ignore_errors=True)
+    print()
+
+
+if __name__ == "__main__":
+    print("追加增量文件测试")
+    print("=" * 50)
+
+    test_append_matches_combined_file()
+    test_append_keeps_repeated_rows()
+    test_append_rejects_unknown_dataset()
+
+    print("测试完成！")
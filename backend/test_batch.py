@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试批量导入：每个文件的结果与单独导入一致，合并结果与导入合并后的文件一致
+"""
+
+import io
+import os
+import pickle
+import sys
+import tempfile
+import zipfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import app as backend
+from test_append import HEADERS, make_rows, upload, row_count, use_temp_folders
+
+use_temp_folders()
+
+FORMS = [
+    ('analyze', {'platform': 'all', 'deviceIds': 'dev1', 'dataTypes': '["initial", "user"]'}),
+    ('label-process', {'platform': 'all', 'deviceIds': 'dev1', 'analysisType': 'default'}),
+]
+RUNNERS = {'analyze': backend.run_analyze, 'label-process': backend.run_label_process}
+
+
+def make_zip(folder, members):
+    """members 为 [(文件名, 行)]，返回 zip 压缩包的 Upload（内容在内存中，与请求中的上传文件相同）"""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        for filename, rows in members:
+            member = upload(folder, filename, rows)
+            archive.write(member.source, f'regions/{filename}')
+            member.remove()
+        archive.writestr('__MACOSX/regions/._华南.xlsx', b'')
+    return backend.Upload(buffer, 'regions.zip', name='regions.zip')
+
+
+def test_batch_matches_single_files():
+    """测试各文件的结果与单独导入相同，合并结果（设备取并集、标签先相加）与导入合并后的文件相同"""
+    print("测试批量导入...")
+
+    folder = tempfile.mkdtemp()
+    # 各地区的设备有重叠，使用人数不能直接相加
+    parts = [('华东.xlsx', make_rows(0, 120)), ('华北.csv', make_rows(120, 200)),
+             ('华南.xlsx', make_rows(200, 330)), ('西部.csv', make_rows(330, 345))]
+    backend.app.config['BATCH_PROCESSES'] = 2
+
+    checks = []
+    for kind, form in FORMS:
+        run = RUNNERS[kind]
+        expected = run(upload(folder, 'all.xlsx', make_rows(0, 345)), None, form, 'test-session')
+        singles = [run(upload(folder, filename, rows), None, form, 'test-session')['data'] for filename, rows in parts]
+
+        batch = backend.UploadBatch([
+            upload(folder, parts[0][0], parts[0][1]),
+            upload(folder, parts[1][0], parts[1][1]),
+            make_zip(folder, parts[2:]),
+        ])
+        result = backend.run_batch(kind, batch, None, form, 'test-session')
+        checks += [
+            (f"{kind} 合并结果一致", result['data'] == expected['data']),
+            (f"{kind} 每个文件的结果一致", [item['data'] for item in result['files']] == singles),
+            (f"{kind} 文件名和行数", [(item['filename'], item['rows']) for item in result['files']]
+             == [(filename, len(rows)) for filename, rows in parts]),
+            (f"{kind} 合并后的数据集", row_count(result['datasetId']) == row_count(expected['datasetId'])),
+            (f"{kind} 合并后可以追加数据", backend.dataset_store.load_state(result['datasetId']) is not None),
+        ]
+
+    for name, ok in checks:
+        print(f"  {'✓' if ok else '✗'} {name}")
+        assert ok
+    print()
+
+
+def test_batch_failure_cleans_up():
+    """测试一个文件失败时返回该文件名，其他文件已经导入的数据集被删除"""
+    print("测试批量导入失败...")
+
+    folder = tempfile.mkdtemp()
+    bad = os.path.join(folder, 'bad.xlsx')
+    with open(bad, 'wb') as f:
+        f.write(b'not a workbook')
+    before = {info['datasetId'] for info in backend.dataset_store.list('batch-failure')}
+
+    batch = backend.UploadBatch([upload(folder, 'good.xlsx', make_rows(0, 50)), backend.Upload(bad, 'bad.xlsx')])
+    try:
+        backend.run_batch('analyze', batch, None, dict(FORMS[0][1]), 'batch-failure')
+        error = None
+    except backend.IngestError as e:
+        error = e
+    after = {info['datasetId'] for info in backend.dataset_store.list('batch-failure')}
+
+    # 进程池中的文件缺少必需字段：状态码经过 pickle 传回后不变
+    backend.app.config['BATCH_PROCESSES'] = 2
+    missing = backend.UploadBatch([upload(folder, 'good.xlsx', make_rows(0, 50)),
+                                   upload(folder, 'missing.csv', [row[:6] for row in make_rows(0, 50)],
+                                          HEADERS[:6])])
+    try:
+        backend.run_batch('label-process', missing, None, dict(FORMS[1][1]), 'batch-failure')
+        missing_error = None
+    except backend.IngestError as e:
+        missing_error = e
+    restored = pickle.loads(pickle.dumps(backend.IngestError('数据集不存在', 409)))
+
+    checks = [
+        ("返回失败的文件名", error is not None and str(error).startswith('bad.xlsx')),
+        ("进程池中的错误保留状态码", missing_error is not None and missing_error.status == 400
+         and str(missing_error).startswith('missing.csv') and '缺少必需字段' in str(missing_error)),
+        ("pickle 后保留状态码", restored.status == 409 and str(restored) == '数据集不存在'),
+        ("删除已经导入的数据集", after == before),
+        ("删除上传文件", not os.path.exists(bad)),
+    ]
+    for name, ok in checks:
+        print(f"  {'✓' if ok else '✗'} {name}")
+        assert ok
+    print()
+
+
+if __name__ == "__main__":
+    print("批量导入测试")
+    print("=" * 50)
+
+    test_batch_matches_single_files()
+    test_batch_failure_cleans_up()
+
+    print("测试完成！")
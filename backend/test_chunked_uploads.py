@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试分片上传、断点续传和用 uploadId 统计
+"""
+
+import hashlib
+import os
+import sys
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from openpyxl import Workbook
+
+import app as backend
+from test_append import use_temp_folders
+
+use_temp_folders()
+
+CHUNK_SIZE = 4096
+
+
+def make_workbook(path, rows=300):
+    wb = Workbook()
+    ws = wb.active
+    ws.append(['deviceId', 'pkgName', 'question', 'userContent', 'imageUrls'])
+    for i in range(rows):
+        ws.append([f'dev{i % 5}', 'com.helloxj.xlook', f'标签{i % 3}', f'内容{i}', ''])
+    wb.save(path)
+
+
+def put_chunk(client, upload_id, index, content, sha256=None):
+    chunk = content[index * CHUNK_SIZE:(index + 1) * CHUNK_SIZE]
+    headers = {'X-Chunk-Sha256': sha256} if sha256 else {}
+    return client.put(f'/api/uploads/{upload_id}/chunks/{index}', data=chunk,
+                      content_type='application/octet-stream', headers=headers)
+
+
+def test_chunked_upload_resume():
+    """测试分片乱序上传、中断后查询已收到的分片补传，完成后按 uploadId 统计"""
+    print("测试分片上传...")
+
+    folder = tempfile.mkdtemp()
+    path = os.path.join(folder, 'data.xlsx')
+    make_workbook(path)
+    with open(path, 'rb') as f:
+        content = f.read()
+    sha256 = hashlib.sha256(content).hexdigest()
+    form = {'platform': '安卓', 'analysisType': 'default'}
+    expected = backend.run_label_process(backend.Upload(path, 'data.xlsx'), None, form, '')
+
+    original_chunk_size = backend.chunked_upload_store.chunk_size
+    backend.chunked_upload_store.chunk_size = CHUNK_SIZE
+    client = backend.app.test_client()
+    try:
+        created = client.post('/api/uploads', json={'filename': '导出.xlsx', 'size': len(content), 'sha256': sha256})
+        upload = created.get_json()
+        upload_id = upload['uploadId']
+        count = upload['chunkCount']
+
+        # 先上传一部分分片（倒序），模拟连接中断
+        for index in range(count - 1, count // 2, -1):
+            put_chunk(client, upload_id, index, content)
+        early_complete = client.post(f'/api/uploads/{upload_id}/complete')
+        bad_chunk = put_chunk(client, upload_id, 0, content, sha256='0' * 64)
+        short_chunk = client.put(f'/api/uploads/{upload_id}/chunks/0', data=content[:10],
+                                 content_type='application/octet-stream')
+
+        # 查询已收到的分片，补传缺少的分片
+        status = client.get(f'/api/uploads/{upload_id}').get_json()
+        for index in sorted(set(range(count)) - set(status['received'])):
+            chunk_sha256 = hashlib.sha256(content[index * CHUNK_SIZE:(index + 1) * CHUNK_SIZE]).hexdigest()
+            put_chunk(client, upload_id, index, content, chunk_sha256)
+        completed = client.post(f'/api/uploads/{upload_id}/complete')
+        completed_again = client.post(f'/api/uploads/{upload_id}/complete')
+
+        data = dict(form, uploadId=upload_id)
+        first = client.post('/api/label-process', data=data, content_type='multipart/form-data')
+        second = client.post('/api/label-process', data=data, content_type='multipart/form-data')
+        unknown = client.post('/api/label-process', data=dict(form, uploadId='0' * 32),
+                              content_type='multipart/form-data')
+    finally:
+        backend.chunked_upload_store.chunk_size = original_chunk_size
+    stored_path, _ = backend.chunked_upload_store.completed_path(upload_id)
+    with open(stored_path, 'rb') as f:
+        stored = f.read()
+    backend.chunked_upload_store.remove(upload_id)
+
+    checks = [
+        ("开始上传", created.status_code == 201 and count == -(-len(content) // CHUNK_SIZE) and count > 2),
+        ("分片未到齐时不能完成", early_complete.status_code == 409),
+        ("分片校验失败", bad_chunk.status_code == 400),
+        ("分片大小不正确", short_chunk.status_code == 400),
+        ("查询已收到的分片", status['received'] == list(range(count // 2 + 1, count))),
+        ("完成并校验", completed.status_code == 200 and completed.get_json()['sha256'] == sha256),
+        ("重复完成", completed_again.status_code == 200),
+        ("拼接后的文件", stored == content),
+        ("按 uploadId 统计", first.status_code == 200 and first.get_json()['data'] == expected['data']),
+        ("同一文件再次统计", second.status_code == 200 and second.get_json()['data'] == expected['data']),
+        ("上传不存在", unknown.status_code == 404),
+    ]
+    for name, ok in checks:
+        print(f"  {'✓' if ok else '✗'} {name}")
+        assert ok
+    print()
+
+
+def test_checksum_mismatch_and_limits():
+    """测试完整文件摘要不一致时删除上传，超过大小上限时拒绝"""
+    print("测试文件校验...")
+
+    client = backend.app.test_client()
+    content = b'x' * 100
+    upload_id = client.post('/api/uploads', json={'filename': 'a.xlsx', 'size': len(content),
+                                                  'sha256': '0' * 64}).get_json()['uploadId']
+    client.put(f'/api/uploads/{upload_id}/chunks/0', data=content, content_type='application/octet-stream')
+    mismatch = client.post(f'/api/uploads/{upload_id}/complete')
+    removed = client.get(f'/api/uploads/{upload_id}')
+
+    too_large = client.post('/api/uploads', json={'filename': 'a.xlsx', 'size': backend.app.config['UPLOAD_MAX_BYTES'] + 1})
+    bad_format = client.post('/api/uploads', json={'filename': 'a.txt', 'size': 10})
+
+    checks = [
+        ("摘要不一致", mismatch.status_code == 400),
+        ("删除校验失败的上传", removed.status_code == 404),
+        ("超过大小上限", too_large.status_code == 413),
+        ("不支持的格式", bad_format.status_code == 400),
+    ]
+    for name, ok in checks:
+        print(f"  {'✓' if ok else '✗'} {name}")
+        assert ok
+    print()
+
+
+if __name__ == "__main__":
+    print("分片上传测试")
+    print("=" * 50)
+
+    test_chunked_upload_resume()
+    test_checksum_mismatch_and_limits()
+
+    print("测试完成！")
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试按数据集重新生成结果：切换分析类型、修改平台和需要去除的设备 ID 不重新上传文件
+"""
+
+import os
+import sys
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import app as backend
+from analysis import render_labels
+from test_append import make_rows as make_mixed_rows, upload, use_temp_folders
+
+use_temp_folders()
+
+
+def make_rows():
+    # 标签数量：标签0 为 30、标签1 为 12、标签2 为 7、标签3 为 3，功能使用 25 条
+    rows = []
+    for label, count in [('标签0', 30), ('标签1', 12), ('标签2', 7), ('标签3', 3), ('功能使用', 25)]:
+        for i in range(count):
+            rows.append([f'dev{len(rows) % 4}', 'com.helloxj.xlook', '', '', f'{label}内容{i}', '', label])
+    return rows
+
+
+def test_rerender_matches_upload():
+    """测试各分析类型与重新上传的结果一致，阈值、top 和排序参数生效，功能使用分页返回"""
+    print("测试按数据集重新生成标签结果...")
+
+    folder = tempfile.mkdtemp()
+    rows = make_rows()
+    client = backend.app.test_client()
+    dataset_id = backend.run_label_process(upload(folder, 'data.xlsx', rows), None,
+                                           {'platform': '安卓', 'analysisType': 'default'}, '')['datasetId']
+
+    def rerender(**args):
+        return client.get(f'/api/datasets/{dataset_id}/labels', query_string=args).get_json()
+
+    def uploaded(analysis_type):
+        form = {'platform': '安卓', 'analysisType': analysis_type}
+        return backend.run_label_process(upload(folder, 'data.xlsx', rows), None, form, '')['data']
+
+    pages = [rerender(analysisType='function', offset=offset, pageSize=10) for offset in (0, 10, 20)]
+    counts = {'标签0': 30, '功能使用': 25, '标签1': 12, '标签2': 7, '标签3': 3}
+    checks = [
+        ("默认分析", rerender()['data'] == uploaded('default')),
+        ("低量标签", rerender(analysisType='lowVolume')['data'] == uploaded('lowVolume')),
+        ("功能使用", sum((page['data'] for page in pages), []) == uploaded('function')),
+        ("分页", [len(page['data']) for page in pages] == [10, 10, 5] and pages[0]['total'] == 25
+         and pages[1]['hasMore'] and not pages[2]['hasMore']),
+        ("阈值", rerender(otherThreshold=5)['data'] == render_labels(counts, [], 'default', other_threshold=5)),
+        ("top 之外的标签合并为其他", rerender(top=2)['data'] == [
+            {'label': '标签0', 'count': 30}, {'label': '功能使用', 'count': 25}, {'label': '其他', 'count': 22}]),
+        ("按名称排序", [item['label'] for item in rerender(analysisType='lowVolume', lowVolumeMin=1, sort='label')['data']]
+         == ['标签2', '标签3']),
+        ("参数错误", client.get(f'/api/datasets/{dataset_id}/labels?sort=x').status_code == 400),
+        ("数据集不存在", client.get(f"/api/datasets/{'0' * 32}/labels").status_code == 404),
+    ]
+    for name, ok in checks:
+        print(f"  {'✓' if ok else '✗'} {name}")
+        assert ok
+    print()
+
+
+def test_device_ids_match_upload():
+    """测试修改平台和需要去除的设备 ID 后的结果与重新上传一致，追加数据后同样一致"""
+    print("测试修改设备 ID...")
+
+    folder = tempfile.mkdtemp()
+    client = backend.app.test_client()
+    base_rows, delta_rows = make_mixed_rows(0, 200), make_mixed_rows(150, 260)
+
+    checks = []
+    for kind, run, path, form in [
+        ('analyze', backend.run_analyze, 'analyze', {'dataTypes': '["initial", "user"]'}),
+        ('label-process', backend.run_label_process, 'labels', {'analysisType': 'default'}),
+    ]:
+        dataset_id = run(upload(folder, 'base.xlsx', base_rows), None,
+                         dict(form, platform='安卓', deviceIds='dev1'), '')['datasetId']
+        for step in ('导入后', '追加后'):
+            if step == '追加后':
+                backend.run_append(upload(folder, 'delta.csv', delta_rows), None, {'datasetId': dataset_id}, '')
+                rows = make_mixed_rows(0, 260)
+            else:
+                rows = base_rows
+            for platform, device_ids in [('安卓', ''), ('all', 'dev2,dev3'), ('鸿蒙', 'dev0,dev1,dev5')]:
+                expected = run(upload(folder, 'all.xlsx', rows), None,
+                               dict(form, platform=platform, deviceIds=device_ids), '')['data']
+                actual = client.get(f'/api/datasets/{dataset_id}/{path}',
+                                    query_string={'platform': platform, 'deviceIds': device_ids}).get_json()['data']
+                checks.append((f"{kind} {step} {platform} 去除 {device_ids or '无'}", actual == expected))
+
+    for name, ok in checks:
+        print(f"  {'✓' if ok else '✗'} {name}")
+        assert ok
+    print()
+
+
+if __name__ == "__main__":
+    print("按数据集重新生成结果测试")
+    print("=" * 50)
+
+    test_rerender_matches_upload()
+    test_device_ids_match_upload()
+
+    print("测试完成！")
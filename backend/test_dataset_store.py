@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试数据集存储
+"""
+
+import os
+import pickle
+import sqlite3
+import sys
+import tempfile
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from analysis import StatsAccumulator
+from columnar import TableBuilder
+from dataset_store import DatasetStore
+from query_guard import QueryGuard, QueryAborted
+
+
+def make_view(rows):
+    builder = TableBuilder()
+    builder.set_headers(['deviceId', 'question'])
+    for row in rows:
+        builder.append(row)
+    return builder.build().view()
+
+
+def test_named_datasets_and_join():
+    """测试同一会话的多个数据集互不覆盖，并可以在一条 SQL 中关联查询"""
+    print("测试命名数据集...")
+
+    store = DatasetStore(tempfile.mkdtemp())
+    page1 = store.create(make_view([('dev1', '标签1'), ('dev2', '标签2')]), 'page1_data', 'user-a')
+    page2 = store.create(make_view([('dev1', '标签3')]), 'page2_data', 'user-a')
+    other = store.create(make_view([('dev9', '标签9')]), 'page1_data', 'user-b')
+
+    conn = store.connect(page2, store.named_datasets('user-a'))
+    joined = conn.execute('SELECT a.deviceId, b.question FROM page1_data.data a '
+                          'JOIN page2_data.data b ON a.deviceId = b.deviceId').fetchall()
+    conn.close()
+
+    checks = [
+        ("最近数据集", store.latest_id('user-a') == page2 and store.latest_id('user-b') == other),
+        ("按名称查找", store.named_datasets('user-a') == {'page1_data': page1, 'page2_data': page2}),
+        ("按会话列出", {info['datasetId'] for info in store.list('user-a')} == {page1, page2}),
+        ("行数", store.info(page1)['rows'] == 2),
+        ("关联查询", joined == [('dev1', '标签3')]),
+    ]
+    for name, ok in checks:
+        print(f"  {'✓' if ok else '✗'} {name}")
+        assert ok
+    print()
+
+
+def test_lru_eviction():
+    """测试超过预算时淘汰最久未访问的数据集"""
+    print("测试数据集淘汰...")
+
+    store = DatasetStore(tempfile.mkdtemp(), max_bytes=10 ** 9)
+    first = store.create(make_view([('dev1', 'x' * 100)] * 500), 'page1_data')
+    second = store.create(make_view([('dev2', 'y' * 100)] * 500), 'page2_data')
+
+    # 访问第一个数据集后，第二个成为最久未访问的
+    past = time.time() - 100
+    os.utime(store._path(second), (past, past))
+    store.connect(first).close()
+
+    store.max_bytes = store.info(first)['size'] * 2
+    third = store.create(make_view([('dev3', 'z' * 100)] * 500), 'page1_data')
+
+    checks = [
+        ("保留最近访问", store.exists(first)),
+        ("淘汰最久未访问", not store.exists(second)),
+        ("保留新数据集", store.exists(third)),
+    ]
+    for name, ok in checks:
+        print(f"  {'✓' if ok else '✗'} {name}")
+        assert ok
+    print()
+
+
+class PlantedState:
+    """被篡改的统计状态：反序列化时创建目录"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def __reduce__(self):
+        return os.mkdir, (self.path,)
+
+
+def test_user_sql_cannot_write_state():
+    """测试用户 SQL 不能附加可写的数据库、VACUUM INTO 或修改 PRAGMA，被篡改的统计状态不会执行代码"""
+    print("测试统计状态的保护...")
+
+    folder = tempfile.mkdtemp()
+    store = DatasetStore(folder)
+    state = {'accumulators': {'a': (StatsAccumulator(), StatsAccumulator())}, 'platforms': [('安卓', 'a')]}
+    dataset_id = store.create(make_view([('dev1', '标签1')]), 'page1_data', 'user-a', state, [1, 2])
+    other = store.create(make_view([('dev2', '标签2')]), 'page2_data', 'user-a')
+    target = store._path(other).absolute().as_uri() + '?mode=rw'
+
+    def run(query):
+        guard = QueryGuard(folder, time_limit=5)
+        conn = store.connect(dataset_id, {'page2_data': other})
+        guard.install(conn)
+        try:
+            return conn.execute(query).fetchall()
+        except sqlite3.Error as e:
+            return guard.translate(e)
+        finally:
+            conn.close()
+
+    denied = [run(query) for query in (
+        f"ATTACH DATABASE '{target}' AS w",
+        f"VACUUM INTO '{os.path.join(folder, 'copy.db')}'",
+        'DETACH DATABASE page2_data',
+        'PRAGMA writable_schema = 1',
+    )]
+
+    # 直接篡改文件中的统计状态（例如通过其他途径写入）
+    marker = os.path.join(folder, 'planted')
+    conn = sqlite3.connect(store._path(dataset_id))
+    conn.execute('UPDATE _state SET value = ?', (pickle.dumps(PlantedState(marker)),))
+    conn.commit()
+    conn.close()
+    try:
+        store.load_state(dataset_id)
+        rejected = False
+    except pickle.UnpicklingError:
+        rejected = True
+
+    checks = [
+        ("拒绝附加、VACUUM INTO 和修改 PRAGMA", all(isinstance(error, QueryAborted) for error in denied)),
+        ("没有写出文件", not os.path.exists(os.path.join(folder, 'copy.db'))),
+        ("可以查询", run('SELECT a.deviceId, b.deviceId FROM data a, page2_data.data b') == [('dev1', 'dev2')]),
+        ("可以读取表结构", [row[1] for row in run('PRAGMA table_info(data)')] == ['deviceId', 'question']),
+        ("拒绝不允许的类型", rejected and not os.path.exists(marker)),
+    ]
+    for name, ok in checks:
+        print(f"  {'✓' if ok else '✗'} {name}")
+        assert ok
+    print()
+
+
+if __name__ == "__main__":
+    print("数据集存储测试")
+    print("=" * 50)
+
+    test_named_datasets_and_join()
+    test_lru_eviction()
+    test_user_sql_cannot_write_state()
+
+    print("测试完成！")
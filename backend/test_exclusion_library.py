@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试排除列表库：哈希列表的判断结果与 set 相同、追加去重和保存，以及导入时按名称引用排除列表
+"""
+
+import os
+import random
+import sys
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import app as backend
+from exclusion_library import ExclusionLibrary, union
+from test_append import make_rows, upload, write_xlsx, use_temp_folders
+
+use_temp_folders()
+
+
+def test_exclusion_library():
+    """测试判断结果与 set 相同，追加时去掉重复的条目，其他实例可以读取追加后的列表"""
+    print("测试排除列表库...")
+
+    folder = tempfile.mkdtemp()
+    library = ExclusionLibrary(folder)
+    rng = random.Random(3)
+    contents = {f'内容{rng.randrange(10 ** 9)}' for _ in range(20000)} | {'', ' ', 'hello', '12', '内容\ud800'}
+    first, second = sorted(contents)[:15000], sorted(contents)[10000:]
+    probes = list(contents) + [f'其他{i}' for i in range(20000)]
+
+    added_first = library.append('每周-1', first)
+    other = ExclusionLibrary(folder)
+    before = other.load('每周-1')
+    added_second = library.append('每周-1', second + ['hello'])
+    after = other.load('每周-1')
+    small = library.append('small', ['a'])
+
+    checks = [
+        ("追加的条目数", added_first == (15000, 15000)),
+        ("去掉重复的条目", added_second == (len(contents) - 15000, len(contents))),
+        ("判断结果与 set 相同", [value in after for value in probes] == [value in contents for value in probes]),
+        ("追加后重新读取", len(before) == 15000 and len(after) == len(contents)),
+        ("条目较少时", small == (1, 1) and 'a' in library.load('small') and 'b' not in library.load('small')),
+        ("列出所有列表", [meta['name'] for meta in library.list()] == sorted(['每周-1', 'small'])
+         and library.list()[0]['count'] == 1),
+        ("并集", 'a' in union([None, library.load('small'), {'b'}]) and 'b' in union([library.load('small'), {'b'}])
+         and union([None, None]) is None),
+        ("删除", library.remove('small') and not library.remove('small') and library.load('small') is None),
+        ("名称不正确时不存在", library.load('../small') is None and not library.exists('a/b')),
+    ]
+    try:
+        library.append('a/b', ['x'])
+        checks.append(("名称不正确", False))
+    except ValueError:
+        checks.append(("名称不正确", True))
+    for name, ok in checks:
+        print(f"  {'✓' if ok else '✗'} {name}")
+        assert ok
+    print()
+
+
+def test_exclusion_lists_api():
+    """测试接口追加和删除排除列表，导入、追加和批量导入时按名称引用排除列表与上传相同内容的过滤文件结果相同"""
+    print("测试排除列表接口...")
+
+    folder = tempfile.mkdtemp()
+    original = backend.exclusion_library
+    backend.exclusion_library = ExclusionLibrary(tempfile.mkdtemp())
+    client = backend.app.test_client()
+    try:
+        def post(name, rows):
+            path = os.path.join(tempfile.mkdtemp(dir=folder), 'filter.xlsx')
+            write_xlsx(path, rows)
+            with open(path, 'rb') as f:
+                return client.post(f'/api/exclusion-lists/{name}', data={'filterFile': (f, 'filter.xlsx')})
+
+        week1 = post('weekly', make_rows(0, 40))
+        week2 = post('weekly', make_rows(30, 80))
+        listed = client.get('/api/exclusion-lists').get_json()['data']
+        invalid = post('a.b', make_rows(0, 5))
+        empty = client.post('/api/exclusion-lists/weekly', data={})
+
+        form = {'platform': 'all', 'deviceIds': 'dev1', 'dataTypes': '["initial", "user"]'}
+        with_lists = dict(form, exclusionLists='weekly, weekly')
+        rows = make_rows(0, 200)
+        filter_rows = make_rows(0, 80)
+        analyze = backend.run_analyze(upload(folder, 'data.xlsx', rows), None, with_lists, '')
+        expected = backend.run_analyze(upload(folder, 'data.xlsx', rows), upload(folder, 'filter.xlsx', filter_rows),
+                                       form, '')
+        labels = backend.run_label_process(upload(folder, 'data.xlsx', rows), None, with_lists, '')
+        expected_labels = backend.run_label_process(upload(folder, 'data.xlsx', rows),
+                                                    upload(folder, 'filter.xlsx', filter_rows), form, '')
+        batch = backend.run_batch('analyze', backend.UploadBatch([
+            upload(folder, 'a.xlsx', rows[:100]), upload(folder, 'b.csv', rows[100:]),
+        ]), None, with_lists, '')
+
+        # 导入后追加的条目对追加的行生效
+        base = backend.run_analyze(upload(folder, 'base.xlsx', make_rows(0, 150)), None, with_lists, '')
+        post('weekly', make_rows(150, 170))
+        appended = backend.run_append(upload(folder, 'delta.csv', make_rows(150, 200)), None,
+                                      {'datasetId': base['datasetId']}, '')
+        expected_appended = backend.run_analyze(upload(folder, 'data.xlsx', rows),
+                                                upload(folder, 'filter.xlsx', filter_rows + make_rows(150, 170)),
+                                                form, '')
+        rerender = client.get(f"/api/datasets/{analyze['datasetId']}/analyze", query_string={'deviceIds': 'dev2'})
+        expected_rerender = client.get(f"/api/datasets/{expected['datasetId']}/analyze",
+                                       query_string={'deviceIds': 'dev2'})
+
+        deleted = client.delete('/api/exclusion-lists/weekly')
+        deleted_again = client.delete('/api/exclusion-lists/weekly')
+
+        checks = [
+            ("追加到排除列表", week1.status_code == 200 and week1.get_json()['added'] == 32
+             and week2.get_json() == {'name': 'weekly', 'added': 32, 'count': 64}),
+            ("列出排除列表", [(meta['name'], meta['count']) for meta in listed] == [('weekly', 64)]),
+            ("名称不正确", invalid.status_code == 400),
+            ("没有需去除的数据", empty.status_code == 400),
+            ("小志总数据与过滤文件相同", analyze['data'] == expected['data']),
+            ("小志标签数据与过滤文件相同", labels['data'] == expected_labels['data']),
+            ("批量导入与过滤文件相同", batch['data'] == expected['data']),
+            ("追加数据使用排除列表当前的内容", appended['data'] == expected_appended['data']),
+            ("修改设备 ID 重新生成", rerender.status_code == 200
+             and rerender.get_json()['data'] == expected_rerender.get_json()['data']),
+            ("删除排除列表", deleted.status_code == 200 and deleted_again.status_code == 404),
+        ]
+        for name, kwargs in [('排除列表不存在', {'exclusionLists': 'weekly'}),
+                             ('排除列表名称不正确', {'exclusionLists': '../x'})]:
+            try:
+                backend.run_analyze(upload(folder, 'data.xlsx', rows[:10]), None, dict(form, **kwargs), '')
+                checks.append((name, False))
+            except backend.IngestError as e:
+                checks.append((name, e.status == 400))
+    finally:
+        backend.exclusion_library = original
+
+    for name, ok in checks:
+        print(f"  {'✓' if ok else '✗'} {name}")
+        assert ok
+    print()
+
+
+if __name__ == "__main__":
+    print("排除列表库测试")
+    print("=" * 50)
+
+    test_exclusion_library()
+    test_exclusion_lists_api()
+
+    print("测试完成！")
@@ -8,7 +8,7 @@ import os
 import sys
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from app import allowed_file, read_excel_with_python_libs
+from app import allowed_file, file_format, read_excel_with_python_libs
 
 def test_allowed_file():
     """测试文件扩展名验证功能"""
@@ -20,7 +20,10 @@ def test_allowed_file():
         ("test.xlsm", True),
         ("test.xltx", True),
         ("test.xltm", True),
-        ("test.csv", False),
+        ("test.csv", True),
+        ("test.csv.gz", True),
+        ("test.parquet", True),
+        ("test.gz", False),
         ("test.txt", False),
         ("test", False),  # 没有扩展名
         ("test.XLSX", True),  # 大写扩展名
@@ -47,10 +50,12 @@ def test_file_extension_detection():
         ("test.xltm", ".xltm"),
         ("test", ""),  # 没有扩展名
         ("test.csv", ".csv"),
+        ("test.CSV.GZ", ".csv.gz"),
+        ("test.parquet", ".parquet"),
     ]
     
     for filename, expected_ext in test_cases:
-        actual_ext = os.path.splitext(filename)[1].lower()
+        actual_ext = file_format(filename)
         expected_ext = expected_ext.lower()
         status = "✓" if actual_ext == expected_ext else "✗"
         print(f"  {status} {filename}: '{actual_ext}' (期望: '{expected_ext}')")
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试使用人数的近似计数：HyperLogLog 的误差、合并和保存，以及近似计数的导入、追加和批量导入
+"""
+
+import os
+import pickle
+import sys
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import app as backend
+from hyperloglog import HyperLogLog, standard_error
+from test_append import make_rows, upload, use_temp_folders
+
+use_temp_folders()
+
+
+def test_hyperloglog():
+    """测试误差在标准误差的 3 倍以内，合并等于并集，设备数较少时准确，可以序列化"""
+    print("测试 HyperLogLog...")
+
+    bound = 3 * standard_error()
+    errors = []
+    for n in (20000, 100000):
+        sketch = HyperLogLog()
+        sketch.update(f'device-{n}-{i}' for i in range(n))
+        errors.append(abs(len(sketch) - n) / n)
+
+    left, right, both = HyperLogLog(), HyperLogLog(), HyperLogLog()
+    left.update(f'dev{i}' for i in range(0, 30000))
+    right.update(f'dev{i}' for i in range(20000, 50000))
+    both.update(f'dev{i}' for i in range(0, 50000))
+    left |= right
+
+    small = HyperLogLog()
+    small.update(['a', 'b', 'c', 'a', 1, '1'])
+
+    checks = [
+        ("误差在范围内", all(error <= bound for error in errors)),
+        ("合并等于并集", left.registers == both.registers),
+        ("设备数较少时准确", len(small) == 5),
+        ("空草图", len(HyperLogLog()) == 0),
+        ("序列化", len(pickle.loads(pickle.dumps(left))) == len(left)),
+    ]
+    try:
+        HyperLogLog(10).update(HyperLogLog())
+        checks.append(("precision 不同时不能合并", False))
+    except ValueError:
+        checks.append(("precision 不同时不能合并", True))
+    for name, ok in checks:
+        print(f"  {'✓' if ok else '✗'} {name}")
+        assert ok
+    print()
+
+
+def test_estimate_unbiased():
+    """测试 3 万到 6 万个设备（线性计数与原始估计的切换点附近）多组数据的平均误差接近 0"""
+    print("测试 HyperLogLog 偏差...")
+
+    seeds = range(5)
+    checks = []
+    all_errors = []
+    for n in range(30000, 60001, 5000):
+        errors = []
+        for seed in seeds:
+            sketch = HyperLogLog()
+            sketch.update(f'device-{seed}-{i}' for i in range(n))
+            errors.append(sketch.estimate() / n - 1)
+        all_errors.extend(errors)
+        mean = sum(errors) / len(errors)
+        # 5 组的平均值的标准误差约 0.36%
+        checks.append((f"{n} 个设备平均误差 {mean:+.2%}", abs(mean) <= 0.01))
+    mean = sum(all_errors) / len(all_errors)
+    checks.append((f"总平均误差 {mean:+.2%}", abs(mean) <= 0.005))
+    checks.append(("误差在标准误差的 3 倍以内", all(abs(error) <= 3 * standard_error() for error in all_errors)))
+
+    for name, ok in checks:
+        print(f"  {'✓' if ok else '✗'} {name}")
+        assert ok
+    print()
+
+
+def device_counts(results):
+    return {row['metric']: (row['initialData'], row['userData']) for row in results if row['metric'].endswith('使用人数')}
+
+
+def test_approximate_analyze():
+    """测试近似计数的导入、追加和批量导入：使用人数与精确结果一致（设备数较少），其他指标不变，结果标明计算方式"""
+    print("测试近似计数...")
+
+    folder = tempfile.mkdtemp()
+    client = backend.app.test_client()
+    form = {'platform': 'all', 'deviceIds': 'dev1', 'dataTypes': '["initial", "user"]'}
+
+    exact = backend.run_analyze(upload(folder, 'all.xlsx', make_rows(0, 260)), None, form, '')
+    approximate = backend.run_analyze(upload(folder, 'base.xlsx', make_rows(0, 200)), None,
+                                      dict(form, countMode='approximate'), '')
+    appended = backend.run_append(upload(folder, 'delta.csv', make_rows(150, 260)), None,
+                                  {'datasetId': approximate['datasetId']}, '')
+    batch = backend.run_batch('analyze', backend.UploadBatch([
+        upload(folder, 'a.xlsx', make_rows(0, 120)), upload(folder, 'b.csv', make_rows(120, 260)),
+    ]), None, dict(form, countMode='approximate'), '')
+    rerender = client.get(f"/api/datasets/{approximate['datasetId']}/analyze",
+                          query_string={'platform': 'all', 'deviceIds': 'dev1'})
+    changed = client.get(f"/api/datasets/{approximate['datasetId']}/analyze", query_string={'deviceIds': 'dev2'})
+
+    strip = lambda results: [{k: v for k, v in row.items() if k != 'mode'} for row in results]
+    modes = {row['metric'].split(' - ')[1]: row['mode'] for row in appended['data']}
+    checks = [
+        ("精确结果标明计算方式", exact['countMode'] == 'exact' and {row['mode'] for row in exact['data']} == {'exact'}),
+        ("追加后与精确结果相同", strip(appended['data']) == strip(exact['data'])),
+        ("批量导入与精确结果相同", device_counts(batch['data']) == device_counts(exact['data'])),
+        ("只有使用人数为近似", appended['countMode'] == 'approximate' and modes['使用人数'] == 'approximate'
+         and {mode for key, mode in modes.items() if key != '使用人数'} == {'exact'}),
+        ("平台和设备 ID 不变时由数据集重新生成", rerender.status_code == 200
+         and rerender.get_json()['data'] == appended['data']),
+        ("修改设备 ID 需要重新导入", changed.status_code == 409),
+    ]
+    try:
+        backend.run_analyze(upload(folder, 'bad.xlsx', make_rows(0, 10)), None, dict(form, countMode='x'), '')
+        checks.append(("参数错误", False))
+    except backend.IngestError as e:
+        checks.append(("参数错误", e.status == 400))
+    for name, ok in checks:
+        print(f"  {'✓' if ok else '✗'} {name}")
+        assert ok
+    print()
+
+
+if __name__ == "__main__":
+    print("近似计数测试")
+    print("=" * 50)
+
+    test_hyperloglog()
+    test_estimate_unbiased()
+    test_approximate_analyze()
+
+    print("测试完成！")
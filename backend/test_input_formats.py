@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试 CSV、gzip 压缩的 CSV 和 Parquet 文件的读取结果与 xlsx 一致
+"""
+
+import csv
+import gzip
+import io
+import os
+import shutil
+import sys
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from openpyxl import Workbook
+
+import app as backend
+import csv_reader
+from test_append import use_temp_folders
+
+use_temp_folders()
+
+HEADERS = ['deviceId', 'pkgName', 'question', 'userContent', 'imageUrls', 'extra']
+
+
+def make_rows(rows=200):
+    return [[f'dev{i % 5}', 'com.helloxj.xlook', f'标签{i % 3}', f'内容, "引号"\n换行{i}', '', f'x{i}']
+            for i in range(rows)]
+
+
+def make_workbook(path, rows):
+    wb = Workbook()
+    ws = wb.active
+    ws.append(HEADERS)
+    for row in rows:
+        ws.append([value or None for value in row])
+    wb.save(path)
+
+
+def write_csv(path, rows, encoding, gzipped=False):
+    opener = gzip.open if gzipped else open
+    with opener(path, 'wt', encoding=encoding, newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(HEADERS)
+        writer.writerows(rows)
+
+
+def label_result(path, filename):
+    # 处理完成后会删除上传文件，使用副本
+    copy_path = os.path.join(tempfile.mkdtemp(), filename)
+    shutil.copy(path, copy_path)
+    form = {'platform': '安卓', 'analysisType': 'default'}
+    return backend.run_label_process(backend.Upload(copy_path, filename), None, form, '')['data']
+
+
+def test_csv_matches_xlsx():
+    """测试 UTF-8（带 BOM）、GBK 和 gzip 压缩的 CSV 与 xlsx 的统计结果一致"""
+    print("测试 CSV 读取...")
+
+    folder = tempfile.mkdtemp()
+    rows = make_rows()
+    xlsx_path = os.path.join(folder, 'data.xlsx')
+    make_workbook(xlsx_path, rows)
+    expected = label_result(xlsx_path, 'data.xlsx')
+    expected_rows = list(backend.read_excel_table(xlsx_path).view().iter_dicts())
+
+    utf8_path = os.path.join(folder, 'utf8.csv')
+    write_csv(utf8_path, rows, 'utf-8-sig')
+    gbk_path = os.path.join(folder, 'gbk.csv')
+    write_csv(gbk_path, rows, 'gbk')
+    gz_path = os.path.join(folder, 'data.csv.gz')
+    write_csv(gz_path, rows, 'gbk', gzipped=True)
+    # 开头是纯 ASCII（按 UTF-8 识别），后面才出现 GBK 编码的中文
+    late_path = os.path.join(folder, 'late.csv')
+    write_csv(late_path, [[f'dev{i}', 'com.helloxj.xlook', 'a', 'b' * 100, '', ''] for i in range(1000)] + rows, 'gbk')
+
+    with open(gbk_path, 'rb') as f:
+        stream = io.BytesIO(f.read())
+    late_table = backend.read_excel_table(late_path)
+
+    checks = [
+        ("UTF-8 编码", label_result(utf8_path, 'utf8.csv') == expected),
+        ("GBK 编码", label_result(gbk_path, 'gbk.csv') == expected),
+        ("gzip 压缩", label_result(gz_path, 'data.csv.gz') == expected),
+        ("上传文件的流", list(backend.read_excel_table(stream, filename='gbk.csv').view().iter_dicts()) == expected_rows),
+        ("识别编码", csv_reader.detect_encoding(utf8_path) == csv_reader.UTF8_ENCODING
+         and csv_reader.detect_encoding(gz_path, gzipped=True) == csv_reader.GBK_ENCODING),
+        ("后面出现 GBK 时重新读取", list(late_table.view().values('question'))[-1] == rows[-1][2]),
+        ("列投影", backend.read_excel_table(gbk_path, columns=('question',)).column_names == ['question']),
+    ]
+    for name, ok in checks:
+        print(f"  {'✓' if ok else '✗'} {name}")
+        assert ok
+    print()
+
+
+def test_dataset_columns():
+    """测试 SQL 查询的数据集默认保存文件中的所有列，配置去重键时 DATASET_COLUMNS 只影响数据集的列，不影响统计结果"""
+    print("测试数据集的列...")
+
+    folder = tempfile.mkdtemp()
+    xlsx_path = os.path.join(folder, 'data.xlsx')
+    make_workbook(xlsx_path, make_rows())
+
+    def import_columns():
+        copy_path = os.path.join(tempfile.mkdtemp(), 'data.xlsx')
+        shutil.copy(xlsx_path, copy_path)
+        form = {'platform': '安卓', 'analysisType': 'default'}
+        response = backend.run_label_process(backend.Upload(copy_path, 'data.xlsx'), None, form, '')
+        conn = backend.dataset_store.connect(response['datasetId'])
+        try:
+            columns = [row[1] for row in conn.execute('PRAGMA table_info(data)')]
+            extra = conn.execute('SELECT COUNT(*) FROM data WHERE extra IS NOT NULL').fetchone()[0] if 'extra' in columns else 0
+        finally:
+            conn.close()
+        return response['data'], columns, extra
+
+    full = import_columns()
+    original = backend.app.config['DATASET_COLUMNS'], backend.app.config['DEDUP_KEY_COLUMNS']
+    backend.app.config['DATASET_COLUMNS'] = ()
+    try:
+        # 没有去重键时默认的去重键为所有列，仍然读取所有列
+        unkeyed = import_columns()
+        backend.app.config['DEDUP_KEY_COLUMNS'] = ('deviceId', 'question')
+        projected = import_columns()
+    finally:
+        backend.app.config['DATASET_COLUMNS'], backend.app.config['DEDUP_KEY_COLUMNS'] = original
+
+    checks = [
+        ("默认保存所有列", full[1][:len(HEADERS)] == HEADERS and full[2] > 0),
+        ("没有去重键时保存所有列", 'extra' in unkeyed[1]),
+        ("只保存统计使用的列", 'extra' not in projected[1]),
+        ("统计结果相同", full[0] == projected[0]),
+    ]
+    for name, ok in checks:
+        print(f"  {'✓' if ok else '✗'} {name}")
+        assert ok
+    print()
+
+
+def test_parquet_matches_xlsx():
+    """测试 Parquet 只读取需要的列，统计结果与 xlsx 一致（没有安装 pyarrow 时跳过）"""
+    print("测试 Parquet 读取...")
+    try:
+        import pyarrow
+        import pyarrow.parquet as pq
+    except ImportError:
+        print("  - 没有安装 pyarrow，跳过")
+        print()
+        return
+
+    folder = tempfile.mkdtemp()
+    rows = make_rows()
+    xlsx_path = os.path.join(folder, 'data.xlsx')
+    make_workbook(xlsx_path, rows)
+    parquet_path = os.path.join(folder, 'data.parquet')
+    columns = list(zip(*rows))
+    pq.write_table(pyarrow.table({name: [value or None for value in values]
+                                  for name, values in zip(HEADERS, columns)}), parquet_path, row_group_size=64)
+
+    table = backend.read_excel_table(parquet_path, columns=('question', 'deviceId'))
+    checks = [
+        ("统计结果一致", label_result(parquet_path, 'data.parquet') == label_result(xlsx_path, 'data.xlsx')),
+        ("只读取需要的列", table.headers == HEADERS and sorted(table.column_names) == ['deviceId', 'question']),
+        ("行数", len(table) == len(rows)),
+    ]
+    for name, ok in checks:
+        print(f"  {'✓' if ok else '✗'} {name}")
+        assert ok
+    print()
+
+
+if __name__ == "__main__":
+    print("CSV 和 Parquet 读取测试")
+    print("=" * 50)
+
+    test_csv_matches_xlsx()
+    test_dataset_columns()
+    test_parquet_matches_xlsx()
+
+    print("测试完成！")
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试异步导入任务
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from openpyxl import Workbook
+
+import app as backend
+from test_append import use_temp_folders
+
+use_temp_folders()
+
+
+def make_workbook(path):
+    wb = Workbook()
+    ws = wb.active
+    ws.append(['deviceId', 'pkgName', 'question', 'userContent', 'imageUrls'])
+    for i in range(60):
+        ws.append([f'dev{i % 5}', 'com.helloxj.xlook', f'标签{i % 3}', f'内容{i}', ''])
+    wb.save(path)
+
+
+def test_ingest_job_matches_sync_result():
+    """测试导入任务记录各阶段进度，完成后的结果与同步接口一致"""
+    print("测试导入任务...")
+
+    folder = tempfile.mkdtemp()
+    source = os.path.join(folder, 'data.xlsx')
+    make_workbook(source)
+    form = {'platform': '安卓', 'deviceIds': 'dev1', 'analysisType': 'default'}
+
+    job_path = os.path.join(folder, 'job.xlsx')
+    shutil.copy(source, job_path)
+    job_id = backend.job_store.create('label-process')
+    backend.run_ingest_job(job_id, 'label-process', backend.Upload(job_path, 'job.xlsx'), None, form, 'test-session')
+    job = backend.job_store.get(job_id)
+
+    sync_path = os.path.join(folder, 'sync.xlsx')
+    shutil.copy(source, sync_path)
+    expected = backend.run_label_process(backend.Upload(sync_path, 'sync.xlsx'), None, form, 'test-session')
+
+    missing_id = backend.job_store.create('analyze')
+    missing = backend.Upload(os.path.join(folder, 'missing.xlsx'), 'missing.xlsx')
+    backend.run_ingest_job(missing_id, 'analyze', missing, None, {}, '')
+    failed = backend.job_store.get(missing_id)
+
+    checks = [
+        ("任务完成", job['status'] == 'done' and job['stage'] == 'done'),
+        ("已处理行数", job['rowsProcessed'] == 48),
+        ("结果与同步接口一致", job['result']['data'] == expected['data']),
+        ("删除上传文件", not os.path.exists(job_path)),
+        ("失败任务记录错误", failed['status'] == 'failed' and failed['errorStatus'] == 500),
+    ]
+    for name, ok in checks:
+        print(f"  {'✓' if ok else '✗'} {name}")
+        assert ok
+    print()
+
+
+if __name__ == "__main__":
+    print("导入任务测试")
+    print("=" * 50)
+
+    test_ingest_job_matches_sync_result()
+
+    print("测试完成！")
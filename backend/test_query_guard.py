@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试用户 SQL 的时间限制、取消和查询槽
+"""
+
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from query_guard import QueryGuard, QuerySlots, QueryAborted, QueryBusy, request_cancel
+
+# 不会自行结束的查询
+RUNAWAY_QUERY = 'WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n) SELECT COUNT(*) FROM n'
+
+
+def run_guarded(guard):
+    conn = sqlite3.connect(':memory:')
+    guard.install(conn)
+    try:
+        conn.execute(RUNAWAY_QUERY).fetchall()
+    except Exception as e:
+        return guard.translate(e)
+    finally:
+        conn.close()
+        guard.finish()
+
+
+def test_time_limit_and_cancel():
+    """测试超时和取消都会中断查询并给出明确的原因"""
+    print("测试时间限制和取消...")
+
+    folder = tempfile.mkdtemp()
+    started = time.monotonic()
+    timeout_error = run_guarded(QueryGuard(folder, 'q1', time_limit=0.3))
+    elapsed = time.monotonic() - started
+
+    # 创建后等待（例如等待查询槽）的时间不计入时间限制
+    waited = QueryGuard(folder, 'q3', time_limit=0.3)
+    time.sleep(0.4)
+    conn = sqlite3.connect(':memory:')
+    waited.install(conn)
+    waited_result = conn.execute('WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < 100000) '
+                                 'SELECT COUNT(*) FROM n').fetchone()[0]
+    conn.close()
+
+    guard = QueryGuard(folder, 'q2', time_limit=30)
+    timer = threading.Timer(0.3, request_cancel, (folder, 'q2'))
+    timer.start()
+    cancel_error = run_guarded(guard)
+    timer.join()
+
+    checks = [
+        ("超时中断", isinstance(timeout_error, QueryAborted) and '时间限制' in str(timeout_error) and elapsed < 5),
+        ("等待的时间不计入时间限制", waited_result == 100000),
+        ("取消中断", isinstance(cancel_error, QueryAborted) and str(cancel_error) == '查询已取消'),
+        ("清理取消标记", not guard.cancel_path.exists()),
+        ("拒绝无效查询 ID", not request_cancel(folder, '../x')),
+    ]
+    for name, ok in checks:
+        print(f"  {'✓' if ok else '✗'} {name}")
+        assert ok
+    print()
+
+
+def test_query_slots():
+    """测试查询槽用完后拒绝新的查询，释放后可以再次获取"""
+    print("测试查询槽...")
+
+    slots = QuerySlots(tempfile.mkdtemp(), 1)
+    release = slots.acquire(timeout=1)
+    try:
+        slots.acquire(timeout=0.2)
+        busy = False
+    except QueryBusy:
+        busy = True
+    release()
+    try:
+        slots.acquire(timeout=0.2)()
+        reacquired = True
+    except QueryBusy:
+        reacquired = False
+
+    checks = [
+        ("查询槽用完", busy),
+        ("释放后重新获取", reacquired),
+    ]
+    for name, ok in checks:
+        print(f"  {'✓' if ok else '✗'} {name}")
+        assert ok
+    print()
+
+
+if __name__ == "__main__":
+    print("查询保护测试")
+    print("=" * 50)
+
+    test_time_limit_and_cancel()
+    test_query_slots()
+
+    print("测试完成！")
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试 SQL 查询结果分页和流式输出
+"""
+
+import csv
+import json
+import os
+import sqlite3
+import sys
+from io import StringIO
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import query_results
+from query_results import PageTokenError
+
+
+def make_cursor(count):
+    conn = sqlite3.connect(':memory:')
+    conn.execute('CREATE TABLE data (id INTEGER, question TEXT)')
+    conn.executemany('INSERT INTO data VALUES (?, ?)', [(i, f'标签{i % 3}') for i in range(count)])
+    return conn.execute('SELECT id, question FROM data ORDER BY id')
+
+
+def test_pagination():
+    """测试按分页标记逐页读取的结果与一次读取完全一致"""
+    print("测试分页...")
+
+    query = 'SELECT id, question FROM data ORDER BY id'
+    pages = []
+    offset, has_more = 0, True
+    while has_more:
+        rows, has_more = query_results.fetch_page(make_cursor(2500), offset, 1000)
+        pages.append(rows)
+        if has_more:
+            token = query_results.encode_page_token('a' * 32, query, offset + len(rows))
+            offset = query_results.decode_page_token(token, 'a' * 32, query)
+
+    try:
+        query_results.decode_page_token(token, 'a' * 32, query + ' DESC')
+        rejected = False
+    except PageTokenError:
+        rejected = True
+
+    checks = [
+        ("页数", [len(rows) for rows in pages] == [1000, 1000, 500]),
+        ("结果一致", [row for rows in pages for row in rows] == make_cursor(2500).fetchall()),
+        ("查询变化后拒绝分页标记", rejected),
+    ]
+    for name, ok in checks:
+        print(f"  {'✓' if ok else '✗'} {name}")
+        assert ok
+    print()
+
+
+def test_streaming():
+    """测试 NDJSON 和 CSV 流式输出，超过行数上限时末尾有截断标记"""
+    print("测试流式输出...")
+
+    cursor = make_cursor(2500)
+    ndjson = ''.join(query_results.iter_ndjson(cursor, query_results.column_names(cursor)))
+    cursor = make_cursor(2500)
+    chunks = list(query_results.iter_csv(cursor, query_results.column_names(cursor)))
+    csv_rows = list(csv.reader(StringIO(''.join(chunks).lstrip('\ufeff'))))
+
+    checks = [
+        ("NDJSON", [json.loads(line) for line in ndjson.splitlines()][2499] == {'id': 2499, 'question': '标签0'}),
+        ("CSV 分块", len(chunks) == 3),
+        ("CSV 内容", csv_rows[0] == ['id', 'question'] and len(csv_rows) == 2501 and csv_rows[1] == ['0', '标签0']),
+        ("空结果 CSV", list(query_results.iter_csv(make_cursor(0), ['id'])) == ['\ufeffid\r\n']),
+    ]
+
+    # 超过行数上限时末尾有截断标记，刚好等于上限时没有
+    def export(iterate, rows, max_rows):
+        cursor = make_cursor(rows)
+        return ''.join(iterate(cursor, query_results.column_names(cursor), max_rows))
+
+    truncated = [json.loads(line) for line in export(query_results.iter_ndjson, 2500, 1500).splitlines()]
+    complete = [json.loads(line) for line in export(query_results.iter_ndjson, 1500, 1500).splitlines()]
+    truncated_csv = list(csv.reader(StringIO(export(query_results.iter_csv, 2500, 1500).lstrip('\ufeff'))))
+    complete_csv = list(csv.reader(StringIO(export(query_results.iter_csv, 1500, 1500).lstrip('\ufeff'))))
+    checks += [
+        ("NDJSON 截断标记", len(truncated) == 1501 and truncated[-1]['truncated'] is True
+         and truncated[-1]['maxRows'] == 1500 and 'truncated' not in truncated[-2]),
+        ("NDJSON 没有截断", len(complete) == 1500 and 'truncated' not in complete[-1]),
+        ("CSV 截断标记", len(truncated_csv) == 1502 and truncated_csv[-1][0].startswith('# 结果超过 1500 行')),
+        ("CSV 没有截断", len(complete_csv) == 1501 and complete_csv[-1][0] == '1499'),
+    ]
+    for name, ok in checks:
+        print(f"  {'✓' if ok else '✗'} {name}")
+        assert ok
+    print()
+
+
+if __name__ == "__main__":
+    print("查询结果测试")
+    print("=" * 50)
+
+    test_pagination()
+    test_streaming()
+
+    print("测试完成！")
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试 SQL 查询结果缓存
+"""
+
+import os
+import sys
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from result_cache import ResultCache, normalize_sql, is_cacheable, make_key
+
+
+def test_key_normalization():
+    """测试 SQL 规范化只合并引号外的空白，数据集变化后键随之变化"""
+    print("测试缓存键...")
+
+    query = "SELECT  question,\n  COUNT(*) FROM data WHERE userContent = 'a  b' ;"
+    checks = [
+        ("规范化", normalize_sql(query) == "SELECT question, COUNT(*) FROM data WHERE userContent = 'a  b'"),
+        ("空白不影响键", make_key('d1', {}, query, 0, 1000) == make_key('d1', {}, normalize_sql(query), 0, 1000)),
+        ("去掉注释", normalize_sql("SELECT 1 -- x\nWHERE a=1 /* y\n z */ AND b = '--' ;")
+         == "SELECT 1 WHERE a=1 AND b = '--'"),
+        ("注释后的语句影响键",
+         make_key('d1', {}, "SELECT 1 -- x\nWHERE a=1", 0, 1000) != make_key('d1', {}, "SELECT 1 -- x\nWHERE a=2", 0, 1000)),
+        ("引号内空白影响键", make_key('d1', {}, "SELECT 'a  b'", 0, 1000) != make_key('d1', {}, "SELECT 'a b'", 0, 1000)),
+        ("重新加载后失效", make_key('d1', {}, query, 0, 1000) != make_key('d2', {}, query, 0, 1000)),
+        ("附加数据集变化后失效",
+         make_key('d1', {'page2_data': 'x'}, query, 0, 1000) != make_key('d1', {'page2_data': 'y'}, query, 0, 1000)),
+        ("追加数据后失效",
+         make_key('d1', {}, query, 0, 1000, {'d1': 1}) != make_key('d1', {}, query, 0, 1000, {'d1': 2})),
+        ("不缓存随机结果", not is_cacheable('SELECT * FROM data ORDER BY RANDOM()')),
+        ("不缓存当前时间", not any(is_cacheable(query) for query in [
+            'SELECT CURRENT_TIMESTAMP', 'SELECT current_date', 'SELECT CURRENT_TIME FROM data',
+            "SELECT julianday('now') - julianday(createTime) FROM data", 'SELECT julianday()',
+            "SELECT strftime('%Y-%m-%d', 'NOW')", "SELECT strftime('%s')", 'SELECT datetime ( )',
+            'SELECT changes()', 'SELECT last_insert_rowid()'])),
+        ("日期函数的参数不是当前时间时缓存", is_cacheable("SELECT strftime('%Y', createTime), date(createTime) FROM data")),
+    ]
+    for name, ok in checks:
+        print(f"  {'✓' if ok else '✗'} {name}")
+        assert ok
+    print()
+
+
+def test_hits_and_lru_eviction():
+    """测试命中计数和按字节数的 LRU 淘汰"""
+    print("测试结果缓存...")
+
+    value = {'columns': ['question'], 'rows': [['标签' * 100]] * 10, 'hasMore': False}
+    cache = ResultCache(os.path.join(tempfile.mkdtemp(), 'result_cache.db'), max_bytes=15000, max_entry_bytes=15000)
+    cache.put('a', value)
+    cache.put('b', value)
+    first_get = cache.get('a')
+    cache.put('c', value)  # 超出容量，淘汰最久未访问的 b
+
+    stats = cache.stats()
+    checks = [
+        ("读取结果", first_get == value),
+        ("保留最近访问", cache.get('a') == value and cache.get('c') == value),
+        ("淘汰最久未访问", cache.get('b') is None),
+        ("命中计数", cache.stats()['hits'] == 3 and cache.stats()['misses'] == 1),
+        ("容量上限", stats['bytes'] <= 15000 and stats['entries'] == 2),
+    ]
+    for name, ok in checks:
+        print(f"  {'✓' if ok else '✗'} {name}")
+        assert ok
+    print()
+
+
+if __name__ == "__main__":
+    print("查询结果缓存测试")
+    print("=" * 50)
+
+    test_key_normalization()
+    test_hits_and_lru_eviction()
+
+    print("测试完成！")
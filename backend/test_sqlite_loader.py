@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试 SQLite 批量导入
+"""
+
+import os
+import sqlite3
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from columnar import TableBuilder
+import sqlite_loader
+
+
+def test_load_view_types_and_indexes():
+    """测试列类型推断、中文/空格列名和自动索引"""
+    print("测试 SQLite 批量导入...")
+
+    builder = TableBuilder()
+    builder.set_headers(['deviceId', 'count', 'score', '用户 内容', 'question'])
+    for i in range(12000):
+        builder.append((f'dev{i % 7}', i, i / 2 if i % 2 else '', '内容', '标签'))
+    table = builder.build()
+
+    conn = sqlite3.connect(':memory:')
+    loaded = sqlite_loader.load_view(conn, table.view())
+
+    columns = {row[1]: row[2] for row in conn.execute('PRAGMA table_info(data)')}
+    indexes = {row[1] for row in conn.execute('PRAGMA index_list(data)')}
+    count = conn.execute('SELECT COUNT(*) FROM data WHERE "用户 内容" = ?', ('内容',)).fetchone()[0]
+
+    expected_columns = {'deviceId': 'TEXT', 'count': 'INTEGER', 'score': 'REAL', '用户 内容': 'TEXT', 'question': 'TEXT'}
+    checks = [
+        ("导入行数", loaded == 12000),
+        ("列类型", columns == expected_columns),
+        ("自动索引", indexes == {'idx_data_deviceId', 'idx_data_question'}),
+        ("中文列名查询", count == 12000),
+    ]
+    for name, ok in checks:
+        print(f"  {'✓' if ok else '✗'} {name}")
+        assert ok
+    print()
+
+
+if __name__ == "__main__":
+    print("SQLite 导入测试")
+    print("=" * 50)
+
+    test_load_view_types_and_indexes()
+
+    print("测试完成！")
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试直接解析请求中的上传文件和后台清理
+"""
+
+import io
+import os
+import sys
+import tempfile
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from openpyxl import Workbook
+
+import app as backend
+from test_append import use_temp_folders
+
+use_temp_folders()
+
+
+def make_workbook(path, rows=60):
+    wb = Workbook()
+    ws = wb.active
+    ws.append(['deviceId', 'pkgName', 'question', 'userContent', 'imageUrls'])
+    for i in range(rows):
+        ws.append([f'dev{i % 5}', 'com.helloxj.xlook', f'标签{i % 3}', f'内容{i}', ''])
+    wb.save(path)
+
+
+def post_label_process(client, content, memory_bytes):
+    backend.app.config['UPLOAD_MEMORY_BYTES'] = memory_bytes
+    data = {'file': (io.BytesIO(content), 'data.xlsx'), 'platform': '安卓', 'analysisType': 'default'}
+    return client.post('/api/label-process', data=data, content_type='multipart/form-data')
+
+
+def test_parse_upload_stream():
+    """测试上传文件在内存或匿名临时文件中直接解析，不写入 uploads 目录"""
+    print("测试直接解析上传文件...")
+
+    folder = tempfile.mkdtemp()
+    path = os.path.join(folder, 'data.xlsx')
+    make_workbook(path)
+    with open(path, 'rb') as f:
+        content = f.read()
+    expected = backend.run_label_process(backend.Upload(path, 'data.xlsx'), None, {'platform': '安卓'}, '')
+
+    before = set(os.listdir(backend.UPLOAD_FOLDER))
+    original_memory_bytes = backend.app.config['UPLOAD_MEMORY_BYTES']
+    client = backend.app.test_client()
+    try:
+        in_memory = post_label_process(client, content, len(content) * 2)
+        spooled = post_label_process(client, content, 0)
+    finally:
+        backend.app.config['UPLOAD_MEMORY_BYTES'] = original_memory_bytes
+
+    checks = [
+        ("内存中的上传文件", in_memory.status_code == 200 and in_memory.get_json()['data'] == expected['data']),
+        ("临时文件中的上传文件", spooled.status_code == 200 and spooled.get_json()['data'] == expected['data']),
+        ("不写入 uploads 目录", set(os.listdir(backend.UPLOAD_FOLDER)) == before),
+    ]
+    for name, ok in checks:
+        print(f"  {'✓' if ok else '✗'} {name}")
+        assert ok
+    print()
+
+
+def test_janitor_removes_old_uploads():
+    """测试后台清理删除过期的上传文件，保留新文件"""
+    print("测试后台清理...")
+
+    old_path = os.path.join(backend.UPLOAD_FOLDER, 'test_janitor_old.xlsx')
+    new_path = os.path.join(backend.UPLOAD_FOLDER, 'test_janitor_new.xlsx')
+    for path in (old_path, new_path):
+        with open(path, 'wb') as f:
+            f.write(b'x')
+    expired = time.time() - 7200
+    os.utime(old_path, (expired, expired))
+
+    backend.run_janitor_once()
+    checks = [
+        ("删除过期文件", not os.path.exists(old_path)),
+        ("保留新文件", os.path.exists(new_path)),
+    ]
+    os.remove(new_path)
+    for name, ok in checks:
+        print(f"  {'✓' if ok else '✗'} {name}")
+        assert ok
+    print()
+
+
+if __name__ == "__main__":
+    print("上传文件测试")
+    print("=" * 50)
+
+    test_parse_upload_stream()
+    test_janitor_removes_old_uploads()
+
+    print("测试完成！")
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试 NumPy 统计内核与逐行实现结果一致（没有安装 numpy 时跳过）
+"""
+
+import os
+import sys
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import analysis
+import app as backend
+import vectorized
+from columnar import TableBuilder, TableView
+from test_analysis import HEADERS, PKG_NAMES, DEVICE_IDS, make_rows, build_table
+from test_append import make_rows as make_upload_rows, upload, use_temp_folders
+
+use_temp_folders()
+
+
+def analyze_result(accumulators, user_data):
+    return ({pkg_name: (initial.to_stats(), user.to_stats(), initial.device_ids, user.device_ids)
+             for pkg_name, (initial, user) in accumulators.items()}, list(user_data.indices))
+
+
+def label_result(counts_by_pkg, filtered_by_pkg, filtered_data):
+    return ({pkg_name: list(counts.items()) for pkg_name, counts in counts_by_pkg.items()},
+            {pkg_name: list(view.indices) for pkg_name, view in filtered_by_pkg.items()},
+            list(filtered_data.indices))
+
+
+def rollup_result(rollup, view):
+    return (rollup.span, rollup.totals, rollup.device_counts, rollup.partials,
+            {pkg_name: list(counts.items()) for pkg_name, counts in rollup.label_totals.items()},
+            rollup.label_heads, rollup.label_counts, rollup.label_firsts, rollup.function_rows, list(view.indices))
+
+
+def fixtures():
+    """(名称, 表)：随机数据、缺少部分列、不使用字典编码、空表"""
+    rows = make_rows(3000, seed=5)
+    plain = TableBuilder(encoded_columns=())
+    plain.set_headers(HEADERS)
+    for row in rows:
+        plain.append(row)
+    partial = TableBuilder()
+    partial.set_headers(['pkgName', 'question', 'avail'])
+    for row in rows[:-1]:
+        partial.append((row[1], row[6], row[3]))
+    empty = TableBuilder()
+    empty.set_headers(HEADERS)
+    return [('随机数据', build_table(rows)), ('不使用字典编码', plain.build()),
+            ('缺少部分列', partial.build()), ('空表', empty.build())]
+
+
+def test_kernels_match_python():
+    """测试各种设备、过滤数据、平台和行视图组合下两个内核的统计量、标签顺序和行视图完全相同"""
+    print("测试 NumPy 统计内核...")
+    if not vectorized.available():
+        print("  - 没有安装 numpy，跳过")
+        print()
+        return
+
+    checks = []
+    for name, table in fixtures():
+        views = [None, TableView(table, range(0, table.nrows, 3))]
+        for device_id_list in ([], DEVICE_IDS[:2], DEVICE_IDS + [2]):
+            for filter_user_contents in (None, {'内容1', '内容2', 'hello', '12', '  '}):
+                for pkg_names in (PKG_NAMES[:1], PKG_NAMES):
+                    for view in views:
+                        args = (table, pkg_names, device_id_list, filter_user_contents, view)
+                        same = (
+                            analyze_result(*analysis.compute_analyze_accumulators(*args))
+                            == analyze_result(*vectorized.compute_analyze_accumulators(*args))
+                            and label_result(*analysis.compute_label_counts(*args))
+                            == label_result(*vectorized.compute_label_counts(*args))
+                        )
+                        approximate = (
+                            analysis.compute_analyze_accumulators(*args, approximate=True)[0][pkg_names[0]][1]
+                            .device_ids.registers
+                            == vectorized.compute_analyze_accumulators(*args, approximate=True)[0][pkg_names[0]][1]
+                            .device_ids.registers
+                        )
+                        rollups = all(
+                            rollup_result(*analysis.compute_device_rollup(*args, **options))
+                            == rollup_result(*vectorized.compute_device_rollup(*args, **options))
+                            for options in ({}, {'labels': False, 'selected': pkg_names[:1]}, {'stats': False}))
+                        checks.append(same and approximate and rollups)
+        ok = all(checks)
+        print(f"  {'✓' if ok else '✗'} {name}")
+        assert ok
+    print()
+
+
+def test_backend_switch():
+    """测试 ANALYSIS_BACKEND=numpy 时导入（精确计数的设备预聚合和近似计数）使用 NumPy 内核，接口结果与逐行实现相同"""
+    print("测试统计内核配置...")
+    if not vectorized.available():
+        print("  - 没有安装 numpy，跳过")
+        print()
+        return
+
+    calls = []
+
+    def spy(name):
+        kernel = getattr(vectorized, name)
+
+        def wrapper(*args, **kwargs):
+            calls.append(name)
+            return kernel(*args, **kwargs)
+        return kernel, wrapper
+
+    folder = tempfile.mkdtemp()
+    rows = make_upload_rows(0, 300)
+    checks = []
+    for kind, run, form, kernel_name in [
+        ('analyze', backend.run_analyze,
+         {'platform': 'all', 'deviceIds': 'dev1', 'dataTypes': '["initial", "user"]', 'countMode': 'exact'},
+         'compute_device_rollup'),
+        ('analyze（近似计数）', backend.run_analyze,
+         {'platform': 'all', 'deviceIds': 'dev1', 'dataTypes': '["initial", "user"]', 'countMode': 'approximate'},
+         'compute_analyze_accumulators'),
+        ('label-process', backend.run_label_process,
+         {'platform': 'all', 'deviceIds': 'dev1', 'analysisType': 'default'},
+         'compute_device_rollup'),
+    ]:
+        results = {}
+        kernel, wrapper = spy(kernel_name)
+        for analysis_backend in ('python', 'numpy'):
+            backend.app.config['ANALYSIS_BACKEND'] = analysis_backend
+            setattr(vectorized, kernel_name, wrapper)
+            del calls[:]
+            try:
+                results[analysis_backend] = run(upload(folder, 'data.xlsx', rows), None, form, '')['data']
+            finally:
+                setattr(vectorized, kernel_name, kernel)
+                backend.app.config['ANALYSIS_BACKEND'] = 'python'
+            checks.append((f"{kind} {analysis_backend} {'使用' if calls else '没有使用'} vectorized.{kernel_name}",
+                           bool(calls) == (analysis_backend == 'numpy')))
+        checks.append((f"{kind} 结果相同", results['python'] == results['numpy']))
+
+    for name, ok in checks:
+        print(f"  {'✓' if ok else '✗'} {name}")
+        assert ok
+    print()
+
+
+if __name__ == "__main__":
+    print("NumPy 统计内核测试")
+    print("=" * 50)
+
+    test_kernels_match_python()
+    test_backend_switch()
+
+    print("测试完成！")
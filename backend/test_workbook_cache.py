@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试工作簿解析缓存
+"""
+
+import os
+import sys
+import tempfile
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from workbook_cache import WorkbookCache
+
+
+def test_cache_hit_skips_parser():
+    """测试相同内容的文件第二次读取命中缓存"""
+    print("测试缓存命中...")
+
+    folder = tempfile.mkdtemp()
+    cache = WorkbookCache(os.path.join(folder, 'cache'), 1024 * 1024)
+    filepath = os.path.join(folder, 'a.xlsx')
+    with open(filepath, 'wb') as f:
+        f.write(b'same content')
+
+    calls = []
+
+    def parser(path):
+        calls.append(path)
+        return ['deviceId'], [('d1',)]
+
+    first = cache.load_or_parse(filepath, parser)
+    second = cache.load_or_parse(filepath, parser)
+
+    status = "✓" if len(calls) == 1 and first == second else "✗"
+    print(f"  {status} 解析次数: {len(calls)} (期望: 1)")
+    assert len(calls) == 1
+    assert first == second
+    print()
+
+
+def test_cache_lru_eviction():
+    """测试超出容量上限时淘汰最久未使用的条目"""
+    print("测试 LRU 淘汰...")
+
+    folder = tempfile.mkdtemp()
+    cache = WorkbookCache(folder, 2500)
+    payload = 'x' * 1000
+
+    cache.put('a', payload)
+    cache.put('b', payload)
+    # 让 a 的访问时间晚于 b
+    past = time.time() - 10
+    os.utime(cache._path('b'), (past, past))
+    cache.get('a')
+    cache.put('c', payload)
+
+    kept = {key for key in 'abc' if cache.get(key) is not None}
+    status = "✓" if kept == {'a', 'c'} else "✗"
+    print(f"  {status} 保留的条目: {sorted(kept)} (期望: ['a', 'c'])")
+    assert kept == {'a', 'c'}
+    print()
+
+
+if __name__ == "__main__":
+    print("解析缓存测试")
+    print("=" * 50)
+
+    test_cache_hit_skips_parser()
+    test_cache_lru_eviction()
+
+    print("测试完成！")
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试流式 XLSX 读取与 openpyxl 只读模式结果一致
+"""
+
+import datetime
+import os
+import sys
+import tempfile
+import zipfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from openpyxl import load_workbook
+
+import app as backend
+from xlsx_reader import XlsxReader, UnsupportedWorkbook
+from test_append import use_temp_folders
+
+use_temp_folders()
+
+CONTENT_TYPES = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="xml" ContentType="application/xml"/>
+<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>
+<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>
+<Override PartName="/xl/worksheets/sheet2.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>
+<Override PartName="/xl/sharedStrings.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"/>
+<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>
+</Types>'''
+
+ROOT_RELS = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>
+</Relationships>'''
+
+WORKBOOK = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">
+<workbookPr date1904="{date1904}"/>
+<bookViews><workbookView activeTab="1"/></bookViews>
+<sheets><sheet name="说明" sheetId="1" r:id="rId1"/><sheet name="数据" sheetId="2" r:id="rId2"/></sheets>
+</workbook>'''
+
+WORKBOOK_RELS = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>
+<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="/xl/worksheets/sheet2.xml"/>
+<Relationship Id="rId3" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/sharedStrings" Target="sharedStrings.xml"/>
+<Relationship Id="rId4" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>
+</Relationships>'''
+
+# 0 号样式为日期格式（没有 s 属性的数字也按日期处理），1 号为常规，2 号为自定义日期格式
+STYLES = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">
+<numFmts count="1"><numFmt numFmtId="164" formatCode="yyyy/mm/dd hh:mm"/></numFmts>
+<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>
+<fills count="1"><fill><patternFill patternType="none"/></fill></fills>
+<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>
+<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>
+<cellXfs count="3">
+<xf numFmtId="14" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>
+<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>
+<xf numFmtId="164" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>
+</cellXfs>
+<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>
+</styleSheet>'''
+
+SHARED_STRINGS = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<sst xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" count="6" uniqueCount="6">
+<si><t>deviceId</t></si>
+<si><t>userContent</t></si>
+<si><t xml:space="preserve">  前后空格 &amp; &lt;转义&gt;
+换行  </t></si>
+<si><r><rPr><b/></rPr><t>富</t></r><r><t>文本</t></r><rPh sb="0" eb="1"><t>フリガナ</t></rPh></si>
+<si><t>_x005F_x000D_保留</t></si>
+<si><t/></si>
+</sst>'''
+
+DATA_SHEET = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" xmlns:x14ac="http://schemas.microsoft.com/office/spreadsheetml/2009/9/ac">
+<dimension ref="A1:F7"/>
+<sheetData>
+<row r="1" spans="1:6" x14ac:dyDescent="0.25"><c r="A1" t="s" s="1"><v>0</v></c><c r="B1" t="s" s="1"><v>1</v></c><c r="D1" t="inlineStr"><is><t>日期</t></is></c></row>
+<row r="2"><c r="A2" t="s" s="1"><v>2</v></c><c r="B2" t="s"><v>3</v></c><c r="C2" s="1"><v>1.5E3</v></c><c r="D2"><v>45292</v></c><c r="E2" t="b"><v>1</v></c><c r="F2" t="e"><v>#N/A</v></c></row>
+<row><c t="s"><v>4</v></c><c t="s"><v>5</v></c><c s="2"><v>45292.5</v></c><c t="str"><v>公式结果</v></c><c/><c t="d"><v>2024-01-02T03:04:05</v></c></row>
+<row r="5.0"><c r="B5" t="inlineStr"><is><r><t>内联</t></r><r><t>富文本</t></r></is></c><c r="A5" s="1"><v>7</v></c></row>
+<row r="6"><c r="C6" s=""><v>42</v></c><c r="D6" s="1"><v></v></c><c r="E6" t="inlineStr"/></row>
+<row r="7"/>
+</sheetData>
+<pageMargins left="0.7" right="0.7" top="0.75" bottom="0.75" header="0.3" footer="0.3"/>
+<extLst><ext uri="{78C0D931-6437-407d-A8EE-F0AAD7539E65}" xmlns:x14="http://schemas.microsoft.com/office/spreadsheetml/2009/9/main"><x14:conditionalFormattings/></ext></extLst>
+</worksheet>'''
+
+OTHER_SHEET = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData/></worksheet>'''
+
+
+def make_workbook(path, data_sheet=DATA_SHEET, date1904='0'):
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('[Content_Types].xml', CONTENT_TYPES)
+        archive.writestr('_rels/.rels', ROOT_RELS)
+        archive.writestr('xl/workbook.xml', WORKBOOK.format(date1904=date1904))
+        archive.writestr('xl/_rels/workbook.xml.rels', WORKBOOK_RELS)
+        archive.writestr('xl/styles.xml', STYLES)
+        archive.writestr('xl/sharedStrings.xml', SHARED_STRINGS)
+        archive.writestr('xl/worksheets/sheet1.xml', OTHER_SHEET)
+        archive.writestr('xl/worksheets/sheet2.xml', data_sheet)
+
+
+def read_both(path, **kwargs):
+    wb = load_workbook(path, read_only=True)
+    try:
+        expected = list(wb.active.iter_rows(values_only=True, **kwargs))
+    finally:
+        wb.close()
+    with XlsxReader(path) as reader:
+        return expected, list(reader.iter_rows(**kwargs))
+
+
+def test_values_match_openpyxl():
+    """测试共享字符串、内联字符串、数字、日期、布尔值和缺失的行列与 openpyxl 一致"""
+    print("测试流式读取...")
+
+    folder = tempfile.mkdtemp()
+    path = os.path.join(folder, 'data.xlsx')
+    make_workbook(path)
+    path_1904 = os.path.join(folder, 'data1904.xlsx')
+    make_workbook(path_1904, date1904='1')
+    # 没有尺寸信息时每行只取到最后一个单元格，缺失的行为空
+    path_unsized = os.path.join(folder, 'unsized.xlsx')
+    make_workbook(path_unsized, DATA_SHEET.replace('<dimension ref="A1:F7"/>', ''))
+
+    all_rows, all_rows_read = read_both(path)
+    header, header_read = read_both(path, max_row=1)
+    projected, projected_read = read_both(path, min_row=2, max_col=2)
+    rows_1904, rows_1904_read = read_both(path_1904)
+    unsized, unsized_read = read_both(path_unsized)
+
+    checks = [
+        ("全部行", all_rows_read == all_rows and len(all_rows) == 7),
+        ("表头", header_read == header),
+        ("列投影", projected_read == projected),
+        ("1904 日期系统", rows_1904_read == rows_1904),
+        ("没有尺寸信息", unsized_read == unsized),
+        ("富文本不含注音", all_rows_read[1][1] == '富文本'),
+        ("日期", all_rows_read[1][3] == datetime.datetime(2024, 1, 1) != rows_1904_read[1][3]),
+    ]
+    for name, ok in checks:
+        print(f"  {'✓' if ok else '✗'} {name}")
+        assert ok
+    print()
+
+
+def test_unsupported_falls_back_to_openpyxl():
+    """测试包含公式或带前缀命名空间的工作表改用 openpyxl 读取"""
+    print("测试不支持的格式...")
+
+    folder = tempfile.mkdtemp()
+    formula_path = os.path.join(folder, 'formula.xlsx')
+    make_workbook(formula_path, DATA_SHEET.replace('<c r="C6" s=""><v>42</v></c>', '<c r="C6"><f>A5*6</f><v>42</v></c>'))
+    prefixed_path = os.path.join(folder, 'prefixed.xlsx')
+    make_workbook(prefixed_path, OTHER_SHEET.replace('<worksheet xmlns=', '<x:worksheet xmlns:x=')
+                  .replace('<sheetData/></worksheet>', '<x:sheetData/></x:worksheet>'))
+
+    formula_error = prefixed_error = False
+    try:
+        with XlsxReader(formula_path) as reader:
+            list(reader.iter_rows())
+    except UnsupportedWorkbook:
+        formula_error = True
+    try:
+        XlsxReader(prefixed_path)
+    except UnsupportedWorkbook:
+        prefixed_error = True
+    table = backend.read_excel_table(formula_path)
+
+    checks = [
+        ("公式", formula_error),
+        ("命名空间前缀", prefixed_error),
+        ("改用 openpyxl 读取", list(table.view().iter_dicts())[4]['Column_2'] == '=A5*6'),
+    ]
+    for name, ok in checks:
+        print(f"  {'✓' if ok else '✗'} {name}")
+        assert ok
+    print()
+
+
+if __name__ == "__main__":
+    print("流式 XLSX 读取测试")
+    print("=" * 50)
+
+    test_values_match_openpyxl()
+    test_unsupported_falls_back_to_openpyxl()
+
+    print("测试完成！")
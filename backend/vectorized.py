@@ -0,0 +1,330 @@
+# -*- coding: utf-8 -*-
+"""
+小志总数据 / 标签数据统计内核的 NumPy 实现
+
+与 analysis 中的逐行实现结果完全一致（包括标签的首次出现顺序和视图中行的顺序），
+app.config['ANALYSIS_BACKEND'] = 'numpy' 时使用：
+- 每列先转换为「每行的编码 + 字典」：字典编码列直接使用编码数组，每个不同的值只判断一次
+- 普通列（directives、imageUrls、userContent）转换为对象数组，用 ufunc 判断空白和是否在需去除的数据中
+- 各项过滤为布尔掩码，统计为按平台的 bincount，使用人数和标签数量按 (平台, 编码) 分组计数（np.unique）
+- 设备预聚合（compute_device_rollup）的部分统计量为按 (平台, 设备) 的 bincount，标签按 (平台, 设备, 标签) 分组计数
+没有安装 numpy 时 available() 为 False，由调用方使用逐行实现。
+"""
+from array import array
+
+from analysis import (StatsAccumulator, LabelAccumulator, DeviceRollup, collect_function_contents, _is_blank,
+                      _is_function_question, DIRECTIVES_MISSING, DIRECTIVES_EMPTY, DIRECTIVES_PRESENT,
+                      ROLLUP_FIELDS, ROLLUP_ROWS, ROLLUP_DIRECTIVES, ROLLUP_HELPFUL, ROLLUP_UNHELPFUL,
+                      ROLLUP_IMAGE_WITHOUT_TEXT, ROLLUP_NO_DIRECTIVES)
+from columnar import DictColumn, TableView
+
+# 与 TableView 的行号数组（array('l')）相同宽度的整数
+_INDEX_DTYPE = f"i{array('l').itemsize}"
+
+
+def available():
+    """是否安装了 numpy"""
+    try:
+        import numpy  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _view(table, indices):
+    rows = array('l')
+    rows.frombytes(indices.astype(_INDEX_DTYPE, copy=False).tobytes())
+    return TableView(table, rows)
+
+
+def _view_indices(np, table, view):
+    """要统计的行号数组，默认为整个表"""
+    if view is None:
+        return np.arange(table.nrows, dtype=_INDEX_DTYPE)
+    indices = view.indices
+    if isinstance(indices, range):
+        return np.arange(indices.start, indices.stop, indices.step, dtype=_INDEX_DTYPE)
+    if isinstance(indices, array):
+        return np.frombuffer(indices, dtype=f'i{indices.itemsize}').astype(_INDEX_DTYPE)
+    return np.fromiter(indices, dtype=_INDEX_DTYPE, count=len(indices))
+
+
+def _encode(np, table, name, indices):
+    """
+    列在 indices 行的 (编码数组, 字典)，列缺失时所有行为 None
+
+    字典编码列直接使用编码；普通列逐行编码（只用于字典编码以外配置的列）。
+    """
+    column = table.column(name)
+    if column is None:
+        return np.zeros(len(indices), dtype=np.intp), [None]
+    if isinstance(column, DictColumn):
+        return np.array(column.codes, dtype=np.intc)[indices], column.dictionary
+    # 与 DictColumn 相同，以 (类型, 值) 为键
+    index = {}
+    values = column.values
+    codes = np.fromiter((index.setdefault((type(values[i]), values[i]), len(index)) for i in indices.tolist()),
+                        dtype=np.intp, count=len(indices))
+    return codes, [value for _, value in index]
+
+
+def _lookup(np, encoded, transform, dtype=bool):
+    """每个不同的值调用一次 transform，按编码取出每行的结果"""
+    codes, dictionary = encoded
+    return np.array([transform(value) for value in dictionary], dtype=dtype)[codes]
+
+
+def _merge_equal(np, encoded, transform=None):
+    """
+    把相等的值（或 transform 后相等的值）合并为同一个编码，与以这些值为字典键时相同
+
+    例如 1 和 1.0 在 DictColumn 中是不同的编码，在 DeviceRollup 中是同一个设备。
+    """
+    codes, dictionary = encoded
+    index = {}
+    remap = [index.setdefault(value if transform is None else transform(value), len(index)) for value in dictionary]
+    return np.array(remap, dtype=np.intp)[codes], list(index)
+
+
+def _text_flags(np, table, name, indices, filter_user_contents=None):
+    """
+    文本列在 indices 行的 (缺失, 空白, 在需去除的数据中) 布尔数组
+
+    判断方式与逐行实现相同：空白为 str(value).strip() == ''，需去除的数据按 str(value) 匹配，缺失的单元格都为 False。
+    """
+    column = table.column(name)
+    if column is None or isinstance(column, DictColumn):
+        encoded = _encode(np, table, name, indices)
+        missing = _lookup(np, encoded, lambda value: value is None)
+        blank = _lookup(np, encoded, lambda value: value is not None and _is_blank(value))
+        if filter_user_contents is None:
+            return missing, blank, np.zeros(len(indices), dtype=bool)
+        excluded = _lookup(np, encoded, lambda value: value is not None and str(value) in filter_user_contents)
+        return missing, blank, excluded
+
+    # 对象数组上的 ufunc 直接调用内置方法，不经过 Python 函数
+    cells = np.fromiter(column.values, dtype=object, count=len(column.values))[indices]
+    types = np.frompyfunc(type, 1, 1)(cells)
+    missing = types == type(None)
+    # 数字、日期等非字符串的单元格先转换为字符串
+    other = ~(missing | (types == str))
+    if other.any():
+        cells[other] = [str(value) for value in cells[other]]
+    cells[missing] = ''
+    blank = (np.frompyfunc(str.strip, 1, 1)(cells) == '') & ~missing
+    if filter_user_contents is None:
+        return missing, blank, np.zeros(len(indices), dtype=bool)
+    excluded = np.frompyfunc(filter_user_contents.__contains__, 1, 1)(cells).astype(bool) & ~missing
+    return missing, blank, excluded
+
+
+def _select_platforms(np, table, view, pkg_names):
+    """pkgName 在 pkg_names 中的行：返回 (行号数组, 每行的平台下标)"""
+    indices = _view_indices(np, table, view)
+    slots = {pkg_name: k for k, pkg_name in enumerate(pkg_names)}
+    slot = _lookup(np, _encode(np, table, 'pkgName', indices), lambda value: slots.get(value, -1), np.intp)
+    selected = slot >= 0
+    return indices[selected], slot[selected]
+
+
+def _row_flags(np, table, indices, filter_user_contents):
+    """去除需去除的数据后保留的行、有图片无文字的行和 userContent 为空白的行"""
+    _, content_blank, content_excluded = _text_flags(np, table, 'userContent', indices, filter_user_contents)
+    image_missing, image_blank, _ = _text_flags(np, table, 'imageUrls', indices)
+    image_without_text = ~image_missing & ~image_blank & content_blank
+    return ~content_excluded, image_without_text
+
+
+def _device_filter(np, devices, excluded_devices):
+    """不在需要去除的设备中的行（没有需要去除的设备时为所有行）"""
+    if not excluded_devices:
+        return np.ones(len(devices[0]), dtype=bool)
+    return _lookup(np, devices, lambda value: value is not None and value not in excluded_devices)
+
+
+def compute_analyze_accumulators(table, pkg_names, device_id_list, filter_user_contents=None, view=None,
+                                 approximate=False):
+    """与 analysis.compute_analyze_accumulators 相同，返回 ({pkg_name: (initial, user)}, 用户数据视图)"""
+    import numpy as np
+
+    pkg_names = list(dict.fromkeys(pkg_names))
+    count = len(pkg_names)
+    indices, slot = _select_platforms(np, table, view, pkg_names)
+
+    keep, image_without_text = _row_flags(np, table, indices, filter_user_contents)
+    devices = _encode(np, table, 'deviceId', indices)
+    in_user = _device_filter(np, devices, frozenset(device_id_list))
+    directives_missing, directives_blank, _ = _text_flags(np, table, 'directives', indices)
+    directives = np.where(directives_missing, DIRECTIVES_MISSING,
+                          np.where(directives_blank, DIRECTIVES_EMPTY, DIRECTIVES_PRESENT))
+    avail = _encode(np, table, 'avail', indices)
+    helpful = _lookup(np, avail, lambda value: value == '有帮助')
+    unhelpful = _lookup(np, avail, lambda value: value == '无帮助')
+    has_device = _lookup(np, devices, bool)
+
+    def sums(mask):
+        return np.bincount(slot[mask], minlength=count).tolist()
+
+    def fill(accumulators, rows, extra):
+        rows_count, directives_count = sums(rows), sums(rows & (directives == DIRECTIVES_PRESENT))
+        helpful_count, unhelpful_count, extra_count = sums(rows & helpful), sums(rows & unhelpful), sums(extra)
+        # 每个平台的不同设备：按 (平台, 编码) 标记出现过的设备
+        counted = rows & has_device
+        dictionary = devices[1]
+        seen = np.zeros(count * len(dictionary), dtype=bool)
+        seen[slot[counted] * len(dictionary) + devices[0][counted]] = True
+        device_slots, device_codes = np.divmod(np.flatnonzero(seen), len(dictionary))
+        for k, accumulator in enumerate(accumulators):
+            accumulator.rows = rows_count[k]
+            accumulator.directives_count = directives_count[k]
+            accumulator.helpful_count = helpful_count[k]
+            accumulator.unhelpful_count = unhelpful_count[k]
+            accumulator.extra_count = extra_count[k]
+        for k, code in zip(device_slots.tolist(), device_codes.tolist()):
+            accumulators[k].device_ids.add(dictionary[code])
+
+    initial_rows = keep & ~image_without_text
+    user = keep & in_user
+    user_rows = user & ~image_without_text
+    initial_accumulators = [StatsAccumulator(approximate) for _ in pkg_names]
+    user_accumulators = [StatsAccumulator(approximate) for _ in pkg_names]
+    fill(initial_accumulators, initial_rows, keep & image_without_text)
+    fill(user_accumulators, user_rows, user & (directives == DIRECTIVES_EMPTY))
+
+    accumulators = {pkg_name: (initial_accumulators[k], user_accumulators[k]) for k, pkg_name in enumerate(pkg_names)}
+    return accumulators, _view(table, indices[user_rows])
+
+
+def compute_label_counts(table, pkg_names, device_id_list, filter_user_contents=None, view=None):
+    """与 analysis.compute_label_counts 相同，返回 (counts_by_pkg, filtered_by_pkg, filtered_data)"""
+    import numpy as np
+
+    pkg_names = list(dict.fromkeys(pkg_names))
+    indices, slot = _select_platforms(np, table, view, pkg_names)
+
+    keep, image_without_text = _row_flags(np, table, indices, filter_user_contents)
+    devices = _encode(np, table, 'deviceId', indices)
+    filtered = keep & ~image_without_text & _device_filter(np, devices, frozenset(device_id_list))
+
+    # 每个 (平台, 问题编码) 的数量和首次出现的位置，不同编码的值转换为字符串后相同时合并
+    question_codes, dictionary = _encode(np, table, 'question', indices)
+    labels = [str(value) if value else None for value in dictionary]
+    has_label = np.array([label is not None for label in labels], dtype=bool)[question_codes] & filtered
+    positions = np.flatnonzero(has_label)
+    keys = slot[positions].astype(np.int64) * len(dictionary) + question_codes[positions]
+    keys, firsts, counts = np.unique(keys, return_index=True, return_counts=True)
+    order = np.argsort(firsts, kind='stable')
+
+    counts_by_pkg = {pkg_name: {} for pkg_name in pkg_names}
+    for key, label_count in zip(keys[order].tolist(), counts[order].tolist()):
+        k, code = divmod(key, len(dictionary))
+        question_counts = counts_by_pkg[pkg_names[k]]
+        label = labels[code]
+        question_counts[label] = question_counts.get(label, 0) + label_count
+
+    filtered_by_pkg = {pkg_name: _view(table, indices[filtered & (slot == k)]) for k, pkg_name in enumerate(pkg_names)}
+    return counts_by_pkg, filtered_by_pkg, _view(table, indices[filtered])
+
+
+def compute_label_accumulators(table, pkg_names, device_id_list, filter_user_contents=None, view=None):
+    """与 analysis.compute_label_accumulators 相同，返回 ({pkg_name: LabelAccumulator}, 所有平台过滤后的行视图)"""
+    counts_by_pkg, filtered_by_pkg, filtered_data = compute_label_counts(
+        table, pkg_names, device_id_list, filter_user_contents, view)
+    accumulators = {pkg_name: LabelAccumulator(counts_by_pkg[pkg_name],
+                                               collect_function_contents(filtered_by_pkg[pkg_name]))
+                    for pkg_name in pkg_names}
+    return accumulators, filtered_data
+
+
+def compute_device_rollup(table, pkg_names, device_id_list, filter_user_contents=None, view=None, selected=None,
+                          stats=True, labels=True):
+    """
+    与 analysis.compute_device_rollup 相同，返回 (DeviceRollup, 视图)
+
+    部分统计量为按 (平台, 设备) 分组的 bincount，标签为按 (平台, 设备, 标签) 分组计数（np.unique），
+    只有每个设备需要 Python 代码写入 DeviceRollup。
+    """
+    import numpy as np
+
+    pkg_names = list(dict.fromkeys(pkg_names))
+    rollup = DeviceRollup(pkg_names)
+    rollup.span = table.nrows
+    selected = frozenset(selected if selected is not None else pkg_names)
+    indices, slot = _select_platforms(np, table, view, pkg_names)
+
+    keep, image_without_text = _row_flags(np, table, indices, filter_user_contents)
+    normal = keep & ~image_without_text
+    device_codes, devices = _merge_equal(np, _encode(np, table, 'deviceId', indices))
+    pairs = slot.astype(np.int64) * len(devices) + device_codes
+
+    if stats:
+        directives_missing, directives_blank, _ = _text_flags(np, table, 'directives', indices)
+        directives_present = ~directives_missing & ~directives_blank
+        avail = _encode(np, table, 'avail', indices)
+        helpful = _lookup(np, avail, lambda value: value == '有帮助')
+        unhelpful = _lookup(np, avail, lambda value: value == '无帮助')
+
+        masks = [None] * ROLLUP_FIELDS
+        masks[ROLLUP_ROWS] = normal
+        masks[ROLLUP_DIRECTIVES] = normal & directives_present
+        masks[ROLLUP_HELPFUL] = normal & helpful
+        masks[ROLLUP_UNHELPFUL] = normal & unhelpful
+        masks[ROLLUP_IMAGE_WITHOUT_TEXT] = keep & image_without_text
+        masks[ROLLUP_NO_DIRECTIVES] = keep & directives_blank
+        # 没有剔除的行中出现过的 (平台, 设备)，按编号计数
+        keys, inverse = np.unique(pairs[keep], return_inverse=True)
+        fields = np.stack([np.bincount(inverse[mask[keep]], minlength=len(keys)) for mask in masks], axis=1)
+        key_slots, key_devices = np.divmod(keys, len(devices))
+        for k, code, partial in zip(key_slots.tolist(), key_devices.tolist(), fields.tolist()):
+            rollup.partials[pkg_names[k]][devices[code]] = partial
+        totals = np.zeros((len(pkg_names), ROLLUP_FIELDS), dtype=np.int64)
+        np.add.at(totals, key_slots, fields)
+        has_device = np.array([bool(device_id) for device_id in devices], dtype=bool)[key_devices]
+        device_counts = np.bincount(key_slots[has_device & (fields[:, ROLLUP_ROWS] > 0)], minlength=len(pkg_names))
+        for k, pkg_name in enumerate(pkg_names):
+            rollup.totals[pkg_name] = totals[k].tolist()
+            rollup.device_counts[pkg_name] = int(device_counts[k])
+
+    if labels:
+        question_codes, questions = _merge_equal(np, _encode(np, table, 'question', indices),
+                                                 lambda value: str(value) if value else None)
+        labeled = np.array([label is not None for label in questions], dtype=bool)[question_codes] & normal
+        positions = np.flatnonzero(labeled)
+        rows = indices[positions]
+
+        def take(values, codes):
+            return map(values.__getitem__, codes.tolist())
+
+        # 每个 (平台, 设备, 标签) 的数量和首次出现的行号
+        keys = pairs[positions] * len(questions) + question_codes[positions]
+        keys, firsts, counts = np.unique(keys, return_index=True, return_counts=True)
+        key_pairs, key_labels = np.divmod(keys, len(questions))
+        key_slots, key_devices = np.divmod(key_pairs, len(devices))
+        label_keys = list(zip(take(pkg_names, key_slots), take(devices, key_devices), take(questions, key_labels)))
+        rollup.label_counts = dict(zip(label_keys, counts.tolist()))
+        rollup.label_firsts = dict(zip(label_keys, rows[firsts].tolist()))
+
+        # 每个 (平台, 标签) 的数量和首次出现的行、设备，按首次出现的顺序
+        keys = slot[positions].astype(np.int64) * len(questions) + question_codes[positions]
+        keys, firsts, counts = np.unique(keys, return_index=True, return_counts=True)
+        order = np.argsort(firsts, kind='stable')
+        keys, firsts, counts = keys[order], firsts[order], counts[order]
+        key_slots, key_labels = np.divmod(keys, len(questions))
+        pkg_labels = list(zip(take(pkg_names, key_slots), take(questions, key_labels)))
+        rollup.label_heads = dict(zip(pkg_labels, zip(rows[firsts].tolist(),
+                                                      take(devices, device_codes[positions[firsts]]))))
+        for (pkg_name, label), total in zip(pkg_labels, counts.tolist()):
+            rollup.label_totals[pkg_name][label] = total
+
+        function_labels = np.array([label is not None and _is_function_question(label) for label in questions],
+                                   dtype=bool)[question_codes] & labeled
+        if function_labels.any():
+            function_rows = zip(take(pkg_names, slot[function_labels]), take(devices, device_codes[function_labels]),
+                                _view(table, indices[function_labels]).values('userContent'))
+            for pkg_name, device_id, user_content in function_rows:
+                if user_content:
+                    rollup.function_rows[pkg_name].append((device_id, user_content))
+
+    in_selected = np.array([pkg_name in selected for pkg_name in pkg_names], dtype=bool)[slot]
+    kept = normal & in_selected & _device_filter(np, (device_codes, devices), frozenset(device_id_list))
+    return rollup, _view(table, indices[kept])
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+工作簿解析结果缓存
+
+按上传文件内容的 SHA-256 作为键，将解析结果（列式表）以 pickle 二进制形式
+保存在磁盘上。相同内容的文件再次上传时直接读取缓存，跳过 openpyxl/xlrd 解析。
+缓存文件写入时先写临时文件再原子替换，多个 gunicorn worker 可以安全共享同一目录。
+"""
+import hashlib
+import os
+import pickle
+import tempfile
+from pathlib import Path
+
+# 缓存格式版本，解析结果结构变化时递增，旧缓存自动失效
+CACHE_FORMAT_VERSION = 2
+
+# 计算哈希时每次读取的块大小
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_sha256(source):
+    """计算文件内容的 SHA-256，source 为文件路径或可 seek 的二进制流（读取后回到开头）"""
+    digest = hashlib.sha256()
+    if hasattr(source, 'read'):
+        source.seek(0)
+        for chunk in iter(lambda: source.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+        source.seek(0)
+        return digest.hexdigest()
+    with open(source, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class WorkbookCache:
+    """基于内容哈希的磁盘缓存，超出容量上限时按最近访问时间（LRU）淘汰"""
+
+    def __init__(self, folder, max_bytes):
+        self.folder = Path(folder)
+        self.max_bytes = max_bytes
+        self.folder.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key):
+        return self.folder / f"v{CACHE_FORMAT_VERSION}_{key}.bin"
+
+    def get(self, key):
+        """读取缓存，未命中返回 None"""
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            # 缓存文件损坏（例如写入时进程被终止），删除后按未命中处理
+            try:
+                path.unlink()
+            except OSError:
+                pass
+            return None
+
+        # 更新修改时间，作为 LRU 的访问时间
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return value
+
+    def put(self, key, value):
+        """写入缓存，并在超出容量时淘汰最久未使用的条目"""
+        fd, tmp_path = tempfile.mkstemp(dir=self.folder, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self._path(key))
+        except Exception:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        self.evict()
+
+    def evict(self):
+        """删除最久未使用的缓存文件，直到总大小不超过上限"""
+        entries = []
+        total = 0
+        for path in self.folder.glob('*.bin'):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+        entries.sort(key=lambda entry: entry[0])
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                path.unlink()
+                total -= size
+            except OSError:
+                pass
+
+    def load_or_parse(self, filepath, parser, variant=''):
+        """
+        按文件内容哈希读取缓存，未命中时调用 parser(filepath) 解析并写入缓存
+
+        filepath 也可以是可 seek 的二进制流（例如内存中的上传文件）。
+        同一文件的不同解析方式（例如不同的列投影）用 variant 区分。
+        """
+        key = file_sha256(filepath)
+        if variant:
+            key += '_' + hashlib.sha256(variant.encode('utf-8')).hexdigest()[:16]
+        value = self.get(key)
+        if value is None:
+            value = parser(filepath)
+            try:
+                self.put(key, value)
+            except OSError:
+                pass  # 缓存写入失败不影响本次请求
+        return value
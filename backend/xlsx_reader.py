@@ -0,0 +1,418 @@
+# -*- coding: utf-8 -*-
+"""
+轻量的流式 XLSX 读取
+
+openpyxl 只读模式仍然为每个单元格构造字典、解析坐标和样式，而读取数据只需要单元格的值。
+XlsxReader 直接读取压缩包中的活动工作表和共享字符串表，用 expat 增量解析，逐行返回值元组，
+结果与 openpyxl 只读模式的 ws.iter_rows(values_only=True) 一致：
+- 工作簿结构（活动工作表、1904 日期系统）和样式表较小，仍用 openpyxl 的解析类读取
+- 日期格式的判断和日期换算使用 openpyxl 的函数
+遇到公式、带命名空间前缀等不常见的格式时抛出 UnsupportedWorkbook，调用方改用 openpyxl 读取。
+"""
+import zipfile
+from xml.parsers import expat
+
+from openpyxl.packaging.manifest import Manifest
+from openpyxl.packaging.relationship import get_dependents, get_rels_path
+from openpyxl.packaging.workbook import WorkbookPackage
+from openpyxl.styles.stylesheet import Stylesheet
+from openpyxl.utils.cell import coordinate_to_tuple, range_boundaries
+from openpyxl.utils.datetime import CALENDAR_MAC_1904, CALENDAR_WINDOWS_1900, from_excel, from_ISO8601
+from openpyxl.utils.exceptions import CellCoordinatesException
+from openpyxl.xml.constants import (
+    ARC_CONTENT_TYPES, ARC_STYLE, ARC_WORKBOOK, SHARED_STRINGS, SHEET_MAIN_NS,
+    XLSM, XLSX, XLTM, XLTX,
+)
+from openpyxl.xml.functions import fromstring
+
+# 每次交给 expat 的字节数
+READ_SIZE = 256 * 1024
+
+# 读取工作表尺寸信息时每次读取的字节数
+DIMENSION_READ_SIZE = 16 * 1024
+
+# 列字母到列号的缓存，如 'AB' -> 28
+_column_cache = {}
+
+# 单个字母的列号，常见的 A1 ~ Z99999 坐标直接查表
+_SINGLE_COLUMNS = {chr(ord('A') + i): i + 1 for i in range(26)}
+
+
+class UnsupportedWorkbook(Exception):
+    """工作簿格式不适合快速读取，调用方应改用 openpyxl"""
+
+
+class _Stop(Exception):
+    """提前结束 expat 解析"""
+
+
+def _column_index(ref):
+    letters = ref.rstrip('0123456789')
+    index = _column_cache.get(letters)
+    if index is None or len(letters) == len(ref):
+        index = coordinate_to_tuple(ref)[1]
+        _column_cache[letters] = index
+    return index
+
+
+def _row_index(value):
+    """与 openpyxl 相同，行号可以写成整数形式的小数"""
+    try:
+        return int(value)
+    except ValueError:
+        number = float(value)
+        if not number.is_integer():
+            raise ValueError(f"{value} is not a valid row number")
+        return int(number)
+
+
+def _find_workbook_part(manifest):
+    for content_type in (XLTM, XLTX, XLSM, XLSX):
+        part = manifest.find(content_type)
+        if part:
+            return part.PartName[1:]
+    # 有些程序把工作簿登记为 application/xml 的默认类型
+    defaults = {p.ContentType for p in manifest.Default}
+    if defaults & {XLTM, XLTX, XLSM, XLSX}:
+        return ARC_WORKBOOK
+    raise UnsupportedWorkbook('找不到工作簿')
+
+
+def read_shared_strings(source):
+    """读取共享字符串表，与 openpyxl 相同只取 <t> 和 <r><t> 的文本，不含注音"""
+    strings = []
+    text = []
+    runs = []
+    plain = run_text = None
+    capture = in_run = in_phonetic = False
+
+    def start(name, attrs):
+        nonlocal plain, run_text, capture, in_run, in_phonetic
+        if name == 't':
+            if not in_phonetic:
+                capture = True
+                del text[:]
+        elif name == 'si':
+            plain = None
+            del runs[:]
+        elif name == 'r':
+            in_run = True
+            run_text = None
+        elif name == 'rPh':
+            in_phonetic = True
+        elif ':' in name:
+            raise UnsupportedWorkbook(f'不支持的元素: {name}')
+
+    def end(name):
+        nonlocal plain, run_text, capture, in_run, in_phonetic
+        if name == 't':
+            if capture:
+                capture = False
+                if in_run:
+                    run_text = ''.join(text)
+                else:
+                    plain = ''.join(text)
+        elif name == 'si':
+            strings.append(((plain or '') + ''.join(runs)).replace('x005F_', ''))
+        elif name == 'r':
+            in_run = False
+            if run_text is not None:
+                runs.append(run_text)
+        elif name == 'rPh':
+            in_phonetic = False
+
+    def data(value):
+        if capture:
+            text.append(value)
+
+    parser = expat.ParserCreate()
+    parser.buffer_text = True
+    parser.StartElementHandler = start
+    parser.EndElementHandler = end
+    parser.CharacterDataHandler = data
+    parser.ParseFile(source)
+    return strings
+
+
+def decode_rows(chunks, shared_strings, date_styles, epoch, max_col=None):
+    """
+    增量解析工作表 XML，逐行返回 (行号, 行值元组)
+
+    chunks 为工作表 XML 的字节块，可以只包含 <sheetData> 的一部分；没有 r 属性的行行号为 None，
+    由 assemble_rows 按前一行确定。max_col 不为 None 时每行补齐到 max_col 列，否则取到最后一个单元格。
+    """
+    rows = []
+    text = []
+    cells = []
+    runs = []
+    row_idx = None
+    column = 0
+    cell_type = cell_style = value = inline = run_text = None
+    capture = has_value = in_data = in_inline = in_run = in_phonetic = done = False
+
+    def start(name, attrs):
+        nonlocal row_idx, column, cell_type, cell_style, value, inline, run_text
+        nonlocal capture, has_value, in_data, in_inline, in_run, in_phonetic
+        if name == 'c':
+            ref = attrs.get('r')
+            if ref:
+                column = (ref[1] < 'A' and _SINGLE_COLUMNS.get(ref[0])) or _column_index(ref)
+            else:
+                column += 1
+            cell_type = attrs.get('t', 'n')
+            cell_style = attrs.get('s')
+            value = inline = None
+            has_value = False
+        elif name == 'v':
+            if not has_value:
+                capture = True
+                del text[:]
+        elif name == 'row':
+            ref = attrs.get('r')
+            row_idx = None if ref is None else _row_index(ref)
+            column = 0
+            del cells[:]
+        elif name == 'is':
+            in_inline = True
+            inline = None
+            del runs[:]
+        elif name == 't':
+            if in_inline and not in_phonetic:
+                capture = True
+                del text[:]
+        elif name == 'r':
+            in_run = True
+            run_text = None
+        elif name == 'rPh':
+            in_phonetic = True
+        elif name == 'sheetData':
+            in_data = True
+        elif in_data and (name == 'f' or ':' in name):
+            raise UnsupportedWorkbook(f'不支持的元素: {name}')
+
+    def end(name):
+        nonlocal value, inline, run_text, capture, has_value, in_data, in_inline, in_run, in_phonetic, done
+        if name == 'c':
+            if max_col is not None and column > max_col:
+                return
+            if cell_type == 'inlineStr':
+                value = inline
+            elif value is not None:
+                if cell_type == 'n':
+                    if '.' in value or 'E' in value or 'e' in value:
+                        value = float(value)
+                    else:
+                        value = int(value)
+                    if date_styles:
+                        # 没有 s 属性时为 0 号样式
+                        style_id = 0 if cell_style is None else (int(cell_style) if cell_style else None)
+                        if style_id in date_styles:
+                            try:
+                                value = from_excel(value, epoch)
+                            except (OverflowError, ValueError):
+                                value = '#VALUE!'
+                elif cell_type == 's':
+                    value = shared_strings[int(value)]
+                elif cell_type == 'b':
+                    value = bool(int(value))
+                elif cell_type == 'd':
+                    value = from_ISO8601(value)
+            cells.append((column, value))
+        elif name == 'v':
+            if capture:
+                capture = False
+                has_value = True
+                value = ''.join(text) or None
+        elif name == 'row':
+            width = max_col or (cells[-1][0] if cells else 0)
+            if not width:
+                rows.append((row_idx, ()))
+                return
+            values = [None] * width
+            for cell_column, cell_value in cells:
+                if cell_column <= width:
+                    values[cell_column - 1] = cell_value
+            rows.append((row_idx, tuple(values)))
+        elif name == 't':
+            if capture:
+                capture = False
+                if in_run:
+                    run_text = ''.join(text)
+                else:
+                    inline = ''.join(text)
+        elif name == 'r':
+            in_run = False
+            if run_text is not None:
+                runs.append(run_text)
+        elif name == 'is':
+            in_inline = False
+            inline = (inline or '') + ''.join(runs)
+        elif name == 'rPh':
+            in_phonetic = False
+        elif name == 'sheetData':
+            # 之后的扩展信息不需要解析
+            in_data = False
+            done = True
+
+    def data(value):
+        if capture:
+            text.append(value)
+
+    parser = expat.ParserCreate()
+    parser.buffer_text = True
+    parser.StartElementHandler = start
+    parser.EndElementHandler = end
+    parser.CharacterDataHandler = data
+    try:
+        for chunk in chunks:
+            parser.Parse(chunk, False)
+            if rows:
+                yield from rows
+                del rows[:]
+            if done:
+                return
+        parser.Parse(b'', True)
+        yield from rows
+    except (ValueError, IndexError, TypeError, OverflowError, CellCoordinatesException, expat.ExpatError) as e:
+        # 单元格内容不合法时由 openpyxl 处理（通常同样会报错）
+        raise UnsupportedWorkbook(str(e)) from e
+
+
+def assemble_rows(parsed_rows, min_row, max_col, max_row):
+    """与 openpyxl ReadOnlyWorksheet._cells_by_row(values_only=True) 相同：跳过 min_row 之前的行，补齐缺失的行"""
+    empty_row = []
+    if max_col is not None:
+        empty_row = (None,) * max_col
+
+    counter = min_row
+    idx = 1
+    previous = 0
+    for row_idx, row in parsed_rows:
+        idx = previous + 1 if row_idx is None else row_idx
+        previous = idx
+        if max_row is not None and idx > max_row:
+            break
+
+        # 中间缺失的行
+        for _ in range(counter, idx):
+            counter += 1
+            yield empty_row
+
+        if counter <= idx:
+            counter += 1
+            yield row
+
+    if max_row is not None and max_row < idx:
+        for _ in range(counter, max_row + 1):
+            yield empty_row
+
+
+class XlsxReader:
+    """
+    读取 .xlsx 文件的活动工作表
+
+    max_row、max_column 为工作表尺寸信息中的行数和列数，没有尺寸信息时为 None。
+    """
+
+    def __init__(self, filepath):
+        try:
+            self.archive = zipfile.ZipFile(filepath)
+        except (OSError, zipfile.BadZipFile) as e:
+            raise UnsupportedWorkbook(str(e)) from e
+        try:
+            self._load()
+        except UnsupportedWorkbook:
+            self.archive.close()
+            raise
+        except Exception as e:
+            # 结构异常的工作簿交给 openpyxl 处理和报错
+            self.archive.close()
+            raise UnsupportedWorkbook(str(e)) from e
+
+    def _load(self):
+        manifest = Manifest.from_tree(fromstring(self.archive.read(ARC_CONTENT_TYPES)))
+        workbook_path = _find_workbook_part(manifest)
+        package = WorkbookPackage.from_tree(fromstring(self.archive.read(workbook_path)))
+        self.epoch = CALENDAR_MAC_1904 if package.properties.date1904 else CALENDAR_WINDOWS_1900
+
+        # 与 openpyxl 相同，跳过没有 id 或文件不存在的工作表后按 activeTab 取活动工作表
+        rels = get_dependents(self.archive, get_rels_path(workbook_path))
+        files = set(self.archive.namelist())
+        sheets = [rels[sheet.id] for sheet in package.sheets if sheet.id]
+        sheets = [rel for rel in sheets if rel.target in files]
+        if not 0 <= package.active < len(sheets) or 'chartsheet' in sheets[package.active].Type:
+            raise UnsupportedWorkbook('活动工作表不是数据表')
+        self.sheet_path = sheets[package.active].target
+
+        self.shared_strings = []
+        part = manifest.find(SHARED_STRINGS)
+        if part is not None:
+            with self.archive.open(part.PartName[1:]) as source:
+                self.shared_strings = read_shared_strings(source)
+
+        self.date_styles = set()
+        if ARC_STYLE in files:
+            stylesheet = Stylesheet.from_tree(fromstring(self.archive.read(ARC_STYLE)))
+            if stylesheet.cell_styles:
+                self.date_styles = stylesheet.date_formats
+
+        self.max_row = self.max_column = None
+        dimensions = self._read_dimensions()
+        if dimensions is not None:
+            _, _, self.max_column, self.max_row = range_boundaries(dimensions)
+
+    def _read_dimensions(self):
+        """读取 <sheetData> 之前的尺寸信息（dimension 的 ref），同时检查工作表的命名空间"""
+        dimension = []
+        in_root = False
+
+        def start(name, attrs):
+            nonlocal in_root
+            if not in_root:
+                # 带前缀或其他命名空间的工作表交给 openpyxl
+                if name != 'worksheet' or attrs.get('xmlns') != SHEET_MAIN_NS:
+                    raise UnsupportedWorkbook('不支持的工作表命名空间')
+                in_root = True
+            elif name == 'dimension':
+                dimension.append(attrs.get('ref'))
+                raise _Stop()
+            elif name == 'sheetData':
+                raise _Stop()
+
+        parser = expat.ParserCreate()
+        parser.StartElementHandler = start
+        with self.archive.open(self.sheet_path) as source:
+            try:
+                while True:
+                    chunk = source.read(DIMENSION_READ_SIZE)
+                    parser.Parse(chunk, not chunk)
+                    if not chunk:
+                        break
+            except _Stop:
+                pass
+        return dimension[0] if dimension else None
+
+    def _iter_chunks(self):
+        with self.archive.open(self.sheet_path) as source:
+            while True:
+                chunk = source.read(READ_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+
+    def iter_rows(self, min_row=None, max_row=None, max_col=None, values_only=True):
+        """与 openpyxl 只读工作表的 iter_rows(values_only=True) 相同，只支持返回值"""
+        min_row = min_row or 1
+        max_col = max_col or self.max_column
+        max_row = max_row or self.max_row
+        parsed_rows = decode_rows(self._iter_chunks(), self.shared_strings, self.date_styles, self.epoch, max_col)
+        return assemble_rows(parsed_rows, min_row, max_col, max_row)
+
+    def close(self):
+        self.archive.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
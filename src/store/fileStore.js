@@ -5,6 +5,10 @@ export const selectedFile = ref(null)
 export const filterFile = ref(null)
 export const fileName = ref('')
 export const filterFileName = ref('')
+// 服务器端保存的过滤集 ID，过滤文件未变化时直接引用，不再重复上传
+export const filterSetId = ref('')
+// 最近一次加载的数据集 ID，SQL 查询页据此查询刚加载的数据
+export const datasetId = ref('')
 
 // 重置所有文件状态
 export const resetFiles = () => {
@@ -12,6 +16,7 @@ export const resetFiles = () => {
   filterFile.value = null
   fileName.value = ''
   filterFileName.value = ''
+  filterSetId.value = ''
 }
 
 // 更新主文件
@@ -19,9 +24,20 @@ export const updateSelectedFile = (file) => {
   selectedFile.value = file
 }
 
-// 更新过滤文件
+// 更新过滤文件（过滤文件变化后需要重新上传）
 export const updateFilterFile = (file) => {
   filterFile.value = file
+  filterSetId.value = ''
+}
+
+// 更新过滤集 ID
+export const updateFilterSetId = (id) => {
+  filterSetId.value = id || ''
+}
+
+// 更新数据集 ID
+export const updateDatasetId = (id) => {
+  datasetId.value = id || ''
 }
 
 // 更新主文件名
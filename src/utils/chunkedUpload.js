@@ -0,0 +1,85 @@
+import api from '@/utils/request'
+
+// 超过该大小的文件分片上传（单个请求受 nginx 和后端 16MB 的限制）
+export const CHUNKED_UPLOAD_THRESHOLD = 8 * 1024 * 1024
+
+// 每个分片失败后的重试次数
+const CHUNK_RETRIES = 3
+
+// 同一文件的上传 ID 保存在 localStorage 中，刷新页面或连接中断后可以继续上传
+const resumeKey = (file) => `chunkedUpload:${file.name}:${file.size}:${file.lastModified}`
+
+// 分片的 SHA-256，crypto.subtle 只能在 https 或 localhost 页面中使用，不可用时不校验分片
+const chunkSha256 = async (blob) => {
+  if (!window.crypto?.subtle) {
+    return null
+  }
+  const digest = await window.crypto.subtle.digest('SHA-256', await blob.arrayBuffer())
+  return Array.from(new Uint8Array(digest), b => b.toString(16).padStart(2, '0')).join('')
+}
+
+// 继续之前没有完成的上传，上传不存在或已过期时返回 null
+const resumeUpload = async (file) => {
+  const uploadId = localStorage.getItem(resumeKey(file))
+  if (!uploadId) {
+    return null
+  }
+  try {
+    return await api.get(`/uploads/${uploadId}`, { silent: true })
+  } catch (error) {
+    localStorage.removeItem(resumeKey(file))
+    return null
+  }
+}
+
+const putChunk = async (uploadId, index, blob) => {
+  const sha256 = await chunkSha256(blob)
+  for (let attempt = 1; ; attempt++) {
+    try {
+      return await api.put(`/uploads/${uploadId}/chunks/${index}`, blob, {
+        headers: { 'Content-Type': 'application/octet-stream', ...(sha256 ? { 'X-Chunk-Sha256': sha256 } : {}) },
+        timeout: 300000,
+        silent: attempt < CHUNK_RETRIES
+      })
+    } catch (error) {
+      if (attempt >= CHUNK_RETRIES) {
+        throw error
+      }
+    }
+  }
+}
+
+// 分片上传文件，只上传服务器还没有收到的分片，完成后返回 uploadId；onProgress 参数为已上传的比例（0~1）
+export const uploadInChunks = async (file, onProgress) => {
+  let upload = await resumeUpload(file)
+  if (!upload) {
+    upload = await api.post('/uploads', { filename: file.name, size: file.size })
+    localStorage.setItem(resumeKey(file), upload.uploadId)
+  }
+
+  if (upload.status !== 'complete') {
+    const received = new Set(upload.received)
+    for (let index = 0; index < upload.chunkCount; index++) {
+      if (!received.has(index)) {
+        const start = index * upload.chunkSize
+        await putChunk(upload.uploadId, index, file.slice(start, start + upload.chunkSize))
+        received.add(index)
+      }
+      if (onProgress) {
+        onProgress(received.size / upload.chunkCount)
+      }
+    }
+    await api.post(`/uploads/${upload.uploadId}/complete`)
+  }
+  return upload.uploadId
+}
+
+// 把要分析的文件加入表单：小文件直接上传，大文件先分片上传，表单中只带 uploadId
+export const appendUpload = async (formData, field, file, onProgress) => {
+  if (file.size <= CHUNKED_UPLOAD_THRESHOLD) {
+    formData.append(field, file)
+    return
+  }
+  const idField = field === 'file' ? 'uploadId' : 'filterUploadId'
+  formData.append(idField, await uploadInChunks(file, onProgress))
+}
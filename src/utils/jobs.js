@@ -0,0 +1,39 @@
+import api from '@/utils/request'
+
+// 导入任务各阶段的说明
+const JOB_STAGES = {
+  queued: '排队中',
+  parsing: '正在解析文件',
+  filtering: '正在过滤数据',
+  analyzing: '正在统计',
+  loading: '正在加载数据集',
+  done: '已完成',
+  failed: '失败'
+}
+
+// 轮询任务状态的间隔（毫秒）
+const POLL_INTERVAL = 1000
+
+// 任务进度说明，例如「正在解析文件（已处理 20000 行）」
+export const describeJob = (job) => {
+  const stage = JOB_STAGES[job.stage] || job.stage
+  return job.rowsProcessed ? `${stage}（已处理 ${job.rowsProcessed} 行）` : stage
+}
+
+// 提交导入任务并轮询进度，完成后返回与同步接口相同的结果；任务失败时抛出错误
+export const runJob = async (path, formData, onProgress) => {
+  const { jobId } = await api.post(path, formData, {
+    headers: { 'Content-Type': 'multipart/form-data' }
+  })
+  for (;;) {
+    await new Promise(resolve => setTimeout(resolve, POLL_INTERVAL))
+    const job = await api.get(`/jobs/${jobId}`)
+    if (onProgress) {
+      onProgress(job)
+    }
+    if (job.status === 'done' || job.status === 'failed') {
+      break
+    }
+  }
+  return api.get(`/jobs/${jobId}/result`)
+}
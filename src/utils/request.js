@@ -6,9 +6,20 @@ const api = axios.create({
   timeout: 60000
 })
 
+// 会话 ID：区分不同用户在服务器上加载的数据集，保存在 localStorage 中
+const getSessionId = () => {
+  let sessionId = localStorage.getItem('sessionId')
+  if (!sessionId) {
+    sessionId = Math.random().toString(36).slice(2) + Date.now().toString(36)
+    localStorage.setItem('sessionId', sessionId)
+  }
+  return sessionId
+}
+
 // 请求拦截器
 api.interceptors.request.use(
   config => {
+    config.headers['X-Session-Id'] = getSessionId()
     return config
   },
   error => {
@@ -22,7 +33,10 @@ api.interceptors.response.use(
     return response.data
   },
   error => {
-    ElMessage.error(error.response?.data?.error || '请求失败')
+    // silent 为 true 的请求由调用方自行处理错误
+    if (!error.config?.silent) {
+      ElMessage.error(error.response?.data?.error || '请求失败')
+    }
     return Promise.reject(error)
   }
 )